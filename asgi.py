@@ -0,0 +1,173 @@
+"""ASGI entry point: the payment routes of app.py on an asyncio event loop.
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+
+Razorpay is called through one pooled httpx client and Gmail through pooled
+aiosmtplib sessions, so a checkout waiting on either holds no worker and one
+process serves many checkouts at once. Receipts are rendered on a small
+thread pool and stored under receipts/ as in app.py. The site's pages are
+not served here; use app.py or the static host for those.
+"""
+import os
+import sys
+# Add local site-packages to path for shared hosting
+sys.path.append(os.path.join(os.path.dirname(__file__), "site-packages"))
+
+import asyncio
+import contextlib
+import hmac
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+from iatac import config
+from iatac.config import error_status
+from iatac.payments import InvalidSignature
+from iatac.receipt_store import payment_id_from_filename
+
+# Orders, verification and every post-payment side effect (see iatac.config).
+# Behind a proxy, run uvicorn with --proxy-headers --forwarded-allow-ips=<proxy>
+# so the client IP is not the proxy's; otherwise every visitor shares one
+# per-IP rate limit bucket. The rate limits and contact digest use the same
+# files app.py does.
+payments = config.build_payments(config.ASYNC)
+metrics = payments.metrics
+outbox = payments.outbox
+sheet_writer = payments.sheet_writer
+receipt_store = payments.receipts.store
+
+async def sweep_outbox():
+    """Restart entries left over from a restart or a failed attempt"""
+    while True:
+        try:
+            await payments.resume()
+            await asyncio.to_thread(outbox.purge)
+        except Exception as e:
+            print(f"Outbox Sweep Error: {e}")
+        await asyncio.sleep(config.OUTBOX_SWEEP_INTERVAL)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    sweeper = asyncio.create_task(sweep_outbox())
+    yield
+    sweeper.cancel()
+    # Let in-flight emails and rows finish, then flush the rows they produced
+    await payments.dispatch.shutdown(config.JOB_DRAIN_TIMEOUT)
+    await payments.mailer.close()
+    await payments.get_client().aclose()
+    await asyncio.to_thread(sheet_writer.close)
+    payments.executor.shutdown(wait=False)
+
+async def create_order(request):
+    try:
+        order = await payments.create_order(await request.json(), request.headers.get('Idempotency-Key'),
+                                            request.client.host if request.client else None)
+        return JSONResponse(order)
+    except Exception as e:
+        status, headers = error_status(e)
+        return JSONResponse({"error": str(e)}, status_code=status, headers=headers)
+
+async def verify_payment(request):
+    try:
+        details = await payments.verify_payment(await request.json())
+        return JSONResponse({"status": "Success", "details": details})
+    except Exception as e:
+        print(f"Verify Error: {e}")
+        status, headers = error_status(e)
+        return JSONResponse({"status": "Error", "error": str(e)}, status_code=status, headers=headers)
+
+async def contact_submit(request):
+    try:
+        message = await payments.submit_contact(await request.json(),
+                                                request.client.host if request.client else None)
+        return JSONResponse({"status": "Success", "message": message})
+    except Exception as e:
+        status, headers = error_status(e)
+        if status == 500:
+            print(f"Contact Submit Error: {e}")
+        return JSONResponse({"status": "Error", "message": str(e)}, status_code=status, headers=headers)
+
+async def download_receipt(request):
+    payment_id = payment_id_from_filename(request.path_params['filename'])
+    found = await asyncio.to_thread(receipt_store.lookup, payment_id) if payment_id else None
+    if found is None:
+        return Response(status_code=404)
+    path, etag = found
+    # personal details, keep out of shared caches
+    headers = {'Cache-Control': f"private, max-age={config.RECEIPT_MAX_AGE}"}
+    if etag:
+        headers['ETag'] = f'"{etag}"'
+        if request.headers.get('if-none-match') == headers['ETag']:
+            return Response(status_code=304, headers=headers)
+    return FileResponse(path, filename=request.path_params['filename'], headers=headers)
+
+async def metrics_endpoint(request):
+    """Prometheus scrape target; needs Authorization: Bearer <METRICS_TOKEN>"""
+    if not config.METRICS_TOKEN:
+        return Response(status_code=404)
+    if not hmac.compare_digest(request.headers.get('authorization', ''), f"Bearer {config.METRICS_TOKEN}"):
+        return Response(status_code=401)
+    body = await asyncio.to_thread(metrics.render)  # reads the outbox backlog from SQLite
+    return PlainTextResponse(body, media_type='text/plain; version=0.0.4')
+
+async def razorpay_webhook(request):
+    """Confirms payments even when the browser never calls verify_payment"""
+    if not config.RAZORPAY_WEBHOOK_SECRET:
+        return Response(status_code=404)
+    body = (await request.body()).decode()
+    try:
+        status = await payments.accept_webhook(body, request.headers.get('X-Razorpay-Signature', ''),
+                                               config.RAZORPAY_WEBHOOK_SECRET)
+    except InvalidSignature as e:
+        return JSONResponse({"status": "Error", "error": str(e)}, status_code=400)
+    except Exception as e:
+        print(f"Webhook Error: {e}")
+        return JSONResponse({"status": "Error"}, status_code=503)
+    return JSONResponse({"status": status})
+
+class RequestTiming:
+    """Records each request in ``metrics`` and, with SERVER_TIMING=1, adds its Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        timing = metrics.begin_request()
+        status = 500
+
+        async def send_timed(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                if config.SERVER_TIMING:
+                    message['headers'] = list(message.get('headers', [])) + [
+                        (b'server-timing', metrics.server_timing(timing).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            endpoint = scope.get('endpoint')
+            metrics.end_request(timing, getattr(endpoint, '__name__', 'unmatched'), status)
+
+app = Starlette(
+    routes=[
+        Route('/create_order', create_order, methods=['POST']),
+        Route('/verify_payment', verify_payment, methods=['POST']),
+        Route('/contact_submit', contact_submit, methods=['POST']),
+        Route('/download_receipt/{filename}', download_receipt),
+        Route('/razorpay_webhook', razorpay_webhook, methods=['POST']),
+        Route('/metrics', metrics_endpoint),
+    ],
+    middleware=[Middleware(RequestTiming),
+                Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('PORT', 5000)))
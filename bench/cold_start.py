@@ -0,0 +1,140 @@
+"""Cold-start cost of the serverless handler, per route.
+
+Every sample is a fresh Python process, as on a cold Netlify/Vercel
+instance: it imports functions/index.py, serves the route once (cold) and
+then once more (warm). Razorpay is replaced by the stub in bench/fakes.py,
+so the numbers measure our own imports and setup, not the network. SMTP and
+Google Sheets are left unconfigured, so those side effects are skipped.
+
+    python bench/cold_start.py                 # every route, 5 samples each
+    python bench/cold_start.py -n 10 contact_submit verify_payment
+
+Reports the median import time, first-request time and warm-request time
+in milliseconds, and which heavy packages the route loaded.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from fakes import start_fake_razorpay
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS_DIR = os.path.join(ROOT, "functions")
+
+KEY_SECRET = "bench_secret"
+WEBHOOK_SECRET = "bench_webhook_secret"
+ORDER_ID = "order_bench"
+PAYMENT_ID = "pay_bench"
+
+# jinja2 is not listed: Flask imports it anyway, our templates are just compiled on first use
+HEAVY_MODULES = ("fpdf", "razorpay", "requests", "gspread", "google.oauth2", "pytz", "smtplib", "email.mime")
+
+PAYMENT = {"id": PAYMENT_ID, "order_id": ORDER_ID, "amount": 100, "method": "upi", "status": "captured"}
+DETAILS = {"name": "Bench", "phone": "9999999999", "email": "bench@example.com", "service": "Demo Service",
+           "amount": 1.0, "payment_id": PAYMENT_ID, "receipt_no": "IATAC_BENCH", "date": "01-Jan-2025",
+           "method": "upi"}
+
+
+def _webhook_body():
+    return json.dumps({"event": "payment.captured", "payload": {"payment": {"entity": PAYMENT}}})
+
+
+def route_request(name):
+    """(method, path, test-client kwargs) for a route. Runs in the child, after the import."""
+    if name == "contact_submit":
+        return "post", "/api/contact_submit", {"json": {"name": "Bench", "mobile": "9999999999",
+                                                        "email": "bench@example.com", "message": "Hello"}}
+    if name == "create_order":
+        return "post", "/api/create_order", {"json": {"service": "Demo Service", "name": "Bench",
+                                                      "email": "bench@example.com", "phone": "9999999999"}}
+    if name == "verify_payment":
+        signature = hmac.new(KEY_SECRET.encode(), f"{ORDER_ID}|{PAYMENT_ID}".encode(), hashlib.sha256).hexdigest()
+        return "post", "/api/verify_payment", {"json": {"razorpay_order_id": ORDER_ID,
+                                                        "razorpay_payment_id": PAYMENT_ID,
+                                                        "razorpay_signature": signature}}
+    if name == "receipt":
+        from iatac.receipt_token import sign_receipt_token
+        return "get", f"/api/receipt/{sign_receipt_token(DETAILS, KEY_SECRET)}", {}
+    if name == "razorpay_webhook":
+        body = _webhook_body()
+        signature = hmac.new(WEBHOOK_SECRET.encode(), body.encode(), hashlib.sha256).hexdigest()
+        return "post", "/api/razorpay_webhook", {"data": body, "content_type": "application/json",
+                                                 "headers": {"X-Razorpay-Signature": signature}}
+    raise ValueError(f"unknown route {name}")
+
+
+ROUTES = ("contact_submit", "create_order", "verify_payment", "receipt", "razorpay_webhook")
+
+
+def child(name):
+    sys.path.insert(0, FUNCTIONS_DIR)
+    start = time.perf_counter()
+    import index
+    imported = time.perf_counter()
+
+    method, path, kwargs = route_request(name)
+    client = index.app.test_client()
+    t0 = time.perf_counter()
+    status = getattr(client, method)(path, **kwargs).status_code
+    first = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    getattr(client, method)(path, **kwargs)
+    warm = time.perf_counter() - t0
+
+    print(json.dumps({
+        "import_ms": (imported - start) * 1000,
+        "first_ms": first * 1000,
+        "warm_ms": warm * 1000,
+        "status": status,
+        "loaded": [m for m in HEAVY_MODULES if m in sys.modules],
+    }))
+    sys.stdout.flush()
+    os._exit(0)  # don't wait on the outbox drain thread
+
+
+def sample(name, env):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name],
+                         env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("routes", nargs="*", default=ROUTES)
+    parser.add_argument("-n", "--samples", type=int, default=5)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child)
+
+    server = start_fake_razorpay(KEY_SECRET)
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   RAZORPAY_KEY_ID="rzp_test_bench", RAZORPAY_KEY_SECRET=KEY_SECRET,
+                   RAZORPAY_WEBHOOK_SECRET=WEBHOOK_SECRET,
+                   RAZORPAY_API_URL=server.url,
+                   SENDER_PASSWORD="", GOOGLE_SHEET_NAME="",
+                   OUTBOX_PATH=os.path.join(tmp, "outbox.sqlite3"),
+                   ORDER_STORE_PATH=os.path.join(tmp, "orders.sqlite3"),
+                   SHEETS_SPOOL_PATH=os.path.join(tmp, "sheets_spool.jsonl"))
+        print(f"{'route':<18} {'import':>8} {'first':>8} {'cold':>8} {'warm':>8}  status  loaded")
+        for name in args.routes:
+            runs = [sample(name, env) for _ in range(args.samples)]
+            imp = statistics.median(r["import_ms"] for r in runs)
+            first = statistics.median(r["first_ms"] for r in runs)
+            cold = statistics.median(r["import_ms"] + r["first_ms"] for r in runs)
+            warm = statistics.median(r["warm_ms"] for r in runs)
+            print(f"{name:<18} {imp:8.1f} {first:8.1f} {cold:8.1f} {warm:8.1f}  {runs[-1]['status']:>6}  "
+                  f"{', '.join(runs[-1]['loaded']) or '-'}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Local stand-ins for Razorpay, Gmail SMTP and Google Sheets.
+
+FakeRazorpay keeps the orders it creates and plays the part of Razorpay
+Checkout too: POST /bench/checkout pays an order and answers with the
+payment ID and the signature the browser would post to verify_payment.
+Unknown IDs are answered with made-up entities, so fixed IDs work as well.
+
+SMTPSink accepts and counts every message. use_fake_sheets() swaps the
+Google worksheet for an in-memory one; call it in the process that runs
+the app, before the app is imported.
+"""
+import hashlib
+import hmac
+import itertools
+import json
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def sign(secret, message):
+    return hmac.new(secret.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+
+class FakeRazorpay(BaseHTTPRequestHandler):
+    """Just enough of /v1/orders and /v1/payments for the payment routes"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        kind, _, entity_id = self.path.rpartition("/")
+        if kind == "/v1/payments":
+            self._reply(self.server.payment(entity_id))
+        elif kind == "/v1/orders":
+            self._reply(self.server.order(entity_id))
+        else:
+            self._reply({"error": {"code": "BAD_REQUEST_ERROR", "description": "not found"}}, 404)
+
+    def do_POST(self):
+        body = self._body()
+        if self.path == "/bench/checkout":
+            self._reply(self.server.checkout(body["order_id"]))
+            return
+        time.sleep(self.server.latency)
+        self._reply(self.server.create_order(body))
+
+
+class FakeRazorpayServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, key_secret, latency=0.0):
+        super().__init__(("127.0.0.1", 0), FakeRazorpay)
+        self.key_secret = key_secret
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._orders = {}
+        self._payments = {}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def create_order(self, data):
+        with self._lock:
+            order = dict(data, id=f"order_{next(self._ids):014d}", status="created", amount_paid=0)
+            self._orders[order["id"]] = order
+        return order
+
+    def order(self, order_id):
+        with self._lock:
+            return self._orders.get(order_id) or {
+                "id": order_id, "amount": 100, "currency": "INR", "receipt": "IATAC_BENCH", "status": "paid",
+                "notes": {"User Name": "Bench", "Mobile": "9999999999", "Email": "bench@example.com",
+                          "Service": "Demo Service"}}
+
+    def payment(self, payment_id):
+        with self._lock:
+            return self._payments.get(payment_id) or {
+                "id": payment_id, "order_id": "order_bench", "amount": 100, "method": "upi", "status": "captured"}
+
+    def checkout(self, order_id):
+        """Pay an order the way Checkout would; returns what the browser posts to verify_payment"""
+        order = self.order(order_id)
+        with self._lock:
+            payment = {"id": f"pay_{next(self._ids):014d}", "order_id": order_id, "amount": order["amount"],
+                       "method": "upi", "status": "captured"}
+            self._payments[payment["id"]] = payment
+        return {"razorpay_order_id": order_id, "razorpay_payment_id": payment["id"],
+                "razorpay_signature": sign(self.key_secret, f"{order_id}|{payment['id']}"),
+                "payment": payment}
+
+
+def start_fake_razorpay(key_secret, latency=0.0):
+    """FakeRazorpayServer on a free port; ``latency`` seconds are added to each API call"""
+    server = FakeRazorpayServer(key_secret, latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            self._session()
+        except ConnectionError:
+            pass  # pooled sessions are dropped without QUIT when the app exits
+
+    def _session(self):
+        def reply(line):
+            self.wfile.write(line.encode() + b"\r\n")
+
+        reply("220 bench sink")
+        in_data = False
+        for raw in self.rfile:
+            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+            if in_data:
+                if line == ".":
+                    in_data = False
+                    self.server.count()
+                    reply("250 queued")
+                continue
+            verb = line[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                reply("250-bench")
+                reply("250 AUTH PLAIN LOGIN")
+            elif verb == "AUTH":
+                reply("235 ok")
+            elif verb == "DATA":
+                in_data = True
+                reply("354 go ahead")
+            elif verb == "QUIT":
+                reply("221 bye")
+                return
+            else:
+                reply("250 ok")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Plain-text SMTP server that accepts every message and only counts them"""
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 64
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self._lock = threading.Lock()
+        self.messages = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count(self):
+        with self._lock:
+            self.messages += 1
+
+
+def start_smtp_sink():
+    sink = SMTPSink()
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    return sink
+
+
+class FakeWorksheet:
+    """The worksheet calls the ledger makes, kept in a list"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.rows = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self):
+        time.sleep(self.latency)
+        self.calls += 1
+
+    def append_row(self, row):
+        self.append_rows([row])
+
+    def append_rows(self, rows):
+        with self._lock:
+            self._call()
+            self.rows.extend(rows)
+
+    def col_values(self, col):
+        with self._lock:
+            self._call()
+            return [row[col - 1] for row in self.rows]
+
+
+def use_fake_sheets(latency=0.0):
+    """Make every SheetsSession in this process use one FakeWorksheet, and return it"""
+    from iatac.sheets import SheetsSession
+
+    worksheet = FakeWorksheet(latency)
+    SheetsSession.worksheet = lambda self: worksheet
+    return worksheet
@@ -0,0 +1,393 @@
+"""Throughput and latency of the payment routes, against local stand-ins.
+
+Each target runs in a process of its own, with Razorpay, Gmail and Google
+Sheets replaced by the fakes in bench/fakes.py:
+
+    app         app.py on a threaded WSGI server
+    serverless  functions/index.py's handler, fed API Gateway events one at
+                a time, like a single warm instance
+    asgi        asgi.py on uvicorn
+
+``-c`` client threads with keep-alive connections send ``-n`` requests per
+route. Only the route's own request is timed; the order and checkout a
+verify_payment needs, for instance, are made beforehand, untimed.
+
+    python bench/load.py                                  # every target and route
+    python bench/load.py -t app -r verify_payment -c 32 -n 2000
+    python bench/load.py --razorpay-latency-ms 150        # closer to the real API
+    python bench/load.py --save                           # record bench/baselines.json
+    python bench/load.py --compare                        # exit 1 on a regression
+
+Reports requests per second and p50/p95/p99 latency in milliseconds. A
+route regresses when its p95 grows, or its throughput drops, by more than
+``--tolerance`` against the baseline taken at the same concurrency.
+Baselines depend on the machine, so bench/baselines.json is not committed;
+save one before making a change and compare after it.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fakes import sign, start_fake_razorpay, start_smtp_sink, use_fake_sheets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS_DIR = os.path.join(ROOT, "functions")
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+KEY_SECRET = "bench_secret"
+WEBHOOK_SECRET = "bench_webhook_secret"
+
+TARGETS = ("app", "serverless", "asgi")
+ROUTES = ("create_order", "verify_payment", "contact_submit", "razorpay_webhook", "receipt")
+
+# URL prefix of the API routes per target
+PREFIX = {"app": "", "serverless": "/api", "asgi": ""}
+
+
+# The target side (child process)
+
+class LambdaShim(BaseHTTPRequestHandler):
+    """Turns HTTP requests into API Gateway events for the serverless handler"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        path, _, query = self.path.partition("?")
+        event = {
+            "httpMethod": self.command,
+            "path": path,
+            "headers": dict(self.headers.items()),
+            "multiValueHeaders": {k: self.headers.get_all(k) for k in self.headers.keys()},
+            "queryStringParameters": dict(p.split("=", 1) for p in query.split("&") if "=" in p) or None,
+            "body": body,
+            "isBase64Encoded": False,
+            "requestContext": {"identity": {"sourceIp": self.client_address[0]}},
+        }
+        with self.server.instance:  # one event at a time per instance
+            result = self.server.handler(event, None)
+        data = result.get("body", "").encode("latin-1" if result.get("isBase64Encoded") else "utf-8")
+        if result.get("isBase64Encoded"):
+            import base64
+            data = base64.b64decode(data)
+        self.send_response(result["statusCode"])
+        headers = result.get("multiValueHeaders") or {k: [v] for k, v in result.get("headers", {}).items()}
+        for name, values in headers.items():
+            if name.lower() != "content-length":
+                for value in values:
+                    self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = _handle
+
+
+def serve(target, port):
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    use_fake_sheets(float(os.environ.get("BENCH_SHEETS_LATENCY", 0)))
+    if target == "app":
+        from werkzeug.serving import make_server
+        import app
+        make_server("127.0.0.1", port, app.app, threaded=True).serve_forever()
+    elif target == "asgi":
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.app, host="127.0.0.1", port=port, log_level="warning", backlog=512)
+    elif target == "serverless":
+        sys.path.insert(0, FUNCTIONS_DIR)
+        import index
+        server = ThreadingHTTPServer(("127.0.0.1", port), LambdaShim)
+        server.daemon_threads = True
+        server.handler = index.handler
+        server.instance = threading.Lock()
+        server.serve_forever()
+    else:
+        raise ValueError(f"unknown target {target}")
+
+
+# The client side
+
+class Client:
+    """One keep-alive connection to the target, and the fake Razorpay for checkouts"""
+
+    def __init__(self, port, razorpay, prefix):
+        self.port = port
+        self.razorpay = razorpay
+        self.prefix = prefix
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+
+    def request(self, method, path, body=None, headers=None):
+        """(status, body bytes); a dropped keep-alive connection is reopened once"""
+        payload = body if body is None or isinstance(body, (bytes, str)) else json.dumps(body)
+        headers = dict({"Content-Type": "application/json"}, **(headers or {}))
+        for attempt in (1, 2):
+            try:
+                self.conn.request(method, path, payload, headers)
+                response = self.conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                self.conn.close()
+                if attempt == 2:
+                    raise
+
+    def api(self, route, body=None, method="POST", headers=None):
+        return self.request(method, f"{self.prefix}/{route}", body, headers)
+
+    def create_order(self, n):
+        status, body = self.api("create_order", {"service": "Demo Service", "name": f"Bench {n}",
+                                                 "email": f"bench{n}@example.com", "phone": "9999999999"})
+        if status != 200:
+            raise RuntimeError(f"create_order failed: {status} {body[:200]!r}")
+        return json.loads(body)
+
+    def checkout(self, order_id):
+        conn = http.client.HTTPConnection("127.0.0.1", self.razorpay.server_port, timeout=30)
+        try:
+            conn.request("POST", "/bench/checkout", json.dumps({"order_id": order_id}),
+                         {"Content-Type": "application/json"})
+            return json.loads(conn.getresponse().read())
+        finally:
+            conn.close()
+
+    def paid_checkout(self, n):
+        return self.checkout(self.create_order(n)["id"])
+
+
+def prepare(route, client, n):
+    """Untimed setup for one request: (method, path, body, headers)"""
+    api = client.prefix
+    if route == "create_order":
+        return "POST", f"{api}/create_order", {"service": "Demo Service", "name": f"Bench {n}",
+                                               "email": f"bench{n}@example.com", "phone": "9999999999"}, None
+    if route == "contact_submit":
+        return "POST", f"{api}/contact_submit", {"name": f"Bench {n}", "mobile": "9999999999",
+                                                 "email": f"bench{n}@example.com", "message": "Hello"}, None
+    if route == "verify_payment":
+        checkout = client.paid_checkout(n)
+        checkout.pop("payment")
+        return "POST", f"{api}/verify_payment", checkout, None
+    if route == "razorpay_webhook":
+        payment = client.paid_checkout(n)["payment"]
+        body = json.dumps({"event": "payment.captured", "payload": {"payment": {"entity": payment}}})
+        return "POST", f"{api}/razorpay_webhook", body, {"X-Razorpay-Signature": sign(WEBHOOK_SECRET, body)}
+    if route == "receipt":
+        checkout = client.paid_checkout(n)
+        checkout.pop("payment")
+        status, body = client.api("verify_payment", checkout)
+        details = json.loads(body)["details"] if status == 200 else {}
+        if not details.get("pdf_url"):
+            raise RuntimeError(f"verify_payment returned no receipt link: {status} {body[:200]!r}")
+        return "GET", details["pdf_url"], None, None
+    raise ValueError(f"unknown route {route}")
+
+
+def percentile(sorted_ms, p):
+    if not sorted_ms:
+        return float("nan")
+    return sorted_ms[min(len(sorted_ms) - 1, round(p / 100 * (len(sorted_ms) - 1)))]
+
+
+def run_route(route, port, razorpay, prefix, concurrency, requests, warmup, ids):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = itertools.count()
+
+    def worker():
+        client = Client(port, razorpay, prefix)
+        for _ in range(warmup):
+            method, path, body, headers = prepare(route, client, next(ids))
+            client.request(method, path, body, headers)
+        barrier.wait()
+        while next(remaining) < requests:
+            try:
+                method, path, body, headers = prepare(route, client, next(ids))
+            except Exception as e:
+                with lock:
+                    errors.append(f"setup: {e}")
+                continue
+            start = time.perf_counter()
+            try:
+                status, _ = client.request(method, path, body, headers)
+                error = None if status < 400 else f"HTTP {status}"
+            except Exception as e:
+                error = repr(e)
+            elapsed = time.perf_counter() - start
+            with lock:
+                if error:
+                    errors.append(error)
+                else:
+                    latencies.append(elapsed)
+
+    barrier = threading.Barrier(concurrency + 1)
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    ms = sorted(l * 1000 for l in latencies)
+    return {
+        "requests": len(ms), "errors": len(errors), "concurrency": concurrency,
+        "rps": len(ms) / wall if wall else 0.0,
+        "p50": percentile(ms, 50), "p95": percentile(ms, 95), "p99": percentile(ms, 99),
+        "first_error": errors[0] if errors else None,
+    }
+
+
+def wait_for_port(port, child, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if child.poll() is not None:
+            raise RuntimeError(f"target exited with {child.returncode} before listening")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"target did not listen on {port} within {timeout}s")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_target(target, routes, args, razorpay, sink):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        creds = os.path.join(tmp, "google_creds.json")
+        open(creds, "w").close()  # only checked for existence; the worksheet is faked
+        env = dict(os.environ,
+                   RAZORPAY_KEY_ID="rzp_test_bench", RAZORPAY_KEY_SECRET=KEY_SECRET,
+                   RAZORPAY_WEBHOOK_SECRET=WEBHOOK_SECRET, RAZORPAY_API_URL=razorpay.url,
+                   SMTP_HOST="127.0.0.1", SMTP_PORT=str(sink.port), SMTP_USE_SSL="0",
+                   SENDER_EMAIL="bench@example.com", SENDER_PASSWORD="bench",
+                   GOOGLE_SHEET_CREDS_FILE=creds, GOOGLE_SHEET_NAME="bench",
+                   BENCH_SHEETS_LATENCY=str(args.sheets_latency_ms / 1000),
+                   OUTBOX_PATH=os.path.join(tmp, "outbox.sqlite3"),
+                   ORDER_STORE_PATH=os.path.join(tmp, "orders.sqlite3"),
+                   SHEETS_SPOOL_PATH=os.path.join(tmp, "sheets_spool.jsonl"),
+                   RECEIPTS_DIR=os.path.join(tmp, "receipts"),
+                   STATIC_CACHE_DIR=os.path.join(tmp, "static_cache"),
+                   RECEIPT_DELIVERY="token",
+                   # every request comes from one IP; limits this high still pay for the check
+                   RATE_LIMIT_PATH=os.path.join(tmp, "ratelimit.sqlite3"),
+                   CREATE_ORDER_LIMIT_IP="1000000/1", CONTACT_LIMIT_IP="1000000/1",
+                   CREATE_ORDER_LIMIT_CONTACT="1000000/1", CONTACT_LIMIT_CONTACT="1000000/1")
+        output = None if args.verbose else subprocess.DEVNULL
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", target, str(port)],
+                                 env=env, stdout=output, stderr=output)
+        try:
+            wait_for_port(port, child)
+            ids = itertools.count(1)
+            results = {}
+            for route in routes:
+                results[route] = run_route(route, port, razorpay, PREFIX[target], args.concurrency,
+                                           args.requests, args.warmup, ids)
+                report(target, route, results[route])
+            return results
+        finally:
+            child.terminate()
+            try:
+                child.wait(15)
+            except subprocess.TimeoutExpired:
+                child.kill()
+
+
+def report(target, route, r):
+    line = (f"{target:<11} {route:<17} {r['requests']:>6} {r['errors']:>6} {r['rps']:>9.1f} "
+            f"{r['p50']:>8.1f} {r['p95']:>8.1f} {r['p99']:>8.1f}")
+    print(line + (f"  first error: {r['first_error']}" if r["first_error"] else ""), flush=True)
+
+
+def regressions(results, baselines, tolerance, min_delta_ms):
+    found = []
+    for target, routes in results.items():
+        for route, r in routes.items():
+            base = baselines.get(target, {}).get(route)
+            if base is None or base.get("concurrency") != r["concurrency"]:
+                continue
+            if r["p95"] > base["p95"] * (1 + tolerance) and r["p95"] - base["p95"] > min_delta_ms:
+                found.append(f"{target} {route}: p95 {r['p95']:.1f}ms vs {base['p95']:.1f}ms")
+            if r["rps"] < base["rps"] * (1 - tolerance):
+                found.append(f"{target} {route}: {r['rps']:.1f} req/s vs {base['rps']:.1f} req/s")
+            if r["errors"] and not base.get("errors"):
+                found.append(f"{target} {route}: {r['errors']} error(s), baseline had none")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-t", "--targets", nargs="+", choices=TARGETS, default=TARGETS)
+    parser.add_argument("-r", "--routes", nargs="+", choices=ROUTES, default=ROUTES)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("-n", "--requests", type=int, default=200, help="timed requests per route")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed requests per client first")
+    parser.add_argument("--razorpay-latency-ms", type=float, default=0)
+    parser.add_argument("--sheets-latency-ms", type=float, default=0)
+    parser.add_argument("--baseline", default=BASELINES, help="baseline file (default: bench/baselines.json)")
+    parser.add_argument("--save", action="store_true", help="write these results to the baseline file")
+    parser.add_argument("--compare", action="store_true", help="exit 1 if a route regressed")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative change")
+    parser.add_argument("--min-delta-ms", type=float, default=10, help="p95 changes below this are noise")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the targets' own output")
+    parser.add_argument("--serve", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.serve[0], int(args.serve[1]))
+
+    razorpay = start_fake_razorpay(KEY_SECRET, args.razorpay_latency_ms / 1000)
+    sink = start_smtp_sink()
+    print(f"{'target':<11} {'route':<17} {'ok':>6} {'errors':>6} {'req/s':>9} "
+          f"{'p50':>8} {'p95':>8} {'p99':>8}   (ms, concurrency {args.concurrency})")
+    results = {target: run_target(target, args.routes, args, razorpay, sink) for target in args.targets}
+    print(f"mails accepted by the SMTP sink: {sink.messages}")
+    razorpay.shutdown()
+    sink.shutdown()
+
+    try:
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+
+    status = 0
+    if args.compare:
+        found = regressions(results, baselines, args.tolerance, args.min_delta_ms)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if not found:
+            print("no regressions against the baseline")
+        status = 1 if found else 0
+    if args.save:
+        for target, routes in results.items():
+            for route, r in routes.items():
+                baselines.setdefault(target, {})[route] = {
+                    k: round(v, 1) if isinstance(v, float) else v for k, v in r.items() if k != "first_error"}
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline saved to {os.path.relpath(args.baseline)}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,331 +1,150 @@
+import hmac
 import os
-import secrets
-import datetime
-import threading
-import base64
+import sys
 from io import BytesIO
-from flask import Flask, request, jsonify
-import razorpay
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-import gspread
-from google.oauth2.service_account import Credentials
-import pytz
-from fpdf import FPDF
-from dotenv import load_dotenv
+from flask import Flask, Response, abort, g, request, jsonify, send_file
 from flask_cors import CORS
 try:
     import serverless_wsgi
 except ImportError:
     serverless_wsgi = None
 
-load_dotenv()
+# The shared iatac package lives at the repo root, one level above functions/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from iatac import config
+from iatac.config import error_status
+from iatac.payments import InvalidSignature
+from iatac.razorpay_api import is_outage
+from iatac.receipt_delivery import SignedReceipts
+from iatac.receipt_store import receipt_filename
 
 app = Flask(__name__)
 CORS(app)
 
-# Configuration
-def get_path(filename):
-    # Try current folder, then one level up, then two (covers most serverless layouts)
-    search_dirs = [
-        os.path.dirname(os.path.abspath(__file__)),
-        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
-        os.getcwd()
-    ]
-    for d in search_dirs:
-        p = os.path.join(d, filename)
-        if os.path.exists(p):
-            return p
-    return os.path.join(os.getcwd(), filename) # Fallback
-
-RAZORPAY_KEY_ID = os.getenv('RAZORPAY_KEY_ID')
-RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_KEY_SECRET')
-SENDER_EMAIL = os.getenv('SENDER_EMAIL')
-SENDER_PASSWORD = os.getenv('SENDER_PASSWORD')
-MANAGER_EMAIL = "office.ravindra@gmail.com"
-GOOGLE_SHEET_CREDS_FILE = get_path("google_creds.json") 
-GOOGLE_SHEET_NAME = os.getenv('GOOGLE_SHEET_NAME')
-LOGO_PATH = get_path(os.path.join("images", "logo-iatac.png"))
-
-# Initialize Razorpay
-if RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET:
-    client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
-else:
-    client = None
-
-SERVICE_PRICES = {
-    "Annual Fee (All)": 5000 * 100,
-    "HR Services Company Membership": 5000 * 100,
-    "HR Consultants Membership": 3000 * 100,
-    "Corporates Membership": 15000 * 100,
-    "Demo Service": 1 * 100
-}
-
-SERVICE_CATEGORIES = {
-    "HR Services Company Membership": "HR Services",
-    "HR Consultants Membership": "HR Consultant",
-    "Corporates Membership": "Corporate",
-    "Annual Fee (All)": "Membership",
-    "Demo Service": "Membership"
-}
+# Orders, verification and every post-payment side effect (see iatac.config).
+# Everything is kept at module level so warm invocations reuse the logins and
+# breakers; the Razorpay client and receipt layout are built on first use.
+payments = config.build_payments(config.SERVERLESS)
+metrics = payments.metrics
+outbox = payments.outbox
+sheet_writer = payments.sheet_writer
+receipts = payments.receipts
+get_client = payments.get_client
+get_receipt_template = receipts.get_template
+
+@app.before_request
+def start_timing():
+    g.timing = metrics.begin_request()
+
+@app.after_request
+def finish_timing(response):
+    timing = g.pop('timing', None)
+    if timing is not None:
+        if config.SERVER_TIMING:
+            response.headers['Server-Timing'] = metrics.server_timing(timing)
+        metrics.end_request(timing, request.endpoint or 'unmatched', response.status_code)
+    return response
 
 @app.route('/api/create_order', methods=['POST', 'OPTIONS'])
 @app.route('/create_order', methods=['POST', 'OPTIONS'])
 def create_order():
     try:
-        if not client:
-            return jsonify({"error": "Server misconfiguration: Missing Razorpay Keys"}), 500
-
-        data = request.json
-        service_name = data.get('service')
-        user_name = data.get('name')
-        user_email = data.get('email')
-        user_phone = data.get('phone')
-
-        if service_name not in SERVICE_PRICES:
-            return jsonify({"error": "Invalid service selected"}), 400
-
-        amount = SERVICE_PRICES[service_name]
-        order_data = {
-            "amount": amount,
-            "currency": "INR",
-            "receipt": f"IATAC_{secrets.token_hex(4).upper()}",
-            "notes": {
-                "User Name": user_name,
-                "Mobile": user_phone,
-                "Email": user_email,
-                "Service": service_name
-            }
-        }
-        order = client.order.create(data=order_data)
-        return jsonify(order)
+        return jsonify(payments.create_order(request.json, request.headers.get('Idempotency-Key'),
+                                             request.remote_addr))
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-def send_email_async(to_email, subject, body):
-    """Sync email sender for serverless (threading might terminate early in serverless, but trying explicitly)"""
-    if not SENDER_PASSWORD:
-        return
-
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'html'))
+        status, headers = error_status(e)
+        return jsonify({"error": str(e)}), status, headers
 
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.send_message(msg)
-        print(f"Email sent successfully to {to_email}")
-    except Exception as e:
-        print(f"SMTP Error: {e}")
+@app.before_request
+def resume_outbox():
+    """Work off what earlier requests left in the outbox, within OUTBOX_DRAIN_BUDGET.
 
-def log_to_google_sheet(user_details, order_id):
-    """Log to Google Sheet"""
-    # Note:In Vercel, files in root are readable.
-    if not os.path.exists(GOOGLE_SHEET_CREDS_FILE):
-        print("Google Sheet Credentials file missing.")
+    Only on POSTs: a page, receipt or metrics GET should not wait on SMTP.
+    verify_payment drains once it has recorded its own entries.
+    """
+    if request.method != 'POST' or request.endpoint == 'verify_payment':
         return
+    if outbox.pending(1) or sheet_writer.pending():
+        payments.resume()
 
+@app.route('/api/verify_payment', methods=['POST', 'OPTIONS'])
+@app.route('/verify_payment', methods=['POST', 'OPTIONS'])
+def verify_payment():
     try:
-        scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-        creds = Credentials.from_service_account_file(GOOGLE_SHEET_CREDS_FILE, scopes=scope)
-        gc = gspread.authorize(creds)
-        sh = gc.open(GOOGLE_SHEET_NAME)
-        worksheet = sh.get_worksheet(0)
-        
-        ist = pytz.timezone('Asia/Kolkata')
-        now = datetime.datetime.now(ist)
-        category = SERVICE_CATEGORIES.get(user_details['service'], "Membership")
-
-        row = [
-            now.strftime("%d-%m-%Y"),
-            now.strftime("%H:%M:%S"),
-            user_details['name'],
-            user_details['phone'],
-            user_details['email'],
-            user_details['service'],
-            category,
-            user_details['amount'],
-            user_details['method'],
-            user_details['payment_id'],
-            order_id,
-            "SUCCESS",
-            "iatac.in",
-            "Yes",
-            "Yes",
-            "Base64 Download",
-            now.strftime("%Y-%m-%d %H:%M:%S")
-        ]
-        worksheet.append_row(row)
+        return jsonify({ "status": "Success", "details": payments.verify_payment(request.json) })
     except Exception as e:
-        print(f"Google Sheet Error: {e}")
-
-class IATACReceipt(FPDF):
-    def header(self):
-        # Logo - requires absolute path or relative to execution
-        if os.path.exists(LOGO_PATH):
-            self.image(LOGO_PATH, 10, 8, 33)
-        self.set_font("helvetica", "B", 20)
-        self.set_text_color(0, 123, 255)
-        self.cell(80)
-        self.cell(100, 10, "OFFICIAL RECEIPT", border=0, align="R", ln=1)
-        self.ln(20)
-
-    def footer(self):
-        self.set_y(-35)
-        self.set_font("helvetica", "I", 8)
-        self.set_text_color(169, 169, 169)
-        self.cell(0, 10, "This is a computer-generated document. No signature is required.", align="C", ln=1)
-        self.set_font("helvetica", "B", 10)
-        self.set_text_color(45, 52, 70)
-        self.cell(0, 10, "IATAC - Indian Association of Talent Acquisition Consultants", align="C", ln=1)
-        self.set_font("helvetica", "", 8)
-        self.cell(0, 5, "Office-609, Parth Solitaire, Sector-9E, Kalamboli, Navi Mumbai - 410218", align="C")
-
-def generate_receipt_base64(details):
+        status, headers = error_status(e)
+        return jsonify({ "status": "Error", "error": str(e) }), status, headers
+
+@app.route('/api/razorpay_webhook', methods=['POST'])
+@app.route('/razorpay_webhook', methods=['POST'])
+def razorpay_webhook():
+    """Confirms payments even when the browser never calls verify_payment.
+
+    The event is recorded in the outbox and acknowledged, then drained like
+    any other entry. Anything but a 2xx makes Razorpay deliver it again.
+    """
+    if not (get_client() and config.RAZORPAY_WEBHOOK_SECRET):
+        abort(404)
     try:
-        pdf = IATACReceipt()
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-
-        # Billing Info
-        pdf.set_font("helvetica", "B", 12)
-        pdf.set_text_color(100, 100, 100)
-        pdf.cell(0, 10, "BILLED TO:", ln=1)
-        pdf.set_font("helvetica", "", 11)
-        pdf.set_text_color(0, 0, 0)
-        pdf.cell(0, 6, f"{details['name']}", ln=1)
-        pdf.cell(0, 6, f"Mobile: {details['phone']}", ln=1)
-        pdf.cell(0, 6, f"Email: {details['email']}", ln=1)
-        
-        # Receipt Info
-        pdf.set_xy(140, 45)
-        pdf.set_font("helvetica", "B", 11)
-        pdf.set_text_color(100, 100, 100)
-        pdf.cell(50, 6, "RECEIPT NO:", align="R", ln=1)
-        pdf.set_x(140)
-        pdf.set_font("helvetica", "", 11)
-        pdf.set_text_color(0, 0, 0)
-        pdf.cell(50, 6, f"#{details['receipt_no']}", align="R", ln=1)
-        pdf.set_x(140)
-        pdf.set_font("helvetica", "B", 11)
-        pdf.set_text_color(100, 100, 100)
-        pdf.cell(50, 6, "DATE:", align="R", ln=1)
-        pdf.set_x(140)
-        pdf.set_font("helvetica", "", 10)
-        pdf.set_text_color(0, 0, 0)
-        pdf.cell(50, 6, f"{details['date']}", align="R", ln=1)
-        pdf.ln(20)
-
-        # Table
-        pdf.set_fill_color(0, 123, 255)
-        pdf.set_text_color(255, 255, 255)
-        pdf.set_font("helvetica", "B", 11)
-        pdf.cell(100, 10, " Description", border=1, fill=True)
-        pdf.cell(50, 10, " Transaction ID", border=1, fill=True, align="C")
-        pdf.cell(40, 10, " Amount", border=1, fill=True, align="R")
-        pdf.ln()
-
-        # Row
-        pdf.set_text_color(0, 0, 0)
-        pdf.set_font("helvetica", "", 10)
-        pdf.cell(100, 15, f" {details['service']}", border=1)
-        pdf.set_font("courier", "", 9)
-        pdf.cell(50, 15, f" {details['payment_id']}", border=1, align="C")
-        pdf.set_font("helvetica", "B", 11)
-        pdf.cell(40, 15, f" INR {details['amount']:.2f} ", border=1, align="R")
-        pdf.ln()
-
-        # Total
-        pdf.ln(10)
-        pdf.set_x(140)
-        pdf.set_font("helvetica", "B", 12)
-        pdf.cell(50, 10, "TOTAL RECEIVED:", align="R")
-        pdf.set_font("helvetica", "B", 16)
-        pdf.set_text_color(0, 123, 255)
-        pdf.cell(0, 10, f" INR {details['amount']:.2f}", ln=1, align="R")
-
-        # Footer
-        pdf.ln(5)
-        pdf.set_font("helvetica", "B", 10)
-        pdf.set_text_color(100, 100, 100)
-        pdf.cell(0, 10, f"Payment Method: {details['method'].upper()}", ln=1)
-        pdf.set_text_color(40, 167, 69)
-        pdf.cell(0, 10, "Status: PAID", ln=1)
-
-        # Output to bytes
-        pdf_bytes = pdf.output(dest='S') # 'S' returns bytes/string in fpdf2
-        if isinstance(pdf_bytes, str):
-            pdf_bytes = pdf_bytes.encode('latin-1') # fpdf2 strange string behavior sometimes
-        
-        return base64.b64encode(pdf_bytes).decode('utf-8')
+        status = payments.accept_webhook(request.get_data(as_text=True),
+                                         request.headers.get('X-Razorpay-Signature', ''),
+                                         config.RAZORPAY_WEBHOOK_SECRET)
+    except InvalidSignature as e:
+        return jsonify({"status": "Error", "error": str(e)}), 400
     except Exception as e:
-        print(f"PDF Error: {e}")
-        return None
-
-@app.route('/api/verify_payment', methods=['POST', 'OPTIONS'])
-@app.route('/verify_payment', methods=['POST', 'OPTIONS'])
-def verify_payment():
+        print(f"Webhook Error: {e}")
+        return jsonify({"status": "Error"}), 503
+    return jsonify({"status": status})
+
+@app.route('/api/receipt/<token>')
+@app.route('/receipt/<token>')
+def download_receipt(token):
+    link = receipts.load(token) if isinstance(receipts, SignedReceipts) else None
+    if link is None:
+        abort(404)
     try:
-        data = request.json
-        params_dict = {
-            'razorpay_order_id': data['razorpay_order_id'],
-            'razorpay_payment_id': data['razorpay_payment_id'],
-            'razorpay_signature': data['razorpay_signature']
-        }
-        
-        client.utility.verify_payment_signature(params_dict)
-        payment_info = client.payment.fetch(data['razorpay_payment_id'])
-        order_info = client.order.fetch(data['razorpay_order_id'])
-        
-        user_details = {
-            "name": order_info['notes'].get('User Name'),
-            "phone": order_info['notes'].get('Mobile'),
-            "email": order_info['notes'].get('Email'),
-            "service": order_info['notes'].get('Service'),
-            "amount": payment_info['amount'] / 100,
-            "payment_id": data['razorpay_payment_id'],
-            "receipt_no": order_info['receipt'],
-            "date": datetime.datetime.now().strftime("%d-%b-%Y %I:%M:%S %p IST"),
-            "method": payment_info.get('method', 'N/A')
-        }
-
-        # Send Emails
-        manager_body = f"Payment Received: {user_details['amount']} from {user_details['name']}"
-        user_body = f"Payment Successful for {user_details['service']}"
-        # Triggering async for serverless is tricky, better to await or just do it sync for reliability
-        send_email_async(MANAGER_EMAIL, "Payment Received", manager_body)
-        send_email_async(user_details['email'], "Payment Confirmation", user_body)
-        
-        # Log to Sheet
-        log_to_google_sheet(user_details, data['razorpay_order_id'])
-
-        # Generate PDF Base64
-        pdf_base64 = generate_receipt_base64(user_details)
-        user_details['pdf_base64'] = pdf_base64
-
-        return jsonify({ "status": "Success", "details": user_details })
-        
+        details = payments.receipt_details(*link)
     except Exception as e:
-        return jsonify({ "status": "Error", "error": str(e) }), 500
+        status, headers = error_status(e)
+        if status == 503:
+            return jsonify({"error": str(e)}), status, headers
+        if not is_outage(e):
+            abort(404)  # Razorpay does not know the payment
+        print(f"Receipt Error: {e}")
+        return jsonify({"error": "Could not fetch the payment, please try again shortly"}), 503
+    if details is None:
+        abort(404)
+    response = send_file(BytesIO(get_receipt_template().render(details)), mimetype='application/pdf',
+                         as_attachment=True, download_name=receipt_filename(details['payment_id']),
+                         conditional=True, etag=token.rsplit('.', 1)[1], max_age=config.RECEIPT_TOKEN_TTL)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
 
 @app.route('/api/contact_submit', methods=['POST'])
 def contact_submit():
-    # ... logic similar to original but with /api prefix compatibility
-    # For brevity, implementing simple passthrough or full logic
     try:
-        data = request.json
-        name = data.get('name')
-        email = data.get('email')
-        message = data.get('message')
-        # ... validation ...
-        send_email_async("iatac.mumbai@gmail.com", f"Contact from {name}", message)
-        return jsonify({"status": "Success", "message": "Sent"})
+        message = payments.submit_contact(request.json, request.remote_addr)
+        return jsonify({"status": "Success", "message": message})
     except Exception as e:
-        return jsonify({"status": "Error", "message": str(e)}), 500
+        status, headers = error_status(e)
+        return jsonify({"status": "Error", "message": str(e)}), status, headers
+
+@app.route('/api/metrics')
+@app.route('/metrics')
+def metrics_endpoint():
+    """This instance's timings and counters; needs Authorization: Bearer <METRICS_TOKEN>"""
+    if not config.METRICS_TOKEN:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {config.METRICS_TOKEN}"):
+        abort(401)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+if config.PRELOAD_ON_IMPORT:
+    # For platforms that pay the cold start ahead of traffic (provisioned concurrency)
+    get_client()
+    get_receipt_template()._get_base()
 
 def handler(event, context):
     if serverless_wsgi:
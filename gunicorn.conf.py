@@ -0,0 +1,13 @@
+# Picked up automatically by `gunicorn app:app` (see Procfile).
+
+# Leave the job queue time to drain before gunicorn kills the worker.
+# shutdown_background_work() takes up to JOB_DRAIN_TIMEOUT (15 s) plus 10 s
+# for the sheet flush; keep that a few seconds under this. Heroku kills the
+# dyno 30 s after SIGTERM, so this cannot usefully go higher.
+graceful_timeout = 30
+
+
+def worker_exit(server, worker):
+    """Finish queued emails and sheet rows before the worker process goes away"""
+    import app
+    app.shutdown_background_work()
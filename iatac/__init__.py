@@ -0,0 +1,6 @@
+"""Shared building blocks for the IATAC payment backend.
+
+Used by the Flask app (app.py), the serverless handler
+(functions/index.py) and the ASGI app (asgi.py), which all build their
+services through iatac.config.
+"""
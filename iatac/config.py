@@ -0,0 +1,322 @@
+"""Settings and service wiring shared by the three entry points.
+
+app.py (gunicorn), functions/index.py (serverless) and asgi.py (uvicorn)
+read the same environment variables, with the same defaults, from here.
+build_payments() builds the PaymentService for one deployment and
+everything it depends on, so each entry point keeps only its routes and
+its process lifecycle. The parts an entry point needs are attributes of
+the service (``payments.outbox``, ``payments.sheet_writer``,
+``payments.receipts``, ...).
+
+error_status() is the one mapping from service errors to HTTP statuses.
+"""
+import functools
+import os
+import tempfile
+import threading
+
+from dotenv import load_dotenv
+
+from iatac.dispatch import InlineDrain, QueuedDispatch, TaskDispatch, ThreadedDrain
+from iatac.enquiries import EnquiryBuffer
+from iatac.jobs import JobQueue
+from iatac.mailer import AsyncSMTPPool, SMTPPool
+from iatac.metrics import Metrics
+from iatac.orders import OrderCache, OrderStore
+from iatac.outbox import Outbox
+from iatac.payments import AsyncPaymentService, InvalidRequest, InvalidSignature, PaymentService
+from iatac.ratelimit import RateLimited, RateLimiter, parse_limit
+from iatac.razorpay_api import AsyncRazorpay, is_outage, make_client
+from iatac.receipt_delivery import InlineReceipts, SignedReceipts, StoredReceipts
+from iatac.receipt_store import ReceiptStore
+from iatac.resilience import Guard, Unavailable
+from iatac.sheets import LedgerIndex, SheetBatchWriter, SheetsSession
+
+load_dotenv()
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Deployments build_payments() knows
+QUEUED = 'queued'          # app.py: gunicorn workers, outbox entries as jobs on a JobQueue
+SERVERLESS = 'serverless'  # functions/index.py: one request per instance, outbox drained per request
+ASYNC = 'async'            # asgi.py: one event loop, outbox entries as tasks
+
+# Outbox entry kind -> job lane (or task lane)
+LANES = {'manager_email': 'email', 'customer_email': 'email', 'sheet_row': 'sheets', 'captured_payment': 'payments'}
+
+# Razorpay
+RAZORPAY_KEY_ID = os.getenv('RAZORPAY_KEY_ID')
+RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_KEY_SECRET')
+RAZORPAY_WEBHOOK_SECRET = os.getenv('RAZORPAY_WEBHOOK_SECRET')
+RAZORPAY_API_URL = os.getenv('RAZORPAY_API_URL')  # unset: Razorpay's live API
+RAZORPAY_TIMEOUT = float(os.getenv('RAZORPAY_TIMEOUT', 10))
+RAZORPAY_POOL_SIZE = int(os.getenv('RAZORPAY_POOL_SIZE', 100))  # asgi.py's httpx pool
+
+# Mail
+SENDER_EMAIL = os.getenv('SENDER_EMAIL')
+SENDER_PASSWORD = os.getenv('SENDER_PASSWORD')
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', 465))
+SMTP_USE_SSL = os.getenv('SMTP_USE_SSL', '1') == '1'
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', 2))  # per process; the serverless handler keeps one
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', 30))
+
+# Google Sheets ledger
+GOOGLE_SHEET_CREDS_FILE = os.getenv('GOOGLE_SHEET_CREDS_FILE')
+GOOGLE_SHEET_NAME = os.getenv('GOOGLE_SHEET_NAME')
+SHEETS_TIMEOUT = float(os.getenv('SHEETS_TIMEOUT', 30))
+SHEETS_BATCH_ROWS = int(os.getenv('SHEETS_BATCH_ROWS', 20))
+SHEETS_BATCH_WAIT = float(os.getenv('SHEETS_BATCH_WAIT', 5))
+SHEETS_WORKERS = int(os.getenv('SHEETS_WORKERS', 1))
+
+# Background work
+JOB_QUEUE_MAX = int(os.getenv('JOB_QUEUE_MAX', 200))
+JOB_RETRIES = int(os.getenv('JOB_RETRIES', 3))
+JOB_DRAIN_TIMEOUT = float(os.getenv('JOB_DRAIN_TIMEOUT', 15))  # see gunicorn.conf.py before raising it
+OUTBOX_SWEEP_INTERVAL = int(os.getenv('OUTBOX_SWEEP_INTERVAL', 300))
+# Serverless only. 'inline' drains the outbox before the response is returned. 'threaded' drains
+# it on a thread after the response, which answers sooner, but the outbox is under /tmp: an
+# instance frozen before the thread finishes and then recycled without another invocation
+# loses those mails and rows.
+OUTBOX_DRAIN = os.getenv('OUTBOX_DRAIN', 'inline')
+# Serverless only. Seconds a drain may keep starting entries; the rest wait for the next request
+OUTBOX_DRAIN_BUDGET = float(os.getenv('OUTBOX_DRAIN_BUDGET', 5))
+
+# Receipts
+RECEIPTS_DIR = os.getenv('RECEIPTS_DIR', 'receipts')
+RECEIPTS_MAX_BYTES = int(os.getenv('RECEIPTS_MAX_BYTES', 50 * 1024 * 1024))
+RECEIPT_MAX_AGE = int(os.getenv('RECEIPT_MAX_AGE', 3600))
+RECEIPT_WORKERS = int(os.getenv('RECEIPT_WORKERS', 2))  # asgi.py's rendering threads
+# Serverless only. 'token' returns a signed /api/receipt/<token> link; 'base64' embeds the PDF in the JSON
+RECEIPT_DELIVERY = os.getenv('RECEIPT_DELIVERY', 'token')
+RECEIPT_TOKEN_SECRET = os.getenv('RECEIPT_TOKEN_SECRET') or RAZORPAY_KEY_SECRET
+RECEIPT_TOKEN_TTL = int(os.getenv('RECEIPT_TOKEN_TTL', 900))
+
+# Orders
+ORDER_CACHE_TTL = int(os.getenv('ORDER_CACHE_TTL', 600))
+
+# Bulkheads and circuit breakers (iatac.resilience). Unset in-flight limits
+# default per deployment (IN_FLIGHT_DEFAULTS).
+RAZORPAY_MAX_IN_FLIGHT = os.getenv('RAZORPAY_MAX_IN_FLIGHT')
+SMTP_MAX_IN_FLIGHT = os.getenv('SMTP_MAX_IN_FLIGHT')
+SHEETS_MAX_IN_FLIGHT = os.getenv('SHEETS_MAX_IN_FLIGHT')
+CIRCUIT_FAILURES = int(os.getenv('CIRCUIT_FAILURES', 5))
+CIRCUIT_RESET = float(os.getenv('CIRCUIT_RESET', 30))
+# (Razorpay, SMTP, Sheets) calls in flight at once. A serverless instance serves
+# one request at a time, so its bulkheads stay small; asgi.py can use its whole pool.
+IN_FLIGHT_DEFAULTS = {
+    QUEUED: (10, 2 * SMTP_POOL_SIZE, 4),
+    ASYNC: (RAZORPAY_POOL_SIZE, 2 * SMTP_POOL_SIZE, 4),
+    SERVERLESS: (4, 2, 2),
+}
+
+# Rate limits: requests/seconds, '0' turns one off
+CREATE_ORDER_LIMIT_IP = os.getenv('CREATE_ORDER_LIMIT_IP', '20/60')
+CREATE_ORDER_LIMIT_CONTACT = os.getenv('CREATE_ORDER_LIMIT_CONTACT', '10/600')  # per email and per phone
+CONTACT_LIMIT_IP = os.getenv('CONTACT_LIMIT_IP', '5/600')
+CONTACT_LIMIT_CONTACT = os.getenv('CONTACT_LIMIT_CONTACT', '3/3600')
+
+# '1' collects contact enquiries into one mail per CONTACT_DIGEST_MAX enquiries or CONTACT_DIGEST_WAIT
+# seconds. Not serverless: a buffer under /tmp does not outlive the instance, and an enquiry must not
+# be lost with it.
+CONTACT_DIGEST = os.getenv('CONTACT_DIGEST', '0') == '1'
+CONTACT_DIGEST_MAX = int(os.getenv('CONTACT_DIGEST_MAX', 25))
+CONTACT_DIGEST_WAIT = int(os.getenv('CONTACT_DIGEST_WAIT', 900))
+# Enquiries mentioning one of these are mailed straight away
+CONTACT_URGENT_WORDS = [w.strip() for w in os.getenv('CONTACT_URGENT_WORDS', 'urgent').split(',') if w.strip()]
+
+# Reverse proxies in front of gunicorn whose X-Forwarded-For can be trusted for the client IP.
+# Without the right count every visitor looks like the proxy and shares one per-IP bucket.
+# Heroku (the Procfile, which sets DYNO) has its router in front: one hop. Set 0 when gunicorn
+# faces clients directly, 2 for e.g. a CDN in front of the router. asgi.py leaves this to
+# uvicorn's --proxy-headers --forwarded-allow-ips=<proxy>.
+PROXY_HOPS = int(os.getenv('PROXY_HOPS', 1 if os.getenv('DYNO') else 0))
+
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', 3600))
+STATIC_CACHE_DIR = os.getenv('STATIC_CACHE_DIR', '.static_cache')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # unset: no /metrics
+SERVER_TIMING = os.getenv('SERVER_TIMING', '0') == '1'
+# Serverless only. '1' builds the Razorpay client and receipt layout at import instead of on first use
+PRELOAD_ON_IMPORT = os.getenv('PRELOAD_ON_IMPORT', '0') == '1'
+
+# functions/index.py's folder, the repo root, then the working directory (covers most serverless layouts)
+SEARCH_DIRS = (os.path.join(ROOT, "functions"), ROOT, os.getcwd())
+
+
+@functools.lru_cache(maxsize=None)
+def get_path(filename):
+    """Resolved once per process; later lookups do not touch the filesystem"""
+    for d in SEARCH_DIRS:
+        p = os.path.join(d, filename)
+        if os.path.exists(p):
+            return p
+    return os.path.join(os.getcwd(), filename)  # Fallback
+
+
+def state_path(setting, filename, deployment):
+    """Where a local state file lives: the setting if set, else the working directory,
+    or /tmp when serverless (the only writable place on Netlify/Vercel; it survives warm invocations)"""
+    if os.getenv(setting):
+        return os.getenv(setting)
+    if deployment == SERVERLESS:
+        return os.path.join(tempfile.gettempdir(), f"iatac_{filename}")
+    return filename
+
+
+def error_status(exc):
+    """(HTTP status, headers) a route answers a service error with"""
+    if isinstance(exc, (RateLimited, Unavailable)):
+        status = 429 if isinstance(exc, RateLimited) else 503
+        return status, {'Retry-After': str(exc.retry_after)}
+    if isinstance(exc, (InvalidRequest, InvalidSignature)):
+        return 400, {}
+    return 500, {}
+
+
+def _in_flight(setting, default):
+    return int(setting) if setting else default
+
+
+def _lazy(factory):
+    """factory() on first call, then the same object; None results are retried"""
+    lock = threading.Lock()
+    made = []
+
+    def get():
+        if not made:
+            with lock:
+                if not made:
+                    value = factory()
+                    if value is None:
+                        return None
+                    made.append(value)
+        return made[0]
+    return get
+
+
+def _razorpay_client():
+    if RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET:
+        return make_client(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET, base_url=RAZORPAY_API_URL)
+    return None
+
+
+def _receipt_template():
+    from iatac.receipt import ReceiptTemplate  # fpdf is most of a cold start
+    return ReceiptTemplate(get_path(os.path.join("images", "logo-iatac.png")))
+
+
+def build_payments(deployment):
+    """The PaymentService (AsyncPaymentService for ASYNC) for a deployment, with its upstreams,
+    stores and dispatch strategy wired up and their gauges registered on ``payments.metrics``"""
+    if deployment not in IN_FLIGHT_DEFAULTS:
+        raise ValueError(f"Unknown deployment: {deployment}")
+    serverless = deployment == SERVERLESS
+    mailer_class = AsyncSMTPPool if deployment == ASYNC else SMTPPool
+    razorpay_limit, smtp_limit, sheets_limit = IN_FLIGHT_DEFAULTS[deployment]
+
+    # Stage timings and counters for this process, served on /metrics
+    metrics = Metrics()
+
+    # A bulkhead and a circuit breaker per upstream, so one that hangs or keeps
+    # failing cannot tie up every worker (see iatac.resilience). Breakers are
+    # kept across warm serverless invocations, where the bulkheads stay small.
+    razorpay_guard = Guard('razorpay', max_in_flight=_in_flight(RAZORPAY_MAX_IN_FLIGHT, razorpay_limit),
+                           failures=CIRCUIT_FAILURES, reset_after=CIRCUIT_RESET, is_failure=is_outage)
+    mail_guard = Guard('smtp', max_in_flight=_in_flight(SMTP_MAX_IN_FLIGHT, smtp_limit),
+                       failures=CIRCUIT_FAILURES, reset_after=CIRCUIT_RESET, is_failure=mailer_class.is_outage)
+    sheets_guard = Guard('sheets', max_in_flight=_in_flight(SHEETS_MAX_IN_FLIGHT, sheets_limit),
+                         failures=CIRCUIT_FAILURES, reset_after=CIRCUIT_RESET)
+
+    # Long-lived Gmail sessions shared by every request in this process
+    mailer = mailer_class(SMTP_HOST, SMTP_PORT, SENDER_EMAIL, SENDER_PASSWORD, size=1 if serverless else SMTP_POOL_SIZE,
+                          use_ssl=SMTP_USE_SSL, timeout=SMTP_TIMEOUT)
+
+    # Logged-in Sheets client and worksheet handle, reused across payments.
+    # Rows are coalesced into one append_rows call and spooled to disk until
+    # Google accepts them; payment IDs already in the ledger are skipped. When
+    # serverless there is no flusher thread: the outbox drain flushes when it finishes.
+    creds_file = GOOGLE_SHEET_CREDS_FILE or (get_path("google_creds.json") if serverless else None)
+    sheets = SheetsSession(creds_file, GOOGLE_SHEET_NAME, timeout=SHEETS_TIMEOUT, guard=sheets_guard)
+    sheet_writer = SheetBatchWriter(sheets, max_rows=SHEETS_BATCH_ROWS,
+                                    max_wait=None if serverless else SHEETS_BATCH_WAIT,
+                                    spool_path=state_path('SHEETS_SPOOL_PATH', 'sheets_spool.jsonl', deployment),
+                                    index=LedgerIndex(sheets), metrics=metrics)
+
+    # Orders created here in the last ORDER_CACHE_TTL seconds, reused for repeated create_order
+    # requests, and every created order in a file all workers share, so verify_payment can skip
+    # order.fetch. Serverless, both last as long as the instance.
+    order_cache = OrderCache(ttl=ORDER_CACHE_TTL)
+    order_store = OrderStore(state_path('ORDER_STORE_PATH', 'orders.sqlite3', deployment))
+
+    # Every side effect is written here before verify_payment returns, so a
+    # restart between the response and the work running loses nothing.
+    outbox = Outbox(state_path('OUTBOX_PATH', 'outbox.sqlite3', deployment))
+
+    # Token buckets per client IP and per email/phone, checked before create_order or
+    # contact_submit does any real work. Shared by every worker through a file; serverless
+    # they are kept in memory, so they slow a flood down rather than cap it.
+    limiter = RateLimiter({
+        'create_order': {'ip': parse_limit(CREATE_ORDER_LIMIT_IP), 'contact': parse_limit(CREATE_ORDER_LIMIT_CONTACT)},
+        'contact_submit': {'ip': parse_limit(CONTACT_LIMIT_IP), 'contact': parse_limit(CONTACT_LIMIT_CONTACT)},
+    }, path=None if serverless else state_path('RATE_LIMIT_PATH', 'ratelimit.sqlite3', deployment))
+
+    # Contact enquiries waiting for the next digest, in a file every worker shares.
+    # Digests that are due go out from the outbox sweep.
+    enquiries = None
+    if CONTACT_DIGEST and not serverless:
+        enquiries = EnquiryBuffer(state_path('CONTACT_DIGEST_PATH', 'enquiries.sqlite3', deployment),
+                                  max_items=CONTACT_DIGEST_MAX, max_wait=CONTACT_DIGEST_WAIT,
+                                  urgent_words=CONTACT_URGENT_WORDS)
+
+    extra = {}
+    if serverless:
+        # The Razorpay client and the receipt renderer are created by the first request that
+        # needs them: importing razorpay/requests and fpdf is most of a cold start, and
+        # contact_submit needs neither. Both are kept for warm invocations.
+        get_client = _lazy(_razorpay_client)
+        get_template = _lazy(_receipt_template)
+        if RECEIPT_DELIVERY == 'base64' or not RECEIPT_TOKEN_SECRET:
+            receipts = InlineReceipts(get_template)
+        else:
+            receipts = SignedReceipts(get_template, RECEIPT_TOKEN_SECRET, RECEIPT_TOKEN_TTL)
+        # Drained within the request (or on a daemon thread with OUTBOX_DRAIN=threaded);
+        # the rows it produced are written with one append_rows when it finishes, unless
+        # Sheets is failing, in which case they stay spooled until its backoff has passed
+        dispatch = (InlineDrain if OUTBOX_DRAIN == 'inline' else ThreadedDrain)(
+            after=sheet_writer.maybe_flush, budget=OUTBOX_DRAIN_BUDGET)
+    else:
+        # Logo, header, footer and table chrome are rendered once per process.
+        # Rendered receipts are kept under RECEIPTS_DIR within RECEIPTS_MAX_BYTES.
+        receipts = StoredReceipts(ReceiptStore(RECEIPTS_DIR, _receipt_template(), max_bytes=RECEIPTS_MAX_BYTES))
+        if deployment == ASYNC:
+            # One keep-alive pool for every checkout this process handles
+            razorpay = AsyncRazorpay(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET, pool_size=RAZORPAY_POOL_SIZE,
+                                     base_url=RAZORPAY_API_URL, timeout=(3.05, RAZORPAY_TIMEOUT))
+            get_client = lambda: razorpay
+            dispatch = TaskDispatch(LANES, limits={'email': SMTP_POOL_SIZE, 'sheets': 1}, retries=JOB_RETRIES)
+            # PDF rendering is CPU work; it runs here instead of on the event loop
+            from concurrent.futures import ThreadPoolExecutor
+            extra['executor'] = ThreadPoolExecutor(max_workers=RECEIPT_WORKERS, thread_name_prefix="receipts")
+        else:
+            # Keep-alive connection pool shared by all request threads in this worker
+            client = make_client(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET, base_url=RAZORPAY_API_URL)
+            get_client = lambda: client
+            # Post-payment side effects run as jobs instead of on ad-hoc threads. When a
+            # lane is full the job runs inline on the request thread, which slows the
+            # caller down rather than losing an email or a sheet row.
+            jobs = JobQueue()
+            jobs.add_lane('email', workers=SMTP_POOL_SIZE, max_queue=JOB_QUEUE_MAX, retries=JOB_RETRIES)
+            jobs.add_lane('sheets', workers=SHEETS_WORKERS, max_queue=JOB_QUEUE_MAX, retries=JOB_RETRIES)
+            jobs.add_lane('payments', workers=1, max_queue=JOB_QUEUE_MAX, retries=JOB_RETRIES)
+            dispatch = QueuedDispatch(jobs, LANES)
+
+    payments = (AsyncPaymentService if deployment == ASYNC else PaymentService)(
+        get_client, outbox, dispatch=dispatch, receipts=receipts,
+        mailer=mailer, sender_email=SENDER_EMAIL,
+        sheet_writer=sheet_writer, sheets_creds_file=creds_file,
+        order_cache=order_cache, order_store=order_store, razorpay_timeout=RAZORPAY_TIMEOUT,
+        metrics=metrics, razorpay_guard=razorpay_guard, mail_guard=mail_guard, limiter=limiter,
+        enquiries=enquiries, **extra)
+    for collector in (payments.gauges, razorpay_guard.gauges, mail_guard.gauges, sheets_guard.gauges):
+        metrics.collect(collector)
+    return payments
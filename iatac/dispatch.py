@@ -0,0 +1,169 @@
+"""How recorded side effects get run, per deployment.
+
+PaymentService records every email and sheet row in the outbox and then
+hands the entries to one of these:
+
+* QueuedDispatch - long-running workers (gunicorn): each entry becomes a
+  job on its lane of a JobQueue.
+* ThreadedDrain - serverless: one daemon thread works off the whole outbox
+  after the response is built.
+* InlineDrain - the same drain on the calling thread, for hosts that stop
+  background threads as soon as a response is sent.
+* TaskDispatch - the ASGI app: each entry becomes a task on the event loop
+  and its handler is a coroutine function.
+
+background() is for work that is not in the outbox (the contact mail).
+gauges() reports the strategy's queue depth and counters for /metrics.
+"""
+import asyncio
+import functools
+import threading
+import time
+
+from iatac.resilience import Unavailable
+
+
+def _run_entry(outbox, payment_id, kind, handler):
+    # One try; a failed entry waits out the outbox's backoff rather than the lane's retries
+    try:
+        outbox.run(payment_id, kind, handler)
+    except Exception as e:
+        print(f"Outbox {kind} for {payment_id} failed: {e}")
+
+
+class QueuedDispatch:
+    def __init__(self, jobs, lanes):
+        self.jobs = jobs
+        self.lanes = lanes  # outbox kind -> job lane
+
+    def start(self, outbox, handlers, entries):
+        """Queue each (payment_id, kind); running one twice is a no-op once it has completed"""
+        for payment_id, kind in entries:
+            job = functools.partial(_run_entry, outbox, payment_id, kind, handlers[kind])
+            job.__name__ = f"{kind} for {payment_id}"  # what the job queue logs
+            self.jobs.submit(self.lanes[kind], job)
+
+    def background(self, lane, fn, *args):
+        self.jobs.submit(lane, fn, *args)
+
+    def gauges(self):
+        for lane, stats in self.jobs.stats().items():
+            yield 'jobs_queue_depth', {'lane': lane}, stats['depth']
+            yield 'jobs_workers', {'lane': lane}, stats['workers']
+            for event in ('submitted', 'done', 'failed', 'retried', 'dropped', 'inline'):
+                yield 'jobs_total', {'lane': lane, 'event': event}, stats[event]
+
+
+class ThreadedDrain:
+    """Drains the outbox on a daemon thread, then calls ``after`` (e.g. a batch flush).
+
+    With a ``budget`` no entry is started more than that many seconds into a
+    drain, newest first (see Outbox.drain), so a backlog left by an outage is
+    worked off a slice per request instead of holding one request for all of it.
+
+    If the runtime freezes the instance mid-drain, the thread resumes on the
+    next warm invocation; entries it never reached are picked up by the next
+    drain, and claims held by a discarded instance expire.
+    """
+
+    def __init__(self, after=None, budget=None):
+        self.after = after
+        self.budget = budget
+        self._lock = threading.Lock()
+
+    def drain(self, outbox, handlers):
+        if not self._lock.acquire(blocking=False):
+            return  # another thread in this instance is already draining
+        try:
+            deadline = time.monotonic() + self.budget if self.budget else None
+            while outbox.drain(handlers, deadline=deadline):
+                pass
+            if self.after:
+                self.after()
+        except Exception as e:
+            print(f"Outbox Drain Error: {e}")
+        finally:
+            self._lock.release()
+
+    def start(self, outbox, handlers, entries=None):
+        threading.Thread(target=self.drain, args=(outbox, handlers), daemon=True).start()
+
+    def background(self, lane, fn, *args):
+        # A thread of our own could be frozen with the instance; run it now
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"{lane} job failed: {e}")
+
+    def gauges(self):
+        yield 'outbox_draining', {}, int(self._lock.locked())
+
+
+class InlineDrain(ThreadedDrain):
+    def start(self, outbox, handlers, entries=None):
+        self.drain(outbox, handlers)
+
+
+class TaskDispatch:
+    """Outbox entries as asyncio tasks, at most ``limits[lane]`` of a lane at a time.
+
+    Must be started from the event loop. A failed entry is released with the
+    outbox's backoff and picked up again by a later resume().
+    """
+
+    def __init__(self, lanes, limits=None, retries=3):
+        self.lanes = lanes  # outbox kind -> lane
+        self.limits = {lane: asyncio.Semaphore(n) for lane, n in (limits or {}).items()}
+        self.retries = retries
+        self._tasks = set()  # strong references until each task is done
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _limited(self, lane, fn, *args):
+        limit = self.limits.get(lane)
+        if limit is None:
+            return await fn(*args)
+        async with limit:
+            return await fn(*args)
+
+    async def _run(self, outbox, payment_id, kind, handler):
+        payload = await asyncio.to_thread(outbox.claim, payment_id, kind)
+        if payload is None:
+            return
+        try:
+            await self._limited(self.lanes[kind], handler, payload)
+        except Exception as e:
+            print(f"Outbox {kind} for {payment_id} failed: {e}")
+            await asyncio.to_thread(outbox.release, payment_id, kind, e)
+            return
+        await asyncio.to_thread(outbox.complete, payment_id, kind)
+
+    def start(self, outbox, handlers, entries):
+        for payment_id, kind in entries:
+            self._spawn(self._run(outbox, payment_id, kind, handlers[kind]))
+
+    async def _retrying(self, lane, fn, *args):
+        for attempt in range(1, self.retries + 2):
+            try:
+                return await self._limited(lane, fn, *args)
+            except Exception as e:
+                if attempt > self.retries or isinstance(e, Unavailable):
+                    print(f"{lane} job failed after {attempt} attempt(s): {e}")
+                    return
+                delay = 2 ** (attempt - 1)
+                print(f"{lane} job failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def background(self, lane, fn, *args):
+        self._spawn(self._retrying(lane, fn, *args))
+
+    def gauges(self):
+        yield 'tasks_in_flight', {}, len(self._tasks)
+
+    async def shutdown(self, timeout):
+        """Give tasks still in flight up to ``timeout`` seconds to finish"""
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
@@ -0,0 +1,212 @@
+"""Email bodies for payments and contact enquiries.
+
+app.py and the serverless handler send the same mails from these templates.
+Each is compiled on first use, so a cold start that sends no mail does
+not load Jinja. Every value is HTML-escaped, since names
+and messages come straight from the website's forms. Each mail has an HTML
+body and a plain-text alternative; the render functions return
+(subject, html, text) for build_message(..., text=text).
+"""
+import functools
+
+_TEMPLATES = {
+    'manager_payment': ("""
+<div style="font-family: Arial, sans-serif; padding: 20px; border: 1px solid #eee; border-radius: 8px;">
+    <h2 style="color: #007bff;">New Membership Payment Received</h2>
+    <p><strong>Customer Name:</strong> {{ d.name }}</p>
+    <p><strong>Service:</strong> {{ d.service }}</p>
+    <p><strong>Amount Paid:</strong> ₹{{ d.amount }}</p>
+    <p><strong>Mobile:</strong> {{ d.phone }}</p>
+    <p><strong>Email:</strong> {{ d.email }}</p>
+    <p><strong>Transaction ID:</strong> {{ d.payment_id }}</p>
+    <p><strong>Date/Time:</strong> {{ d.date }}</p>
+    <hr>
+    <p style="font-size: 0.9em; color: #666;">Sent from IATAC Payment System</p>
+</div>
+""", """New Membership Payment Received
+
+Customer Name: {{ d.name }}
+Service: {{ d.service }}
+Amount Paid: Rs. {{ d.amount }}
+Mobile: {{ d.phone }}
+Email: {{ d.email }}
+Transaction ID: {{ d.payment_id }}
+Date/Time: {{ d.date }}
+
+--
+Sent from IATAC Payment System
+"""),
+
+    'customer_payment': ("""
+<div style="font-family: Arial, sans-serif; padding: 20px; border: 1px solid #eee; border-radius: 8px;">
+    <h2 style="color: #28a745;">Payment Successful!</h2>
+    <p>Dear {{ d.name }},</p>
+    <p>Your payment for <strong>{{ d.service }}</strong> has been successfully received.</p>
+    <p><strong>Amount:</strong> ₹{{ d.amount }}</p>
+    <p><strong>Transaction ID:</strong> {{ d.payment_id }}</p>
+    {% if attached %}
+    <p>Your official receipt is attached to this email. Please save it for your records.</p>
+    {% else %}
+    <p>You can download your official receipt from the website or save this email for your records.</p>
+    {% endif %}
+    <br>
+    <p>Best Regards,<br><strong>Team IATAC</strong></p>
+</div>
+""", """Payment Successful!
+
+Dear {{ d.name }},
+
+Your payment for {{ d.service }} has been successfully received.
+
+Amount: Rs. {{ d.amount }}
+Transaction ID: {{ d.payment_id }}
+
+{% if attached %}
+Your official receipt is attached to this email. Please save it for your records.
+{% else %}
+You can download your official receipt from the website or save this email for your records.
+{% endif %}
+
+Best Regards,
+Team IATAC
+"""),
+
+    'contact': ("""
+<div style="font-family: Arial, sans-serif; padding: 25px; border: 1px solid #e1e1e1; border-radius: 12px; max-width: 600px; color: #333;">
+    <h2 style="color: #007bff; margin-top: 0; border-bottom: 2px solid #007bff; padding-bottom: 10px;">New Website Enquiry</h2>
+    <p style="margin-top: 20px;">You have received a new message from the <strong>iatac.in</strong> website.</p>
+
+    <table style="width: 100%; border-collapse: collapse; margin-top: 20px;">
+        <tr>
+            <td style="padding: 10px; border: 1px solid #eee; background: #f9f9f9; font-weight: bold; width: 30%;">Name</td>
+            <td style="padding: 10px; border: 1px solid #eee;">{{ name }}</td>
+        </tr>
+        <tr>
+            <td style="padding: 10px; border: 1px solid #eee; background: #f9f9f9; font-weight: bold;">Mobile</td>
+            <td style="padding: 10px; border: 1px solid #eee;">{{ mobile }}</td>
+        </tr>
+        <tr>
+            <td style="padding: 10px; border: 1px solid #eee; background: #f9f9f9; font-weight: bold;">Email</td>
+            <td style="padding: 10px; border: 1px solid #eee;">{{ email }}</td>
+        </tr>
+    </table>
+
+    <div style="margin-top: 20px; padding: 15px; background: #f4f7f6; border-radius: 8px; border-left: 4px solid #007bff;">
+        <h4 style="margin: 0 0 10px 0; color: #007bff;">Message:</h4>
+        <p style="margin: 0; line-height: 1.6; white-space: pre-line;">{{ message }}</p>
+    </div>
+
+    <div style="margin-top: 25px; font-size: 0.85rem; color: #888; text-align: center; border-top: 1px solid #eee; padding-top: 15px;">
+        Sent from IATAC Contact Form | {{ sent_at }}
+    </div>
+</div>
+""", """New Website Enquiry
+
+You have received a new message from the iatac.in website.
+
+Name: {{ name }}
+Mobile: {{ mobile }}
+Email: {{ email }}
+
+Message:
+{{ message }}
+
+--
+Sent from IATAC Contact Form | {{ sent_at }}
+"""),
+
+    'contact_digest': ("""
+<div style="font-family: Arial, sans-serif; padding: 25px; border: 1px solid #e1e1e1; border-radius: 12px; max-width: 600px; color: #333;">
+    <h2 style="color: #007bff; margin-top: 0; border-bottom: 2px solid #007bff; padding-bottom: 10px;">Website Enquiries</h2>
+    <p style="margin-top: 20px;">{{ enquiries|length }} new message(s) from the <strong>iatac.in</strong> website.</p>
+    {% for e in enquiries %}
+
+    <table style="width: 100%; border-collapse: collapse; margin-top: 20px;">
+        <tr>
+            <td style="padding: 10px; border: 1px solid #eee; background: #f9f9f9; font-weight: bold; width: 30%;">Name</td>
+            <td style="padding: 10px; border: 1px solid #eee;">{{ e.name }}{% if e.urgent %} <strong style="color: #dc3545;">(urgent)</strong>{% endif %}</td>
+        </tr>
+        <tr>
+            <td style="padding: 10px; border: 1px solid #eee; background: #f9f9f9; font-weight: bold;">Mobile</td>
+            <td style="padding: 10px; border: 1px solid #eee;">{{ e.mobile }}</td>
+        </tr>
+        <tr>
+            <td style="padding: 10px; border: 1px solid #eee; background: #f9f9f9; font-weight: bold;">Email</td>
+            <td style="padding: 10px; border: 1px solid #eee;">{{ e.email }}</td>
+        </tr>
+        <tr>
+            <td style="padding: 10px; border: 1px solid #eee; background: #f9f9f9; font-weight: bold;">Received</td>
+            <td style="padding: 10px; border: 1px solid #eee;">{{ e.received_at }} (ref {{ e.id }})</td>
+        </tr>
+    </table>
+    <div style="margin-top: 10px; padding: 15px; background: #f4f7f6; border-radius: 8px; border-left: 4px solid #007bff;">
+        <p style="margin: 0; line-height: 1.6; white-space: pre-line;">{{ e.message }}</p>
+    </div>
+    {% endfor %}
+
+    <div style="margin-top: 25px; font-size: 0.85rem; color: #888; text-align: center; border-top: 1px solid #eee; padding-top: 15px;">
+        Sent from IATAC Contact Form
+    </div>
+</div>
+""", """Website Enquiries
+
+{{ enquiries|length }} new message(s) from the iatac.in website.
+{% for e in enquiries %}
+
+==== {{ e.name }}{% if e.urgent %} (urgent){% endif %} ====
+Mobile: {{ e.mobile }}
+Email: {{ e.email }}
+Received: {{ e.received_at }} (ref {{ e.id }})
+
+{{ e.message }}
+{% endfor %}
+
+--
+Sent from IATAC Contact Form
+"""),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _env():
+    from jinja2 import Environment, StrictUndefined
+
+    return Environment(autoescape=True, undefined=StrictUndefined, trim_blocks=True, lstrip_blocks=True)
+
+
+@functools.lru_cache(maxsize=None)
+def _compiled(template):
+    """(html template, text template) for a name; the text one must not escape"""
+    html, text = _TEMPLATES[template]
+    return _env().from_string(html), _env().from_string("{% autoescape false %}" + text + "{% endautoescape %}")
+
+
+def _one_line(value):
+    """Form input made safe for a header: no line breaks"""
+    return " ".join(str(value).split())
+
+
+def _render(template, **context):
+    html, text = _compiled(template)
+    return html.render(**context), text.render(**context)
+
+
+def manager_payment_email(details):
+    return ("Custom Payment Alert",) + _render('manager_payment', d=details)
+
+
+def customer_payment_email(details, attached=False):
+    """``attached``: whether the receipt PDF goes out with the mail"""
+    return ("IATAC Payment Confirmation",) + _render('customer_payment', d=details, attached=attached)
+
+
+def contact_email(name, mobile, email, message, sent_at):
+    html, text = _render('contact', name=name, mobile=mobile or "", email=email, message=message, sent_at=sent_at)
+    return f"New Contact Enquiry from {_one_line(name)}", html, text
+
+
+def contact_digest_email(enquiries):
+    """One mail for several buffered enquiries (iatac.enquiries), oldest first"""
+    html, text = _render('contact_digest', enquiries=enquiries)
+    noun = "Enquiry" if len(enquiries) == 1 else "Enquiries"
+    return f"{len(enquiries)} New Contact {noun}", html, text
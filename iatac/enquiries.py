@@ -0,0 +1,114 @@
+"""Contact enquiries held for a digest mail.
+
+With the digest on, contact_submit stores the enquiry here and answers at
+once; the office gets the enquiries together in one mail per ``max_items``
+enquiries or ``max_wait`` seconds, whichever comes first. Urgent enquiries
+(an ``urgent`` flag, or one of ``urgent_words`` in the message) are mailed
+on their own straight away, and fall back to the next digest if that fails.
+
+The SQLite file is shared by every gunicorn worker. An enquiry is claimed
+before it is mailed and deleted only once the mail server has accepted the
+mail that carries it; a claim left by a worker that died expires after
+``lease`` seconds.
+"""
+import json
+import re
+import sqlite3
+import time
+from contextlib import closing
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS enquiries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    claimed_at REAL
+)
+"""
+
+# Enquiries that nobody is mailing right now
+_FREE = "(claimed_at IS NULL OR claimed_at < ?)"
+
+
+class EnquiryBuffer:
+    def __init__(self, path, max_items=25, max_wait=900, lease=120, urgent_words=('urgent',)):
+        self.path = path
+        self.max_items = max_items
+        self.max_wait = max_wait
+        self.lease = lease
+        words = "|".join(map(re.escape, urgent_words))
+        self._urgent = re.compile(rf"\b({words})\b", re.I) if words else None
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def is_urgent(self, enquiry):
+        if enquiry.get('urgent'):
+            return True
+        return bool(self._urgent and self._urgent.search(enquiry.get('message') or ""))
+
+    def _due(self, conn, now):
+        count, oldest = conn.execute(
+            f"SELECT COUNT(*), MIN(created_at) FROM enquiries WHERE {_FREE}", (now - self.lease,)
+        ).fetchone()
+        return count >= self.max_items or (count > 0 and oldest <= now - self.max_wait)
+
+    def add(self, enquiry):
+        """Store an enquiry; returns (its ID, whether a digest is now due)"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cur = conn.execute("INSERT INTO enquiries (payload, created_at) VALUES (?, ?)",
+                               (json.dumps(enquiry), now))
+            return cur.lastrowid, self._due(conn, now)
+
+    def due(self):
+        with closing(self._connect()) as conn:
+            return self._due(conn, time.time())
+
+    def pending(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM enquiries").fetchone()[0]
+
+    def claim(self, ids=None):
+        """Take the oldest ``max_items`` free enquiries, or just ``ids``; returns (ids, enquiries)"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if ids is None:
+                rows = conn.execute(
+                    f"SELECT id, payload FROM enquiries WHERE {_FREE} ORDER BY id LIMIT ?",
+                    (now - self.lease, self.max_items)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    f"SELECT id, payload FROM enquiries WHERE {_FREE} AND id IN ({','.join('?' * len(ids))})",
+                    (now - self.lease, *ids)
+                ).fetchall()
+            conn.executemany("UPDATE enquiries SET claimed_at = ? WHERE id = ?", [(now, row[0]) for row in rows])
+            conn.execute("COMMIT")
+        return [row[0] for row in rows], [dict(json.loads(row[1]), id=row[0]) for row in rows]
+
+    def complete(self, ids):
+        with closing(self._connect()) as conn:
+            conn.executemany("DELETE FROM enquiries WHERE id = ?", [(i,) for i in ids])
+
+    def release(self, ids):
+        """Hand claimed enquiries back after a failed send, for the next digest"""
+        with closing(self._connect()) as conn:
+            conn.executemany("UPDATE enquiries SET claimed_at = NULL WHERE id = ?", [(i,) for i in ids])
+
+    def flush(self, send, ids=None):
+        """claim(), send(enquiries), then complete() or release(). Returns how many were sent."""
+        ids, enquiries = self.claim(ids)
+        if not enquiries:
+            return 0
+        try:
+            send(enquiries)
+        except Exception:
+            self.release(ids)
+            raise
+        self.complete(ids)
+        return len(ids)
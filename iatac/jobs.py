@@ -0,0 +1,167 @@
+"""Bounded background job queue.
+
+Replaces one-thread-per-side-effect with a fixed set of worker threads per
+job type ("lane"), so a burst of payments queues work instead of spawning
+threads without limit.
+"""
+import queue
+import threading
+import time
+
+from iatac.resilience import Unavailable
+
+_STOP = object()
+
+# What submit() does when a lane's queue is already full
+OVERFLOW_POLICIES = ('inline', 'drop', 'reject')
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when a lane is full and its overflow policy is 'reject'"""
+
+
+class _Lane:
+    def __init__(self, name, workers, max_queue, overflow, retries, backoff, max_backoff):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.name = name
+        self.workers = workers
+        self.overflow = overflow
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.threads = []
+        self.stats = {"submitted": 0, "done": 0, "failed": 0, "retried": 0, "dropped": 0, "inline": 0}
+        self.lock = threading.Lock()  # workers and submitting threads all count
+
+    def count(self, event):
+        with self.lock:
+            self.stats[event] += 1
+
+
+class JobQueue:
+    """Named lanes of worker threads, each with a bounded queue.
+
+    Each lane has its own concurrency (``workers``), queue depth limit
+    (``max_queue``) and overflow policy:
+
+    - ``inline``: run the job in the submitting thread (backpressure, nothing lost)
+    - ``drop``: log and discard the job
+    - ``reject``: raise QueueFull
+
+    A job that raises is retried up to ``retries`` more times with
+    exponential backoff; a job refused by a Guard (Unavailable) or failing
+    once shutdown() has begun is not retried. Jobs are logged by ``fn.__name__``, so give a partial one.
+    Workers start on first use, and shutdown() stops accepting work and lets
+    queued jobs finish.
+    """
+
+    def __init__(self):
+        self._lanes = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def add_lane(self, name, workers=1, max_queue=100, overflow='inline',
+                 retries=3, backoff=1.0, max_backoff=30.0):
+        self._lanes[name] = _Lane(name, workers, max_queue, overflow, retries, backoff, max_backoff)
+
+    def _start(self, lane):
+        with self._lock:
+            if lane.threads:
+                return
+            for i in range(lane.workers):
+                t = threading.Thread(target=self._work, args=(lane,), name=f"jobs-{lane.name}-{i}", daemon=True)
+                t.start()
+                lane.threads.append(t)
+
+    def submit(self, lane_name, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) on a lane. Returns False if the job was dropped."""
+        lane = self._lanes[lane_name]
+        job = (fn, args, kwargs)
+        lane.count("submitted")
+
+        if self._stopping.is_set():
+            lane.count("inline")
+            self._run(lane, job, retries=0)
+            return True
+
+        self._start(lane)
+        try:
+            lane.queue.put_nowait(job)
+            return True
+        except queue.Full:
+            pass
+
+        if lane.overflow == 'reject':
+            lane.count("dropped")
+            raise QueueFull(f"Job queue '{lane.name}' is full")
+        if lane.overflow == 'drop':
+            lane.count("dropped")
+            print(f"Job queue '{lane.name}' full, dropping {fn.__name__}")
+            return False
+        lane.count("inline")
+        self._run(lane, job, retries=0)
+        return True
+
+    def _run(self, lane, job, retries):
+        fn, args, kwargs = job
+        delay = lane.backoff
+        for attempt in range(retries + 1):
+            try:
+                fn(*args, **kwargs)
+                lane.count("done")
+                return
+            except Exception as e:
+                # A refused call would only be refused again within the backoff, and shutting
+                # down leaves no time to back off; outbox entries are picked up again later
+                if attempt == retries or self._stopping.is_set() or isinstance(e, Unavailable):
+                    lane.count("failed")
+                    print(f"Job {fn.__name__} failed after {attempt + 1} attempt(s): {e}")
+                    return
+                lane.count("retried")
+                print(f"Job {fn.__name__} failed ({e}), retrying in {delay:.1f}s")
+                if self._stopping.wait(delay):
+                    lane.count("failed")
+                    print(f"Job {fn.__name__} not retried, shutting down")
+                    return
+                delay = min(delay * 2, lane.max_backoff)
+
+    def _work(self, lane):
+        while True:
+            job = lane.queue.get()
+            try:
+                if job is _STOP:
+                    return
+                self._run(lane, job, lane.retries)
+            finally:
+                lane.queue.task_done()
+
+    def stats(self):
+        """Per-lane counters plus current queue depth, for logging and metrics"""
+        stats = {}
+        for name, lane in self._lanes.items():
+            with lane.lock:
+                stats[name] = dict(lane.stats, depth=lane.queue.qsize(), workers=len(lane.threads))
+        return stats
+
+    def shutdown(self, timeout=20):
+        """Stop accepting jobs and wait up to ``timeout`` seconds for queued ones to finish"""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        deadline = time.monotonic() + timeout
+        for lane in self._lanes.values():
+            for _ in lane.threads:
+                # A full queue must not hold shutdown past its deadline; the
+                # workers are daemons and end with the process either way
+                try:
+                    lane.queue.put_nowait(_STOP)
+                except queue.Full:
+                    break
+        for lane in self._lanes.values():
+            for t in lane.threads:
+                t.join(max(0, deadline - time.monotonic()))
+        pending = sum(lane.queue.qsize() for lane in self._lanes.values())
+        if pending:
+            print(f"Job queue shut down with {pending} job(s) still queued")
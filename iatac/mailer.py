@@ -0,0 +1,275 @@
+"""Pooled SMTP delivery.
+
+Keeps a few logged-in SMTP sessions open and lends them out per send, so a
+payment does not pay for a TLS handshake and login on every message. Each
+mail is sent on its own: a payment's mails are separate outbox entries, so
+one that fails is retried without sending the other again.
+AsyncSMTPPool does the same for the ASGI app, over aiosmtplib.
+
+smtplib and the email package are imported on first use, so a serverless
+cold start that sends no mail does not load them.
+"""
+import asyncio
+import queue
+import threading
+import time
+
+
+def build_message(sender, to_email, subject, body, subtype='html', text=None, attachments=()):
+    """Build the message; with ``text`` the body goes out as multipart/alternative.
+
+    ``attachments`` are (filename, PDF bytes) pairs added after the body.
+    """
+    from email.mime.application import MIMEApplication
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    if text is None:
+        msg.attach(MIMEText(body, subtype))
+    else:
+        alternative = MIMEMultipart('alternative')
+        alternative.attach(MIMEText(text, 'plain', 'utf-8'))  # least preferred first
+        alternative.attach(MIMEText(body, subtype, 'utf-8'))
+        msg.attach(alternative)
+    for filename, data in attachments:
+        part = MIMEApplication(data, _subtype='pdf')
+        part.add_header('Content-Disposition', 'attachment', filename=filename)
+        msg.attach(part)
+    return msg
+
+
+class SMTPPool:
+    """Bounded pool of long-lived, authenticated SMTP connections.
+
+    At most ``size`` sessions exist at once; callers beyond that wait for a
+    free one. Idle sessions are NOOP-checked before reuse once they have been
+    idle for ``check_after`` seconds and dropped after ``max_idle`` seconds,
+    since Gmail closes quiet connections on its own.
+    """
+
+    def __init__(self, host, port, username, password, size=2, use_ssl=True,
+                 timeout=30, check_after=10, max_idle=240):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self._idle = queue.LifoQueue()  # (connection, last_used)
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        import smtplib
+
+        if self.use_ssl:
+            conn = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.username:
+                conn.login(self.username, self.password)
+        except Exception:
+            self._discard(conn)
+            raise
+        return conn
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.quit()
+        except Exception:
+            conn.close()
+
+    def _healthy(self, conn, last_used):
+        idle_for = time.monotonic() - last_used
+        if idle_for < self.check_after:
+            return True
+        if idle_for > self.max_idle:
+            return False
+        try:
+            return conn.noop()[0] == 250
+        except OSError:  # smtplib.SMTPException included
+            return False
+
+    @staticmethod
+    def _message_errors():
+        # Errors where smtplib has already RSET the transaction, so the session is reusable
+        import smtplib
+
+        return smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError
+
+    @classmethod
+    def is_outage(cls, exc):
+        """Whether a send failed because of the server or the connection rather than the message"""
+        return not isinstance(exc, cls._message_errors())
+
+    def _acquire(self):
+        # A free session is normally seconds away; waiting longer means they are all stuck
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No SMTP session free after {self.timeout}s")
+        try:
+            while True:
+                try:
+                    conn, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if self._healthy(conn, last_used):
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn):
+        if conn is not None:
+            self._idle.put((conn, time.monotonic()))
+        self._slots.release()
+
+    def send(self, msg):
+        """Send one message over a pooled session.
+
+        A session that turns out to be dead is replaced once; any other
+        failure is raised after the session is returned or dropped.
+        """
+        message_errors = self._message_errors()
+        conn = self._acquire()
+        try:
+            try:
+                conn.send_message(msg)
+            except message_errors:
+                raise
+            except OSError:
+                self._discard(conn)
+                conn = None
+                conn = self._connect()
+                conn.send_message(msg)
+        except message_errors:
+            self._release(conn)
+            raise
+        except Exception:
+            if conn is not None:
+                self._discard(conn)
+            self._release(None)
+            raise
+        self._release(conn)
+
+    def close(self):
+        """Log out of every idle session"""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+
+class AsyncSMTPPool:
+    """SMTPPool for asyncio callers: same limits and idle checks, sessions from aiosmtplib"""
+
+    def __init__(self, host, port, username, password, size=4, use_ssl=True,
+                 timeout=30, check_after=10, max_idle=240):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_idle = max_idle
+        self._idle = []  # (connection, last_used), most recently used last
+        self._slots = asyncio.Semaphore(size)
+
+    async def _connect(self):
+        import aiosmtplib
+
+        conn = aiosmtplib.SMTP(hostname=self.host, port=self.port, use_tls=self.use_ssl, timeout=self.timeout)
+        await conn.connect()
+        try:
+            if self.username:
+                await conn.login(self.username, self.password)
+        except Exception:
+            await self._discard(conn)
+            raise
+        return conn
+
+    @staticmethod
+    async def _discard(conn):
+        try:
+            await conn.quit()
+        except Exception:
+            conn.close()
+
+    async def _healthy(self, conn, last_used):
+        idle_for = time.monotonic() - last_used
+        if idle_for < self.check_after:
+            return True
+        if idle_for > self.max_idle or not conn.is_connected:
+            return False
+        try:
+            return (await conn.noop()).code == 250
+        except Exception:
+            return False
+
+    @staticmethod
+    def _message_errors():
+        import aiosmtplib
+
+        return aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPSenderRefused, aiosmtplib.SMTPDataError
+
+    @classmethod
+    def is_outage(cls, exc):
+        return not isinstance(exc, cls._message_errors())
+
+    async def _acquire(self):
+        while self._idle:
+            conn, last_used = self._idle.pop()
+            if await self._healthy(conn, last_used):
+                return conn
+            await self._discard(conn)
+        return await self._connect()
+
+    async def send(self, msg):
+        """SMTPPool.send(): a dead session is replaced once, other errors raised"""
+        import aiosmtplib
+
+        message_errors = self._message_errors()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No SMTP session free after {self.timeout}s") from None
+        try:
+            conn = await self._acquire()
+            try:
+                try:
+                    await conn.send_message(msg)
+                except message_errors:
+                    raise
+                except (OSError, aiosmtplib.SMTPException):
+                    await self._discard(conn)
+                    conn = None
+                    conn = await self._connect()
+                    await conn.send_message(msg)
+            except message_errors:
+                self._idle.append((conn, time.monotonic()))
+                raise
+            except BaseException:
+                if conn is not None:
+                    await self._discard(conn)
+                raise
+            self._idle.append((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        """Log out of every idle session"""
+        while self._idle:
+            conn, _ = self._idle.pop()
+            await self._discard(conn)
@@ -0,0 +1,158 @@
+"""Stage timings and counters, served as Prometheus text on /metrics.
+
+PaymentService times each stage of a checkout with ``metrics.stage(name)``
+(signature check, Razorpay calls, receipt rendering, SMTP, Sheets). A stage
+feeds the ``iatac_stage_seconds`` histogram and an ok/error counter. Inside
+a request started with begin_request() it is also noted for that response's
+Server-Timing header, so a slow verify shows in the browser's network tab
+where its time went.
+
+Gauges such as queue depth and outbox backlog are read from collectors when
+/metrics is rendered. Values are kept per process: each gunicorn worker and
+each serverless instance has its own, and a scrape sees the one that
+answered it.
+"""
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+
+PREFIX = "iatac"
+
+# Upper bounds in seconds; SMTP and Sheets calls routinely take a second or more
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Stages seen by the request being handled in this thread or task
+_timings = contextvars.ContextVar('iatac_request_timings', default=None)
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(name, labels, value):
+    if labels:
+        pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+        return f"{PREFIX}_{name}{{{pairs}}} {value:g}"
+    return f"{PREFIX}_{name} {value:g}"
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            yield _format(f"{name}_bucket", labels + (("le", bound),), cumulative)
+        yield _format(f"{name}_sum", labels, self.sum)
+        yield _format(f"{name}_count", labels, cumulative)
+
+
+class Metrics:
+    """Thread-safe histograms and counters for one process.
+
+    collect(fn) registers a callable returning ``(name, labels, value)``
+    tuples, read on every render(); names ending in ``_total`` are reported
+    as counters, the rest as gauges.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}  # name -> {labels: _Histogram}
+        self._counters = {}  # name -> {labels: value}
+        self._collectors = []
+
+    def count(self, name, amount=1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = _Histogram(self.buckets)
+            series[key].observe(seconds)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the block as stage ``name``; an exception counts it as an error and is re-raised"""
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            yield
+            outcome = 'ok'
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe('stage_seconds', elapsed, stage=name)
+            self.count('stage_total', stage=name, outcome=outcome)
+            timings = _timings.get()
+            if timings is not None:
+                timings.append((name, elapsed))
+
+    def collect(self, fn):
+        self._collectors.append(fn)
+
+    # Per-request timing
+
+    def begin_request(self):
+        """Start noting stages for the current request; pass the result to the calls below"""
+        timings = []
+        return _timings.set(timings), timings, time.perf_counter()
+
+    @staticmethod
+    def server_timing(request):
+        """Server-Timing header value: the stages seen so far, then the total"""
+        _, timings, start = request
+        stages = timings + [('total', time.perf_counter() - start)]
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages)
+
+    def end_request(self, request, route, status):
+        """Record the request's duration and status; call it in the context begin_request() ran in"""
+        token, _, start = request
+        self.observe('http_request_seconds', time.perf_counter() - start, route=route)
+        self.count('http_requests_total', route=route, status=status)
+        _timings.reset(token)
+
+    # Exposition
+
+    def render(self):
+        """Everything recorded so far in the Prometheus text format"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {PREFIX}_{name} histogram")
+                for labels, histogram in sorted(series.items()):
+                    lines.extend(histogram.lines(name, labels))
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {PREFIX}_{name} counter")
+                lines.extend(_format(name, labels, value) for labels, value in sorted(series.items()))
+
+        gauges = {}
+        for fn in self._collectors:
+            try:
+                for name, labels, value in fn():
+                    gauges.setdefault(name, []).append((_labels(labels), value))
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+        for name, series in sorted(gauges.items()):
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            lines.extend(_format(name, labels, value) for labels, value in series)
+        return "\n".join(lines) + "\n"
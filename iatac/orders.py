@@ -0,0 +1,204 @@
+"""Razorpay order creation helpers.
+
+A double-clicked Pay button or a retried request should get back the order
+that was already created instead of a second one, so orders are cached for
+a short window under a hash of what was being bought and by whom, plus the
+client's Idempotency-Key header when it sends one. The buyer's details are
+always part of the key: a corrected email, phone or name must get a new
+order, since the notes of the old one are what the receipt goes to.
+
+Created orders are also written to a local SQLite store, so verification
+can read the notes and receipt back from disk instead of asking Razorpay.
+The store also records which orders have been paid: the cache is per
+process, and another worker must not hand out an order paid through this one.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+PAID_SCHEMA = """
+CREATE TABLE IF NOT EXISTS paid_orders (
+    order_id TEXT PRIMARY KEY,
+    paid_at REAL NOT NULL
+)
+"""
+
+_receipt_lock = threading.Lock()
+_receipt_last = 0
+
+
+def new_receipt_id(prefix="IATAC"):
+    """Receipt ID unique across workers: millisecond clock, process ID and random bits.
+
+    Razorpay caps receipts at 40 characters; these are 27.
+    """
+    global _receipt_last
+    with _receipt_lock:
+        # Strictly increasing within the process even if the clock stalls or steps back
+        _receipt_last = max(_receipt_last + 1, int(time.time() * 1000))
+        stamp = _receipt_last
+    return f"{prefix}_{stamp:011X}{os.getpid() & 0xFFFF:04X}{secrets.token_hex(3).upper()}"
+
+
+def order_key(idempotency_key, service, name, email, phone):
+    """Cache key for a create_order request"""
+    buyer = (" ".join((name or "").split()).lower(), (email or "").strip().lower(), (phone or "").strip())
+    if idempotency_key:
+        parts = ("key", idempotency_key.strip(), service, *buyer)
+    else:
+        parts = ("form", service, *buyer)
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode()).hexdigest()
+
+
+class OrderCache:
+    """Orders created in the last ``ttl`` seconds, at most ``max_entries`` of them.
+
+    get_or_create() runs ``create`` once per key: concurrent requests with
+    the same key wait for the first one and share its order. Failures are
+    not cached.
+    """
+
+    def __init__(self, ttl=600, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._orders = OrderedDict()  # key -> (expires_at, order)
+        self._pending = {}  # key -> Event set when the creating request finishes
+
+    def _get(self, key):
+        entry = self._orders.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._orders[key]
+            return None
+        return entry[1]
+
+    def get_or_create(self, key, create):
+        """Return (order, created) for ``key``, calling ``create()`` only on a miss"""
+        while True:
+            with self._lock:
+                order = self._get(key)
+                if order is not None:
+                    return order, False
+                waiting = self._pending.get(key)
+                if waiting is None:
+                    done = self._pending[key] = threading.Event()
+                    break
+            waiting.wait()
+
+        try:
+            order = create()
+            self._put(key, order)
+            return order, True
+        finally:
+            with self._lock:
+                del self._pending[key]
+            done.set()
+
+    async def aget_or_create(self, key, create):
+        """get_or_create() for the ASGI app: ``create`` is a coroutine function.
+
+        Waiters await an asyncio.Event, so one cache must not be shared with
+        threaded callers of get_or_create().
+        """
+        while True:
+            with self._lock:
+                order = self._get(key)
+                if order is not None:
+                    return order, False
+                waiting = self._pending.get(key)
+                if waiting is None:
+                    done = self._pending[key] = asyncio.Event()
+                    break
+            await waiting.wait()
+
+        try:
+            order = await create()
+            self._put(key, order)
+            return order, True
+        finally:
+            with self._lock:
+                del self._pending[key]
+            done.set()
+
+    def _put(self, key, order):
+        with self._lock:
+            self._orders[key] = (time.monotonic() + self.ttl, order)
+            self._orders.move_to_end(key)
+            while len(self._orders) > self.max_entries:
+                self._orders.popitem(last=False)
+
+    def forget_order(self, order_id):
+        """Drop a paid order so buying the same thing again creates a new one (in this process;
+        OrderStore.mark_paid() tells the others)"""
+        with self._lock:
+            for key in [k for k, (_, order) in self._orders.items() if order.get('id') == order_id]:
+                del self._orders[key]
+
+
+class OrderStore:
+    """Orders created here in the last ``ttl`` seconds, by order ID.
+
+    The file can be shared by every gunicorn worker, so verify_payment finds
+    the order whichever worker created it. get() returns None for orders that
+    were created elsewhere or have expired; callers then ask Razorpay.
+    Paid order IDs are kept for as long.
+    """
+
+    def __init__(self, path, ttl=24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+            conn.execute(PAID_SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS orders_created_at ON orders (created_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def put(self, order):
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO orders (order_id, payload, created_at) VALUES (?, ?, ?)",
+                (order['id'], json.dumps(order), now)
+            )
+            conn.execute("DELETE FROM orders WHERE created_at < ?", (now - self.ttl,))
+
+    def get(self, order_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT payload FROM orders WHERE order_id = ? AND created_at >= ?",
+                (order_id, time.time() - self.ttl)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def mark_paid(self, order_id):
+        """Record that an order has been paid, so no worker's OrderCache hands it out again"""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR IGNORE INTO paid_orders (order_id, paid_at) VALUES (?, ?)", (order_id, now))
+            conn.execute("DELETE FROM paid_orders WHERE paid_at < ?", (now - self.ttl,))
+
+    def is_paid(self, order_id):
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT 1 FROM paid_orders WHERE order_id = ?", (order_id,)
+            ).fetchone() is not None
@@ -0,0 +1,233 @@
+"""Durable outbox for post-payment side effects.
+
+verify_payment records what still has to happen for a payment (emails, the
+sheet row) in a local SQLite file and returns; the entries are then worked
+off by a background worker or a later invocation. Entries are keyed by
+(razorpay_payment_id, kind), so recording or running the same payment twice
+is harmless.
+
+Entries given up on are kept; ``python -m iatac.outbox [path]`` lists them
+and ``python -m iatac.outbox [path] retry <payment_id> <kind>`` queues one
+again.
+"""
+import json
+import sqlite3
+import sys
+import time
+from contextlib import closing
+
+from iatac.resilience import Unavailable
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    payment_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_at REAL,
+    available_at REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_error TEXT,
+    PRIMARY KEY (payment_id, kind)
+)
+"""
+
+
+class Outbox:
+    """SQLite-backed log of pending side effects.
+
+    An entry is claimed before it runs and stays claimed for ``lease``
+    seconds, so two workers (or two gunicorn processes sharing the file) do
+    not run it at the same time; a claim left behind by a crashed worker
+    expires and the entry becomes pending again.
+
+    A failed entry is held back before its next try: ``retry_delay``
+    seconds, doubling with every attempt up to ``max_retry_delay``. One
+    still failing ``give_up_after`` seconds after it was recorded is marked
+    failed, reported on stderr and no longer picked up.
+    """
+
+    def __init__(self, path, lease=120, retry_delay=30, max_retry_delay=3600, give_up_after=48 * 3600):
+        self.path = path
+        self.lease = lease
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.give_up_after = give_up_after
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def put(self, payment_id, entries):
+        """Record {kind: payload} for a payment in one transaction; existing kinds are left alone"""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox (payment_id, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+                [(payment_id, kind, json.dumps(payload), now) for kind, payload in entries.items()]
+            )
+
+    def has(self, payment_id, kind):
+        """Whether an entry of this kind was ever recorded for the payment"""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT 1 FROM outbox WHERE payment_id = ? AND kind = ?", (payment_id, kind)
+            ).fetchone() is not None
+
+    def claim(self, payment_id, kind):
+        """Take the entry if it is pending and not held by someone else. Returns its payload or None."""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            cur = conn.execute(
+                "UPDATE outbox SET claimed_at = ?, attempts = attempts + 1 "
+                "WHERE payment_id = ? AND kind = ? AND status = 'pending' "
+                "AND available_at <= ? AND (claimed_at IS NULL OR claimed_at < ?)",
+                (now, payment_id, kind, now, now - self.lease)
+            )
+            if cur.rowcount == 0:
+                return None
+            row = conn.execute(
+                "SELECT payload FROM outbox WHERE payment_id = ? AND kind = ?", (payment_id, kind)
+            ).fetchone()
+        return json.loads(row[0])
+
+    def complete(self, payment_id, kind):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE outbox SET status = 'done', claimed_at = NULL, last_error = NULL "
+                "WHERE payment_id = ? AND kind = ?",
+                (payment_id, kind)
+            )
+
+    def release(self, payment_id, kind, error, delay=None):
+        """Give a claimed entry back after a failure, to be retried after ``delay`` seconds
+        (by default the backoff for its attempts so far). Returns False if it was given up on.
+
+        A call a Guard refused (Unavailable) was never made: it costs no attempt
+        and the entry waits at least the guard's ``retry_after``.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT attempts, created_at FROM outbox WHERE payment_id = ? AND kind = ?", (payment_id, kind)
+            ).fetchone()
+            if row is None:
+                return False
+            attempts, created_at = row
+            if now - created_at >= self.give_up_after:
+                conn.execute(
+                    "UPDATE outbox SET status = 'failed', claimed_at = NULL, last_error = ? "
+                    "WHERE payment_id = ? AND kind = ?",
+                    (str(error), payment_id, kind)
+                )
+                print(f"OUTBOX GAVE UP on {kind} for {payment_id} after {attempts} attempt(s) "
+                      f"over {(now - created_at) / 3600:.1f}h: {error}", file=sys.stderr)
+                return False
+            if isinstance(error, Unavailable):
+                conn.execute(
+                    "UPDATE outbox SET claimed_at = NULL, attempts = MAX(attempts - 1, 0), available_at = ?, "
+                    "last_error = ? WHERE payment_id = ? AND kind = ?",
+                    (now + max(error.retry_after, delay or 0), str(error), payment_id, kind)
+                )
+                return True
+            if delay is None:
+                delay = min(self.retry_delay * 2 ** max(attempts - 1, 0), self.max_retry_delay)
+            conn.execute(
+                "UPDATE outbox SET claimed_at = NULL, available_at = ?, last_error = ? "
+                "WHERE payment_id = ? AND kind = ?",
+                (now + delay, str(error), payment_id, kind)
+            )
+        return True
+
+    def run(self, payment_id, kind, handler):
+        """Claim the entry, call handler(payload) and mark it done. Errors are re-raised."""
+        payload = self.claim(payment_id, kind)
+        if payload is None:
+            return False
+        try:
+            handler(payload)
+        except Exception as e:
+            self.release(payment_id, kind, e)
+            raise
+        self.complete(payment_id, kind)
+        return True
+
+    def pending(self, limit=100, newest_first=False):
+        """(payment_id, kind) pairs that are ready to run, oldest first"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT payment_id, kind FROM outbox "
+                "WHERE status = 'pending' AND available_at <= ? "
+                "AND (claimed_at IS NULL OR claimed_at < ?) "
+                f"ORDER BY created_at {'DESC' if newest_first else 'ASC'} LIMIT ?",
+                (now, now - self.lease, limit)
+            ).fetchall()
+
+    def drain(self, handlers, limit=100, deadline=None):
+        """Run every ready entry with handlers[kind]. Returns how many completed.
+
+        With a ``deadline`` (a time.monotonic() value) the newest entries run
+        first, so those of the current request are not stuck behind a backlog,
+        and no entry is started once it has passed; the rest wait for the next drain.
+        """
+        completed = 0
+        for payment_id, kind in self.pending(limit, newest_first=deadline is not None):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            try:
+                if self.run(payment_id, kind, handlers[kind]):
+                    completed += 1
+            except Exception as e:
+                print(f"Outbox {kind} for {payment_id} failed: {e}")
+        return completed
+
+    def backlog(self):
+        """{(state, kind): entries} for entries not yet done; state is 'ready', 'waiting', 'running' or 'failed'"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT CASE WHEN status = 'failed' THEN 'failed' "
+                "WHEN claimed_at IS NOT NULL AND claimed_at >= ? THEN 'running' "
+                "WHEN available_at > ? THEN 'waiting' ELSE 'ready' END AS state, kind, COUNT(*) "
+                "FROM outbox WHERE status != 'done' GROUP BY state, kind",
+                (now - self.lease, now)
+            ).fetchall()
+        return {(state, kind): n for state, kind, n in rows}
+
+    def failed(self):
+        """(payment_id, kind, attempts, last_error) for every entry given up on, oldest first"""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT payment_id, kind, attempts, last_error FROM outbox "
+                "WHERE status = 'failed' ORDER BY created_at"
+            ).fetchall()
+
+    def retry(self, payment_id, kind):
+        """Queue an entry given up on again, with a fresh ``give_up_after``. Returns whether there was one."""
+        with closing(self._connect()) as conn, conn:
+            return conn.execute(
+                "UPDATE outbox SET status = 'pending', attempts = 0, available_at = 0, created_at = ? "
+                "WHERE payment_id = ? AND kind = ? AND status = 'failed'",
+                (time.time(), payment_id, kind)
+            ).rowcount > 0
+
+    def purge(self, older_than=7 * 24 * 3600):
+        """Delete finished entries older than ``older_than`` seconds"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "DELETE FROM outbox WHERE status = 'done' AND created_at < ?", (time.time() - older_than,)
+            )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    outbox = Outbox(args.pop(0) if args and args[0] != "retry" else "outbox.sqlite3")
+    if args[:1] == ["retry"] and len(args) == 3:
+        print("Queued again" if outbox.retry(args[1], args[2]) else "No such failed entry")
+    else:
+        for payment_id, kind, attempts, last_error in outbox.failed():
+            print(f"{payment_id}\t{kind}\t{attempts} attempt(s)\t{last_error}")
@@ -0,0 +1,638 @@
+"""The payment system every entry point runs.
+
+app.py (gunicorn) and functions/index.py (serverless) each get one
+PaymentService from iatac.config.build_payments() and keep only their HTTP
+routes. What differs per deployment is passed in:
+
+* ``dispatch`` - how outbox entries run (iatac.dispatch)
+* ``receipts`` - how the receipt is delivered (iatac.receipt_delivery)
+* ``get_client`` - a callable, so the Razorpay client can be created lazily
+* ``metrics`` - where stage timings go (iatac.metrics); the entry points
+  serve it on /metrics
+* ``razorpay_guard`` / ``mail_guard`` - bulkhead and circuit breaker for
+  Razorpay and SMTP calls (iatac.resilience)
+* ``limiter`` - per-IP and per-contact limits on create_order and
+  contact_submit (iatac.ratelimit), or None
+* ``enquiries`` - a buffer that collects contact enquiries into digest
+  mails (iatac.enquiries), or None to mail each one as it arrives
+
+asgi.py runs AsyncPaymentService, the same logic with awaited I/O.
+
+Every side effect of a verified payment (two emails and a ledger row) is
+written to the outbox first and keyed by payment ID, so a payment seen by
+both verify_payment and the webhook is only mailed and logged once.
+"""
+import asyncio
+import datetime
+import json
+import os
+
+from iatac.emails import contact_digest_email, contact_email, customer_payment_email, manager_payment_email
+from iatac.mailer import build_message
+from iatac.metrics import Metrics
+from iatac.orders import new_receipt_id, order_key
+from iatac.pricing import SERVICE_PRICES, category_for
+from iatac.ratelimit import RateLimited
+from iatac.razorpay_api import fetch_payment_and_order, is_outage, payment_details
+from iatac.resilience import Guard
+from iatac.sheets import PAYMENT_ID_COLUMN
+
+MANAGER_EMAIL = "office.ravindra@gmail.com"
+CONTACT_EMAIL = "iatac.mumbai@gmail.com"
+
+# What contact_submit answers
+CONTACT_SENT = "Your message has been sent successfully!"
+CONTACT_RECEIVED = "Thank you! We have received your enquiry (reference {ref}) and will get back to you soon."
+
+# What every verified payment leads to
+PAYMENT_EFFECTS = ('manager_email', 'customer_email', 'sheet_row')
+
+# Notes create_order puts on every order, read back by payment_details()
+ORDER_NOTES = ('User Name', 'Mobile', 'Email', 'Service')
+
+
+class InvalidRequest(ValueError):
+    """The request was refused as sent; the message is shown to the user"""
+
+
+class InvalidSignature(ValueError):
+    pass
+
+
+def ledger_row(user_details, order_id, receipt_label):
+    """The 17 columns of a payment in the Google Sheet ledger"""
+    import pytz  # only when a payment is logged; kept off the cold-start path
+
+    # 1. Prepare Timezone (IST)
+    now = datetime.datetime.now(pytz.timezone('Asia/Kolkata'))
+    return [
+        now.strftime("%d-%m-%Y"),               # Transaction Date
+        now.strftime("%H:%M:%S"),               # Transaction Time
+        user_details['name'],                   # User Full Name
+        user_details['phone'],                  # User Mobile Number
+        user_details['email'],                  # User Email Address
+        user_details['service'],                # Selected Service Name
+        category_for(user_details['service']),  # Service Category
+        user_details['amount'],                 # Amount Paid (INR)
+        user_details['method'],                 # Payment Method
+        user_details['payment_id'],             # Razorpay Payment ID
+        order_id,                               # Order ID
+        "SUCCESS",                              # Payment Status
+        "iatac.in",                             # Website Source
+        "Yes",                                  # Receipt Generated
+        "Yes",                                  # Manager Email Sent
+        receipt_label,                          # PDF Receipt URL
+        now.strftime("%Y-%m-%d %H:%M:%S")       # Created At (Timestamp)
+    ]
+
+
+def is_site_order(order):
+    """Whether create_order made this order. The Razorpay account also sees
+    payment links and other integrations, whose payments are not ours to mail."""
+    notes = order.get('notes') or {}  # Razorpay sends [] for no notes
+    return str(order.get('receipt') or '').startswith("IATAC_") and all(notes.get(k) for k in ORDER_NOTES)
+
+
+class PaymentService:
+    def __init__(self, get_client, outbox, dispatch, receipts, mailer, sender_email,
+                 sheet_writer, sheets_creds_file, order_cache, order_store, razorpay_timeout=10,
+                 metrics=None, razorpay_guard=None, mail_guard=None, limiter=None, enquiries=None):
+        self.get_client = get_client
+        self.outbox = outbox
+        self.dispatch = dispatch
+        self.receipts = receipts
+        self.mailer = mailer
+        self.sender_email = sender_email
+        self.sheet_writer = sheet_writer
+        self.sheets_creds_file = sheets_creds_file
+        self.order_cache = order_cache
+        self.order_store = order_store
+        self.razorpay_timeout = razorpay_timeout
+        self.metrics = metrics or Metrics()
+        self.razorpay_guard = razorpay_guard or Guard('razorpay', is_failure=is_outage)
+        self.mail_guard = mail_guard or Guard('smtp', is_failure=mailer.is_outage)
+        self.limiter = limiter
+        self.enquiries = enquiries
+        # Outbox entry kind -> handler
+        self.handlers = {
+            'manager_email': self.send_outbox_email,
+            'customer_email': self.send_outbox_email,
+            'sheet_row': self.log_outbox_row,
+            'captured_payment': self.process_captured_payment,
+        }
+
+    def client(self):
+        client = self.get_client()
+        if not client:
+            raise RuntimeError("Server misconfiguration: Missing Razorpay Keys")
+        return client
+
+    def gauges(self):
+        """Outbox backlog, buffered sheet rows and the dispatch strategy's queues, for Metrics.collect"""
+        for (state, kind), count in self.outbox.backlog().items():
+            yield 'outbox_entries', {'state': state, 'kind': kind}, count
+        yield 'sheets_buffered_rows', {}, self.sheet_writer.pending()
+        if self.enquiries is not None:
+            yield 'enquiries_buffered', {}, self.enquiries.pending()
+        yield from self.dispatch.gauges()
+
+    @property
+    def mail_enabled(self):
+        password = self.mailer.password
+        return bool(password) and "YOUR" not in password
+
+    def _throttle(self, route, client_ip, email, phone):
+        """Raise RateLimited when the client, email or phone has used up its allowance"""
+        if self.limiter is None:
+            return
+        try:
+            self.limiter.check(route, ip=client_ip, email=email, phone=phone)
+        except RateLimited as e:
+            self.metrics.count('rate_limited_total', route=route, scope=e.scope)
+            raise
+
+    # Orders and verification
+
+    def _order_request(self, data, idempotency_key):
+        """(cache key, order.create payload) for a create_order request"""
+        service_name = data.get('service')
+        user_name = data.get('name')
+        user_email = data.get('email')
+        user_phone = data.get('phone')
+
+        if service_name not in SERVICE_PRICES:
+            raise InvalidRequest("Invalid service selected")
+
+        order_data = {
+            "amount": SERVICE_PRICES[service_name],
+            "currency": "INR",
+            "receipt": new_receipt_id(),
+            "notes": {
+                "User Name": user_name,
+                "Mobile": user_phone,
+                "Email": user_email,
+                "Service": service_name
+            }
+        }
+        return order_key(idempotency_key, service_name, user_name, user_email, user_phone), order_data
+
+    def _remember(self, order):
+        try:
+            with self.metrics.stage('order_store'):
+                self.order_store.put(order)
+        except Exception as e:
+            print(f"Order store error: {e}")  # verify_payment will fetch it from Razorpay instead
+
+    def _paid_elsewhere(self, order):
+        """Whether a cached order has been paid through another worker"""
+        try:
+            if not self.order_store.is_paid(order['id']):
+                return False
+        except Exception as e:
+            print(f"Order store error: {e}")
+            return False
+        self.order_cache.forget_order(order['id'])
+        return True
+
+    def _mark_paid(self, order_id):
+        """Stop handing out a paid order, here and (through the order store) in every other worker"""
+        self.order_cache.forget_order(order_id)
+        try:
+            self.order_store.mark_paid(order_id)
+        except Exception as e:
+            print(f"Order store error: {e}")
+
+    def create_order(self, data, idempotency_key=None, client_ip=None):
+        """Razorpay order for the selected service; repeats of the same request get the same order"""
+        self._throttle('create_order', client_ip, data.get('email'), data.get('phone'))
+        client = self.client()
+        key, order_data = self._order_request(data, idempotency_key)
+        def create():
+            with self.metrics.stage('razorpay_create_order'):
+                return self.razorpay_guard.call(client.order.create, data=order_data,
+                                                timeout=self.razorpay_timeout)
+
+        # Double-clicks and retries get the order already created for them, until it is paid
+        while True:
+            order, created = self.order_cache.get_or_create(key, create)
+            if created:
+                self._remember(order)
+                return order
+            if not self._paid_elsewhere(order):
+                return order
+
+    def _check_signature(self, client, data):
+        params_dict = {
+            'razorpay_order_id': data['razorpay_order_id'],
+            'razorpay_payment_id': data['razorpay_payment_id'],
+            'razorpay_signature': data['razorpay_signature']
+        }
+        with self.metrics.stage('signature'):
+            client.utility.verify_payment_signature(params_dict)
+
+    def verify_payment(self, data):
+        """Check the checkout signature and record the payment; returns the details for the receipt"""
+        # 1. Verify Signature
+        client = self.client()
+        self._check_signature(client, data)
+        self._mark_paid(data['razorpay_order_id'])
+
+        # 2. Get Payment Details
+        with self.metrics.stage('razorpay_fetch'):
+            payment_info, order_info = self.razorpay_guard.call(
+                fetch_payment_and_order, client, data['razorpay_payment_id'], data['razorpay_order_id'],
+                timeout=self.razorpay_timeout, orders=self.order_store)
+        user_details = payment_details(payment_info, order_info)
+
+        # 3. Receipt first, so the confirmation email can attach the same PDF
+        with self.metrics.stage('receipt'):
+            receipt, attachment = self.receipts.publish(user_details)
+
+        # 4. Persist emails and the sheet row, then run them in the background.
+        # A repeated verify for the same payment finds them already recorded.
+        self.record_payment(user_details, data['razorpay_order_id'], attachment)
+
+        user_details.update(receipt)
+        return user_details
+
+    def accept_webhook(self, body, signature, secret):
+        """Record a payment.captured event for the background; returns the status to report.
+
+        Payments without an order, or for an order create_order did not make,
+        are acknowledged as "Ignored". Raises InvalidSignature, and lets
+        storage and Razorpay errors through so the caller can answer with
+        something Razorpay will retry.
+        """
+        payment = self._captured_payment(body, signature, secret)
+        if payment is None or not self._is_ours(payment, self._paid_order(payment)):
+            return "Ignored"
+        self._mark_paid(payment['order_id'])
+        self.outbox.put(payment['id'], {'captured_payment': payment})
+        self.dispatch.start(self.outbox, self.handlers, [(payment['id'], 'captured_payment')])
+        return "Accepted"
+
+    def _captured_payment(self, body, signature, secret):
+        """The payment of a signed payment.captured event, or None for other events and orderless payments"""
+        from razorpay.errors import SignatureVerificationError
+
+        try:
+            with self.metrics.stage('webhook_signature'):
+                self.client().utility.verify_webhook_signature(body, signature, secret)
+        except SignatureVerificationError:
+            raise InvalidSignature("Invalid signature")
+
+        event = json.loads(body)
+        if event.get('event') != 'payment.captured':
+            return None
+
+        payment = event['payload']['payment']['entity']
+        if not payment.get('order_id'):
+            print(f"Payment {payment['id']} has no order, ignoring.")
+            return None
+        return payment
+
+    @staticmethod
+    def _is_ours(payment, order):
+        if is_site_order(order):
+            return True
+        print(f"Payment {payment['id']} is for order {payment['order_id']}, not an iatac.in order; ignoring.")
+        return False
+
+    def _paid_order(self, payment):
+        """The order a captured payment paid, from the order store or else from Razorpay"""
+        order = self.order_store.get(payment['order_id'])
+        if order is None:
+            with self.metrics.stage('razorpay_fetch_order'):
+                order = self.razorpay_guard.call(self.client().order.fetch, payment['order_id'],
+                                                 timeout=self.razorpay_timeout)
+            if is_site_order(order):
+                self._remember(order)  # for process_captured_payment
+        return order
+
+    def receipt_details(self, payment_id, date):
+        """Receipt fields for a signed receipt link, which carries only the payment ID and date.
+
+        Returns None for a payment that is not for an iatac.in order.
+        """
+        with self.metrics.stage('razorpay_fetch'):
+            payment = self.razorpay_guard.call(self.client().payment.fetch, payment_id,
+                                               timeout=self.razorpay_timeout)
+        if not payment.get('order_id'):
+            return None
+        order = self._paid_order(payment)
+        if not is_site_order(order):
+            return None
+        return dict(payment_details(payment, order), date=date)
+
+    def record_payment(self, user_details, order_id, attachment=None):
+        """Persist the emails and sheet row for a verified payment and start them.
+
+        With ``attachment`` (a reference from the receipt strategy) the
+        receipt goes out with the customer mail.
+        """
+        payment_id = user_details['payment_id']
+        with self.metrics.stage('outbox_record'):
+            self.outbox.put(payment_id, self._payment_effects(user_details, order_id, attachment))
+        self.dispatch.start(self.outbox, self.handlers, [(payment_id, kind) for kind in PAYMENT_EFFECTS])
+
+    def _payment_effects(self, user_details, order_id, attachment):
+        """Outbox payloads for PAYMENT_EFFECTS"""
+        manager_subject, manager_html, manager_text = manager_payment_email(user_details)
+        user_subject, user_html, user_text = customer_payment_email(user_details, attached=bool(attachment))
+        return {
+            'manager_email': {"to": MANAGER_EMAIL, "subject": manager_subject, "body": manager_html,
+                              "text": manager_text},
+            'customer_email': {"to": user_details['email'], "subject": user_subject, "body": user_html,
+                               "text": user_text, "receipt": attachment},
+            'sheet_row': {"user_details": user_details, "order_id": order_id}
+        }
+
+    def resume(self):
+        """Start entries left over from a restart or a run that gave up on them"""
+        self.dispatch.start(self.outbox, self.handlers, self.outbox.pending())
+        if self.enquiries is not None and self.enquiries.due():
+            self.dispatch.background('email', self.send_contact_digest)
+
+    # Contact form
+
+    def submit_contact(self, data, client_ip=None):
+        """Accept a contact form enquiry; returns the message to show the user"""
+        self._throttle('contact_submit', client_ip, data.get('email'), data.get('mobile'))
+        enquiry = self._contact_enquiry(data)
+        if self.enquiries is None:
+            self.dispatch.background('email', self.send_enquiry_email, enquiry)
+            return CONTACT_SENT
+        enquiry_id, due = self.enquiries.add(enquiry)
+        self._follow_up(enquiry_id, enquiry, due)
+        return CONTACT_RECEIVED.format(ref=enquiry_id)
+
+    def _contact_enquiry(self, data):
+        name = data.get('name')
+        mobile = data.get('mobile')
+        email = data.get('email')
+        message = data.get('message')
+
+        # 1. Simple Honeypot Spam Prevention
+        if data.get('honeypot'):
+            raise InvalidRequest("Spam detected.")
+
+        # 2. Validation
+        if not all([name, mobile, email, message]):
+            raise InvalidRequest("All fields are required.")
+
+        return {
+            "name": name, "mobile": mobile, "email": email, "message": message,
+            "received_at": datetime.datetime.now().strftime("%d-%b-%Y %I:%M %p"),
+            "urgent": bool(data.get('urgent'))
+        }
+
+    def _follow_up(self, enquiry_id, enquiry, due):
+        """After buffering: mail an urgent enquiry now, or the digest once it is due"""
+        if self.enquiries.is_urgent(enquiry):
+            self.dispatch.background('email', self.send_urgent_enquiry, enquiry_id)
+        elif due:
+            self.dispatch.background('email', self.send_contact_digest)
+
+    # Side effects, run by the dispatch strategy
+
+    def _message(self, to_email, subject, body, text, attachments):
+        return build_message(self.sender_email, to_email, subject, body, text=text, attachments=attachments)
+
+    def send_email(self, to_email, subject, body, text=None, attachments=()):
+        """Send one mail. Raises on failure so the job queue or outbox can retry."""
+        if not self.mail_enabled:
+            return
+
+        try:
+            with self.metrics.stage('smtp'):
+                self.mail_guard.call(self.mailer.send, self._message(to_email, subject, body, text, attachments))
+            print(f"Email sent successfully to {to_email}")
+        except Exception as e:
+            print(f"SMTP Error: {e}")
+            raise
+
+    def send_enquiry_email(self, enquiry):
+        subject, email_html, email_text = contact_email(
+            enquiry['name'], enquiry['mobile'], enquiry['email'], enquiry['message'], enquiry['received_at'])
+        self.send_email(CONTACT_EMAIL, subject, email_html, email_text)
+
+    def send_urgent_enquiry(self, enquiry_id):
+        # Nothing to do if a digest has already claimed it
+        self.enquiries.flush(lambda batch: self.send_enquiry_email(batch[0]), ids=[enquiry_id])
+
+    def send_contact_digest(self):
+        """Mail buffered enquiries, one digest per ``max_items``, until none are left"""
+        while self.enquiries.flush(self._send_digest):
+            pass
+
+    def _send_digest(self, batch):
+        self.send_email(CONTACT_EMAIL, *contact_digest_email(batch))
+
+    def send_outbox_email(self, payload):
+        attachments = []
+        if payload.get('receipt') and self.mail_enabled:
+            with self.metrics.stage('receipt_attachment'):
+                found = self.receipts.attachment(payload['receipt'])
+            if found is not None:
+                attachments.append(found)
+        self.send_email(payload['to'], payload['subject'], payload['body'], payload.get('text'), attachments)
+
+    def log_to_google_sheet(self, user_details, order_id):
+        """Hand the payment's row to the batch writer. Raises on API errors so it is retried."""
+        if not self.sheets_creds_file or not os.path.exists(self.sheets_creds_file):
+            print("Google Sheet Credentials file missing.")
+            return
+
+        try:
+            # The row is spooled to disk and written with the rest of its batch
+            # in a single append_rows call. Duplicates (same Payment ID) are
+            # dropped by the writer's ledger index.
+            self._queue_row(ledger_row(user_details, order_id, self.receipts.ledger_label))
+        except Exception as e:
+            print(f"Google Sheet Error: {e}")
+            raise
+
+    def _queue_row(self, row):
+        # The first row of a process also warms the ledger index from Google
+        with self.metrics.stage('sheets_queue'):
+            added = self.sheet_writer.add(row)
+        if added:
+            print("Payment queued for Google Sheet.")
+        else:
+            print(f"Payment {row[PAYMENT_ID_COLUMN - 1]} already in Google Sheet, skipping.")
+
+    def log_outbox_row(self, payload):
+        self.log_to_google_sheet(payload['user_details'], payload['order_id'])
+
+    def process_captured_payment(self, payment):
+        """Outbox handler for a payment.captured webhook: the same work verify_payment does"""
+        if self.outbox.has(payment['id'], 'sheet_row'):
+            return  # the browser's verify_payment got there first
+        order_info = self._paid_order(payment)
+        if not self._is_ours(payment, order_info):
+            return  # recorded before accept_webhook checked
+        user_details = payment_details(payment, order_info)
+        self.record_payment(user_details, payment['order_id'], self.receipts.attachable(user_details))
+
+
+class AsyncPaymentService(PaymentService):
+    """PaymentService for the ASGI app.
+
+    ``get_client`` returns an AsyncRazorpay, ``mailer`` is an AsyncSMTPPool
+    and ``dispatch`` a TaskDispatch. Razorpay and SMTP calls are awaited on
+    the event loop; receipt rendering and Sheets calls run on ``executor``,
+    and the SQLite stores (outbox, orders, limits, enquiries) are read and
+    written with asyncio.to_thread.
+    """
+
+    def __init__(self, *args, executor=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.executor = executor
+
+    def _blocking(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def create_order(self, data, idempotency_key=None, client_ip=None):
+        # The shared limiter is a SQLite file
+        await asyncio.to_thread(self._throttle, 'create_order', client_ip, data.get('email'), data.get('phone'))
+        client = self.client()
+        key, order_data = self._order_request(data, idempotency_key)
+
+        async def create():
+            with self.metrics.stage('razorpay_create_order'):
+                return await self.razorpay_guard.acall(client.create_order, order_data)
+
+        while True:
+            order, created = await self.order_cache.aget_or_create(key, create)
+            if created:
+                await asyncio.to_thread(self._remember, order)  # SQLite commits would stall the loop
+                return order
+            if not await asyncio.to_thread(self._paid_elsewhere, order):
+                return order
+
+    async def submit_contact(self, data, client_ip=None):
+        await asyncio.to_thread(self._throttle, 'contact_submit', client_ip, data.get('email'), data.get('mobile'))
+        enquiry = self._contact_enquiry(data)
+        if self.enquiries is None:
+            self.dispatch.background('email', self.send_enquiry_email, enquiry)
+            return CONTACT_SENT
+        enquiry_id, due = await asyncio.to_thread(self.enquiries.add, enquiry)
+        self._follow_up(enquiry_id, enquiry, due)
+        return CONTACT_RECEIVED.format(ref=enquiry_id)
+
+    async def verify_payment(self, data):
+        # 1. Verify Signature
+        client = self.client()
+        self._check_signature(client, data)
+        await asyncio.to_thread(self._mark_paid, data['razorpay_order_id'])
+
+        # 2. Get Payment Details
+        with self.metrics.stage('razorpay_fetch'):
+            payment_info, order_info = await self.razorpay_guard.acall(
+                client.fetch_payment_and_order, data['razorpay_payment_id'], data['razorpay_order_id'],
+                orders=self.order_store)
+        user_details = payment_details(payment_info, order_info)
+
+        # 3. Receipt first, rendered off the event loop
+        with self.metrics.stage('receipt'):
+            receipt, attachment = await self._blocking(self.receipts.publish, user_details)
+
+        # 4. Persist emails and the sheet row; they run as tasks after the response
+        await self.record_payment(user_details, data['razorpay_order_id'], attachment)
+
+        user_details.update(receipt)
+        return user_details
+
+    async def accept_webhook(self, body, signature, secret):
+        payment = self._captured_payment(body, signature, secret)
+        if payment is None or not self._is_ours(payment, await self._paid_order(payment)):
+            return "Ignored"
+        await asyncio.to_thread(self._mark_paid, payment['order_id'])
+        await asyncio.to_thread(self.outbox.put, payment['id'], {'captured_payment': payment})
+        self.dispatch.start(self.outbox, self.handlers, [(payment['id'], 'captured_payment')])
+        return "Accepted"
+
+    async def _paid_order(self, payment):
+        order = await asyncio.to_thread(self.order_store.get, payment['order_id'])
+        if order is None:
+            with self.metrics.stage('razorpay_fetch_order'):
+                order = await self.razorpay_guard.acall(self.client().fetch_order, payment['order_id'])
+            if is_site_order(order):
+                await asyncio.to_thread(self._remember, order)
+        return order
+
+    async def record_payment(self, user_details, order_id, attachment=None):
+        payment_id = user_details['payment_id']
+        with self.metrics.stage('outbox_record'):
+            await asyncio.to_thread(self.outbox.put, payment_id,
+                                    self._payment_effects(user_details, order_id, attachment))
+        self.dispatch.start(self.outbox, self.handlers, [(payment_id, kind) for kind in PAYMENT_EFFECTS])
+
+    async def resume(self):
+        self.dispatch.start(self.outbox, self.handlers, await asyncio.to_thread(self.outbox.pending))
+        if self.enquiries is not None and await asyncio.to_thread(self.enquiries.due):
+            self.dispatch.background('email', self.send_contact_digest)
+
+    async def send_email(self, to_email, subject, body, text=None, attachments=()):
+        if not self.mail_enabled:
+            return
+
+        try:
+            with self.metrics.stage('smtp'):
+                await self.mail_guard.acall(self.mailer.send,
+                                            self._message(to_email, subject, body, text, attachments))
+            print(f"Email sent successfully to {to_email}")
+        except Exception as e:
+            print(f"SMTP Error: {e}")
+            raise
+
+    async def send_enquiry_email(self, enquiry):
+        subject, email_html, email_text = contact_email(
+            enquiry['name'], enquiry['mobile'], enquiry['email'], enquiry['message'], enquiry['received_at'])
+        await self.send_email(CONTACT_EMAIL, subject, email_html, email_text)
+
+    async def _flush_enquiries(self, send, ids=None):
+        """EnquiryBuffer.flush with an awaited send; the buffer is SQLite, so it runs in a thread"""
+        ids, batch = await asyncio.to_thread(self.enquiries.claim, ids)
+        if not batch:
+            return 0
+        try:
+            await send(batch)
+        except BaseException:
+            await asyncio.to_thread(self.enquiries.release, ids)
+            raise
+        await asyncio.to_thread(self.enquiries.complete, ids)
+        return len(ids)
+
+    async def send_urgent_enquiry(self, enquiry_id):
+        await self._flush_enquiries(lambda batch: self.send_enquiry_email(batch[0]), ids=[enquiry_id])
+
+    async def send_contact_digest(self):
+        while await self._flush_enquiries(self._send_digest):
+            pass
+
+    async def _send_digest(self, batch):
+        await self.send_email(CONTACT_EMAIL, *contact_digest_email(batch))
+
+    async def send_outbox_email(self, payload):
+        attachments = []
+        if payload.get('receipt') and self.mail_enabled:
+            with self.metrics.stage('receipt_attachment'):
+                found = await self._blocking(self.receipts.attachment, payload['receipt'])
+            if found is not None:
+                attachments.append(found)
+        await self.send_email(payload['to'], payload['subject'], payload['body'], payload.get('text'), attachments)
+
+    async def log_outbox_row(self, payload):
+        # The first row of a worker warms the ledger index from Google
+        await self._blocking(self.log_to_google_sheet, payload['user_details'], payload['order_id'])
+
+    async def process_captured_payment(self, payment):
+        if await asyncio.to_thread(self.outbox.has, payment['id'], 'sheet_row'):
+            return  # the browser's verify_payment got there first
+        order_info = await self._paid_order(payment)
+        if not self._is_ours(payment, order_info):
+            return  # recorded before accept_webhook checked
+        user_details = payment_details(payment, order_info)
+        attachment = await self._blocking(self.receipts.attachable, user_details)
+        await self.record_payment(user_details, payment['order_id'], attachment)
@@ -0,0 +1,21 @@
+"""Memberships on sale, their prices in paise and their ledger category."""
+
+SERVICE_PRICES = {
+    "Annual Fee (All)": 5000 * 100,
+    "HR Services Company Membership": 5000 * 100,
+    "HR Consultants Membership": 3000 * 100,
+    "Corporates Membership": 15000 * 100,
+    "Demo Service": 1 * 100
+}
+
+SERVICE_CATEGORIES = {
+    "HR Services Company Membership": "HR Services",
+    "HR Consultants Membership": "HR Consultant",
+    "Corporates Membership": "Corporate",
+    "Annual Fee (All)": "Membership",
+    "Demo Service": "Membership"
+}
+
+
+def category_for(service):
+    return SERVICE_CATEGORIES.get(service, "Membership")
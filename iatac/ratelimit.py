@@ -0,0 +1,145 @@
+"""Token-bucket limits for the routes that cost money or send mail.
+
+create_order turns every request into a Razorpay API call and
+contact_submit into an email, so both are limited before any of that work
+starts: per client IP, and per email address and phone number. A limit
+such as "20/60" is a bucket of 20 tokens refilled at 20 per 60 seconds,
+i.e. bursts of 20 and 20 a minute sustained.
+
+With a ``path`` the buckets are kept in SQLite, so every gunicorn worker on
+the machine draws from the same ones; without one they are kept in memory
+for this process only (a serverless instance). A check reads and writes one
+row per key. Email addresses and phone numbers are stored hashed.
+"""
+import hashlib
+import math
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class RateLimited(Exception):
+    """Too many requests; ``scope`` is the key that ran out ('ip' or 'contact')"""
+
+    def __init__(self, scope, retry_after):
+        super().__init__("Too many requests. Please try again later.")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+def parse_limit(spec):
+    """'20/60' -> (20, 60.0); an empty or zero spec means no limit (None)"""
+    if not spec or spec.strip() in ('0', 'off'):
+        return None
+    capacity, _, per = spec.partition('/')
+    return int(capacity), float(per or 60)
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+def _contact_values(email, phone):
+    if email:
+        yield email.strip().lower()
+    digits = re.sub(r'\D', '', phone or '')
+    if digits:
+        yield digits[-10:]  # +91 / 0 prefixes name the same number
+
+
+class RateLimiter:
+    """Buckets per (route, scope, key).
+
+    ``limits`` maps a route to ``{'ip': limit, 'contact': limit}``, each a
+    (capacity, per_seconds) pair from parse_limit() or None.
+    """
+
+    def __init__(self, limits, path=None, prune_every=500):
+        self.limits = limits
+        self.path = path
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, updated_at), when there is no path
+        self._checks = 0
+        # A bucket idle this long is full again and need not be kept
+        self._idle_after = max((per for rules in limits.values() for _, per in filter(None, rules.values())),
+                               default=0)
+        if path:
+            with closing(self._connect()) as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def _keys(self, route, ip, email, phone):
+        rules = self.limits.get(route, {})
+        if rules.get('ip') and ip:
+            yield 'ip', f"{route}:ip:{ip}", rules['ip']
+        if rules.get('contact'):
+            for value in _contact_values(email, phone):
+                yield 'contact', f"{route}:contact:{_digest(value)}", rules['contact']
+
+    @staticmethod
+    def _take(keys, current, now):
+        """New (tokens, updated_at) for every key, or RateLimited if any bucket is empty"""
+        taken = {}
+        for scope, key, (capacity, per) in keys:
+            tokens, updated_at = current.get(key) or (capacity, now)
+            tokens = min(capacity, tokens + (now - updated_at) * capacity / per)
+            if tokens < 1:
+                raise RateLimited(scope, math.ceil((1 - tokens) * per / capacity))
+            taken[key] = (tokens - 1, now)
+        return taken
+
+    def check(self, route, ip=None, email=None, phone=None):
+        """Take a token from each of the request's buckets, or raise RateLimited and take none"""
+        keys = list(self._keys(route, ip, email, phone))
+        if not keys:
+            return
+        now = time.time()
+        with self._lock:
+            self._checks += 1
+            prune = self._checks % self.prune_every == 0
+        if self.path:
+            self._check_file(keys, now, prune)
+        else:
+            self._check_memory(keys, now, prune)
+
+    def _check_memory(self, keys, now, prune):
+        with self._lock:
+            self._buckets.update(self._take(keys, self._buckets, now))
+            if prune:
+                self._buckets = {k: v for k, v in self._buckets.items() if v[1] >= now - self._idle_after}
+
+    def _check_file(self, keys, now, prune):
+        with closing(self._connect()) as conn:
+            # IMMEDIATE: the read and the write below happen under one lock on the file
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                names = [key for _, key, _ in keys]
+                rows = conn.execute(
+                    f"SELECT key, tokens, updated_at FROM buckets WHERE key IN ({','.join('?' * len(names))})",
+                    names
+                ).fetchall()
+                taken = self._take(keys, {key: (tokens, updated_at) for key, tokens, updated_at in rows}, now)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    [(key, tokens, updated_at) for key, (tokens, updated_at) in taken.items()]
+                )
+                if prune:
+                    conn.execute("DELETE FROM buckets WHERE updated_at < ?", (now - self._idle_after,))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
@@ -0,0 +1,136 @@
+"""Razorpay client setup and the lookups verify_payment makes.
+
+The client talks to the API through one requests.Session per process with
+a keep-alive connection pool, so each call after the first skips the TCP
+and TLS handshakes. The payment and order behind a checkout are fetched at
+the same time rather than one after the other, and the order is not fetched
+at all when it is in the local order store.
+
+razorpay and requests are imported by make_client(), so a serverless
+instance only pays for them once a route needs the client.
+
+AsyncRazorpay is the same set of calls for the ASGI app, over httpx.
+"""
+import asyncio
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+# Seconds for each API call: (connect, read)
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Shared by all requests in the process; one extra thread per verify in flight
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="razorpay")
+
+
+def make_client(key_id, key_secret, pool_size=10, base_url=None):
+    """razorpay.Client over a pooled keep-alive session"""
+    import razorpay
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    options = {'base_url': base_url} if base_url else {}
+    return razorpay.Client(session=session, auth=(key_id, key_secret), **options)
+
+
+def is_outage(exc):
+    """Whether a call failed because of Razorpay or the network rather than the request"""
+    from razorpay.errors import BadRequestError
+
+    return not isinstance(exc, BadRequestError)
+
+
+def fetch_payment_and_order(client, payment_id, order_id, timeout=DEFAULT_TIMEOUT, orders=None):
+    """(payment, order) fetched concurrently. Raises whatever either call raised.
+
+    With an ``orders`` store, an order found there is used as is.
+    """
+    order = orders.get(order_id) if orders is not None else None
+    if order is not None:
+        return client.payment.fetch(payment_id, timeout=timeout), order
+
+    order_future = _executor.submit(client.order.fetch, order_id, timeout=timeout)
+    try:
+        payment = client.payment.fetch(payment_id, timeout=timeout)
+    except Exception:
+        order_future.cancel()
+        raise
+    return payment, order_future.result()
+
+
+class AsyncRazorpay:
+    """The order and payment calls the ASGI app makes, over one pooled httpx.AsyncClient.
+
+    ``utility`` is razorpay's own (local, HMAC-only) signature checker, and
+    API errors are raised as the same razorpay.errors the sync client raises.
+    """
+
+    def __init__(self, key_id, key_secret, pool_size=100, keepalive=20, base_url=None, timeout=DEFAULT_TIMEOUT):
+        import httpx
+        import razorpay
+
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        self.http = httpx.AsyncClient(
+            base_url=base_url or "https://api.razorpay.com",
+            auth=(key_id, key_secret or ""),
+            timeout=httpx.Timeout(read, connect=connect),
+            # pool_size calls in flight at once; only ``keepalive`` sockets kept idle between bursts
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=keepalive),
+        )
+        self.utility = razorpay.Client(auth=(key_id, key_secret)).utility
+
+    async def _request(self, method, path, **kwargs):
+        from razorpay.errors import BadRequestError, GatewayError, ServerError
+
+        response = await self.http.request(method, path, **kwargs)
+        if 200 <= response.status_code < 300:
+            return response.json()
+        try:
+            error = response.json().get('error', {})
+        except ValueError:
+            error = {}
+        code = str(error.get('code', '')).upper()
+        msg = error.get('description', '')
+        if code == 'BAD_REQUEST_ERROR':
+            raise BadRequestError(msg)
+        if code == 'GATEWAY_ERROR':
+            raise GatewayError(msg)
+        raise ServerError(msg)
+
+    async def create_order(self, data):
+        return await self._request("POST", "/v1/orders", json=data)
+
+    async def fetch_order(self, order_id):
+        return await self._request("GET", f"/v1/orders/{order_id}")
+
+    async def fetch_payment(self, payment_id):
+        return await self._request("GET", f"/v1/payments/{payment_id}")
+
+    async def fetch_payment_and_order(self, payment_id, order_id, orders=None):
+        """fetch_payment_and_order() with the HTTP calls awaited; the SQLite store is read in a thread"""
+        order = await asyncio.to_thread(orders.get, order_id) if orders is not None else None
+        if order is not None:
+            return await self.fetch_payment(payment_id), order
+        payment, order = await asyncio.gather(self.fetch_payment(payment_id), self.fetch_order(order_id))
+        return payment, order
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+def payment_details(payment, order):
+    """Receipt, email and ledger fields for a captured payment and the order it paid"""
+    return {
+        "name": order['notes'].get('User Name'),
+        "phone": order['notes'].get('Mobile'),
+        "email": order['notes'].get('Email'),
+        "service": order['notes'].get('Service'),
+        "amount": payment['amount'] / 100,
+        "payment_id": payment['id'],
+        "receipt_no": order['receipt'],
+        "date": datetime.datetime.now().strftime("%d-%b-%Y %I:%M:%S %p IST"),
+        "method": payment.get('method', 'N/A')
+    }
@@ -0,0 +1,171 @@
+"""Receipt PDF rendering shared by app.py and functions/index.py.
+
+Everything on a receipt that does not depend on the payment (logo, header,
+footer, labels and table borders) is drawn once per process into a base
+document. Each receipt is a copy of that base with only the payment's
+fields written in, so the logo is not re-read and re-embedded and the
+chrome is not redrawn for every payment.
+"""
+import copy
+import os
+import threading
+
+from fpdf import FPDF
+
+
+class IATACReceipt(FPDF):
+    logo_path = None
+    footer_drawn = False
+
+    def header(self):
+        # Logo
+        if self.logo_path and os.path.exists(self.logo_path):
+            self.image(self.logo_path, 10, 8, 33)
+        self.set_font("helvetica", "B", 20)
+        self.set_text_color(0, 123, 255) # Primary Blue
+        self.cell(80)
+        self.cell(100, 10, "OFFICIAL RECEIPT", border=0, align="R", ln=1)
+        self.ln(20)
+
+    def footer(self):
+        # Already part of the base page when rendering from a template
+        if self.footer_drawn:
+            return
+        self.set_y(-35)
+        self.set_font("helvetica", "I", 8)
+        self.set_text_color(169, 169, 169)
+        self.cell(0, 10, "This is a computer-generated document. No signature is required.", align="C", ln=1)
+        self.set_font("helvetica", "B", 10)
+        self.set_text_color(45, 52, 70)
+        self.cell(0, 10, "IATAC - Indian Association of Talent Acquisition Consultants", align="C", ln=1)
+        self.set_font("helvetica", "", 8)
+        self.cell(0, 5, "Office-609, Parth Solitaire, Sector-9E, Kalamboli, Navi Mumbai - 410218", align="C")
+
+
+class ReceiptTemplate:
+    """Pre-rendered receipt layout with slots for the per-payment fields.
+
+    The base document is built on first use and shared read-only between
+    threads; render() works on a private copy.
+    """
+
+    def __init__(self, logo_path):
+        self.logo_path = logo_path
+        self._lock = threading.Lock()
+        self._base = None
+        self._slots = []
+        self._shared = {}
+
+    def _field(self, pdf, w, h, text, align="", border=0, fill=False, ln=0):
+        """Draw the cell's chrome and remember where its text goes.
+
+        The cell is drawn empty, which moves the cursor exactly as the
+        filled cell would, so the static parts after it land where they
+        always have.
+        """
+        self._slots.append((pdf.get_x(), pdf.get_y(), w, h, text, align,
+                            pdf.font_family, pdf.font_style, pdf.font_size_pt, pdf.text_color))
+        pdf.cell(w, h, "", border=border, fill=fill, align=align, ln=ln)
+
+    def _build(self):
+        self._slots = []
+        pdf = IATACReceipt()
+        pdf.logo_path = self.logo_path
+        pdf.add_page()
+
+        # Footer first, with page breaks off as fpdf does while in footer()
+        pdf.set_auto_page_break(auto=False)
+        x, y = pdf.get_x(), pdf.get_y()
+        pdf.footer()
+        pdf.footer_drawn = True
+        pdf.set_xy(x, y)
+        pdf.set_auto_page_break(auto=True, margin=15)
+
+        # Billing Info
+        pdf.set_font("helvetica", "B", 12)
+        pdf.set_text_color(100, 100, 100)
+        pdf.cell(0, 10, "BILLED TO:", ln=1)
+        pdf.set_font("helvetica", "", 11)
+        pdf.set_text_color(0, 0, 0)
+        self._field(pdf, 0, 6, lambda d: f"{d['name']}", ln=1)
+        self._field(pdf, 0, 6, lambda d: f"Mobile: {d['phone']}", ln=1)
+        self._field(pdf, 0, 6, lambda d: f"Email: {d['email']}", ln=1)
+
+        # Receipt Info (Top Right positioning using set_xy)
+        pdf.set_xy(140, 45)
+        pdf.set_font("helvetica", "B", 11)
+        pdf.set_text_color(100, 100, 100)
+        pdf.cell(50, 6, "RECEIPT NO:", align="R", ln=1)
+        pdf.set_x(140)
+        pdf.set_font("helvetica", "", 11)
+        pdf.set_text_color(0, 0, 0)
+        self._field(pdf, 50, 6, lambda d: f"#{d['receipt_no']}", align="R", ln=1)
+        pdf.set_x(140)
+        pdf.set_font("helvetica", "B", 11)
+        pdf.set_text_color(100, 100, 100)
+        pdf.cell(50, 6, "DATE:", align="R", ln=1)
+        pdf.set_x(140)
+        pdf.set_font("helvetica", "", 10)
+        pdf.set_text_color(0, 0, 0)
+        self._field(pdf, 50, 6, lambda d: f"{d['date']}", align="R", ln=1)
+
+        pdf.ln(20)
+
+        # Table Header
+        pdf.set_fill_color(0, 123, 255)
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_font("helvetica", "B", 11)
+        pdf.cell(100, 10, " Description", border=1, fill=True)
+        pdf.cell(50, 10, " Transaction ID", border=1, fill=True, align="C")
+        pdf.cell(40, 10, " Amount", border=1, fill=True, align="R")
+        pdf.ln()
+
+        # Table Row
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_font("helvetica", "", 10)
+        self._field(pdf, 100, 15, lambda d: f" {d['service']}", border=1)
+        pdf.set_font("courier", "", 9)
+        self._field(pdf, 50, 15, lambda d: f" {d['payment_id']}", border=1, align="C")
+        pdf.set_font("helvetica", "B", 11)
+        self._field(pdf, 40, 15, lambda d: f" INR {d['amount']:.2f} ", border=1, align="R")
+        pdf.ln()
+
+        # Total Section
+        pdf.ln(10)
+        pdf.set_x(140)
+        pdf.set_font("helvetica", "B", 12)
+        pdf.cell(50, 10, "TOTAL RECEIVED:", align="R")
+        pdf.set_font("helvetica", "B", 16)
+        pdf.set_text_color(0, 123, 255)
+        self._field(pdf, 0, 10, lambda d: f" INR {d['amount']:.2f}", ln=1, align="R")
+
+        # Payment Method
+        pdf.ln(5)
+        pdf.set_font("helvetica", "B", 10)
+        pdf.set_text_color(100, 100, 100)
+        self._field(pdf, 0, 10, lambda d: f"Payment Method: {d['method'].upper()}", ln=1)
+        pdf.set_text_color(40, 167, 69) # Green
+        pdf.cell(0, 10, "Status: PAID", ln=1)
+        return pdf
+
+    def _get_base(self):
+        if self._base is None:
+            with self._lock:
+                if self._base is None:
+                    base = self._build()
+                    # fpdf's core-font width tables are module-level and never
+                    # written to; copying them is most of what deepcopy costs
+                    self._shared = {id(font.cw): font.cw for font in base.fonts.values()}
+                    self._base = base
+        return self._base
+
+    def render(self, details):
+        """Return the receipt for one payment as PDF bytes"""
+        base = self._get_base()
+        pdf = copy.deepcopy(base, dict(self._shared))
+        for x, y, w, h, text, align, family, style, size, color in self._slots:
+            pdf.set_xy(x, y)
+            pdf.set_font(family, style, size)
+            pdf.text_color = color
+            pdf.cell(w, h, text(details), align=align)
+        return bytes(pdf.output())
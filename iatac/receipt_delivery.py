@@ -0,0 +1,108 @@
+"""How a receipt reaches the buyer, per deployment.
+
+Each strategy turns verified payment details into the fields verify_payment
+returns (``pdf_url`` or ``pdf_base64``) and into a reference that the
+customer email's outbox entry carries, so the mail can attach the same PDF
+later on:
+
+* StoredReceipts - rendered once and kept under receipts/, served by
+  /download_receipt (long-running workers).
+* SignedReceipts - a signed /api/receipt/<token> link rendered when opened;
+  nothing is stored (serverless). The link carries only the payment ID, so
+  the details are fetched again on download (PaymentService.receipt_details).
+* InlineReceipts - the PDF itself, base64 in the JSON response (serverless,
+  RECEIPT_DELIVERY=base64).
+
+``get_template`` is a callable so the serverless handler can build the
+renderer on first use.
+"""
+import base64
+from collections import OrderedDict
+
+from iatac.receipt_store import receipt_filename
+from iatac.receipt_token import load_receipt_token, sign_receipt_token
+
+
+class StoredReceipts:
+    ledger_label = "N/A"
+
+    def __init__(self, store):
+        self.store = store
+
+    def _save(self, details):
+        """Render and store the receipt, or reuse the one already stored for this payment"""
+        try:
+            return self.store.save(details)
+        except Exception as e:
+            print(f"PDF Generation Error: {e}")
+            return None
+
+    def publish(self, details):
+        """(response fields, attachment reference) for a verified payment"""
+        filename = self._save(details)
+        if not filename:
+            return {'pdf_url': None}, None
+        return {'pdf_url': f"/download_receipt/{filename}"}, details['payment_id']
+
+    def attachable(self, details):
+        """Attachment reference for a payment confirmed without a browser (webhook)"""
+        return details['payment_id'] if self._save(details) else None
+
+    def attachment(self, ref):
+        # Normally still in memory from verify_payment; read back from receipts/ after a restart
+        pdf_bytes = self.store.read(ref)
+        return None if pdf_bytes is None else (receipt_filename(ref), pdf_bytes)
+
+
+class SignedReceipts:
+    ledger_label = "Signed Link"
+
+    def __init__(self, get_template, secret, ttl=900, url_prefix="/api/receipt/"):
+        self.get_template = get_template
+        self.secret = secret
+        self.ttl = ttl
+        self.url_prefix = url_prefix
+
+    def publish(self, details):
+        # Rendered only when the link is opened, streamed as binary
+        token = sign_receipt_token(details, self.secret, self.ttl)
+        return {'pdf_url': f"{self.url_prefix}{token}"}, dict(details)
+
+    def attachable(self, details):
+        return dict(details)
+
+    def attachment(self, ref):
+        # Rendered here, in the outbox drain, after the response has gone out
+        return receipt_filename(ref['payment_id']), self.get_template().render(ref)
+
+    def load(self, token):
+        """(payment_id, receipt date) for a link that is genuine and not expired, else None"""
+        return load_receipt_token(token, self.secret)
+
+
+class InlineReceipts:
+    ledger_label = "Base64 Download"
+
+    def __init__(self, get_template, keep=32):
+        self.get_template = get_template
+        self.keep = keep
+        # PDFs rendered for a verify response, kept for that payment's confirmation email
+        self._rendered = OrderedDict()
+
+    def publish(self, details):
+        try:
+            pdf_bytes = self.get_template().render(details)
+        except Exception as e:
+            print(f"PDF Error: {e}")
+            return {'pdf_base64': None}, dict(details)
+        self._rendered[details['payment_id']] = pdf_bytes
+        while len(self._rendered) > self.keep:
+            self._rendered.popitem(last=False)
+        return {'pdf_base64': base64.b64encode(pdf_bytes).decode('utf-8')}, dict(details)
+
+    def attachable(self, details):
+        return dict(details)
+
+    def attachment(self, ref):
+        pdf_bytes = self._rendered.pop(ref['payment_id'], None) or self.get_template().render(ref)
+        return receipt_filename(ref['payment_id']), pdf_bytes
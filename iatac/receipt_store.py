@@ -0,0 +1,151 @@
+"""Rendered receipts on disk, reused per payment and kept within a size budget.
+
+Each payment's receipt is rendered once and served from receipts/ after
+that. A small SQLite index next to the files records the details it was
+rendered from, a content hash (used as the ETag) and when it was last
+served. Once the directory grows past its budget the least recently served
+receipts are deleted; asking for one again renders it from the stored
+details. The bytes of the last few renders are also kept in memory so the
+confirmation email can attach them without reading the file back.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+FILENAME_RE = re.compile(r"^Receipt_([A-Za-z0-9_]+)\.pdf$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS receipts (
+    payment_id TEXT PRIMARY KEY,
+    details TEXT,
+    etag TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    present INTEGER NOT NULL DEFAULT 0,
+    last_access REAL NOT NULL DEFAULT 0
+)
+"""
+
+
+def receipt_filename(payment_id):
+    return f"Receipt_{payment_id}.pdf"
+
+
+def payment_id_from_filename(filename):
+    match = FILENAME_RE.match(filename)
+    return match.group(1) if match else None
+
+
+class ReceiptStore:
+    """Receipt files keyed by payment ID with LRU eviction past ``max_bytes``.
+
+    Receipts already on disk without an index entry (rendered before the
+    store existed) are served but never evicted, since they could not be
+    rendered again.
+    """
+
+    def __init__(self, directory, template, max_bytes=50 * 1024 * 1024, keep_recent=32):
+        self.directory = directory
+        self.template = template
+        self.max_bytes = max_bytes
+        self.keep_recent = keep_recent
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()  # payment_id -> PDF bytes of the latest renders
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, "index.sqlite3")
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.index_path, timeout=10)
+
+    def path(self, payment_id):
+        return os.path.join(self.directory, receipt_filename(payment_id))
+
+    def _write(self, payment_id, pdf_bytes):
+        path = self.path(payment_id)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(pdf_bytes)
+        os.replace(tmp, path)
+
+    def save(self, details):
+        """Render and store the receipt for ``details`` unless it is already on disk. Returns the filename."""
+        payment_id = details['payment_id']
+        if self.lookup(payment_id) is None:
+            self._render(payment_id, details)
+        return receipt_filename(payment_id)
+
+    def _render(self, payment_id, details):
+        """Render, write and index a receipt. Returns its ETag."""
+        pdf_bytes = self.template.render(details)
+        etag = hashlib.sha256(pdf_bytes).hexdigest()[:32]
+        self._write(payment_id, pdf_bytes)
+        with self._lock:
+            self._recent[payment_id] = pdf_bytes
+            self._recent.move_to_end(payment_id)
+            while len(self._recent) > self.keep_recent:
+                self._recent.popitem(last=False)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO receipts (payment_id, details, etag, size, present, last_access) "
+                "VALUES (?, ?, ?, ?, 1, ?)",
+                (payment_id, json.dumps(details), etag, len(pdf_bytes), time.time())
+            )
+        self._evict()
+        return etag
+
+    def lookup(self, payment_id):
+        """(path, etag) of a receipt that is on disk, re-rendering an evicted one. None if unknown."""
+        path = self.path(payment_id)
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT details, etag, present FROM receipts WHERE payment_id = ?", (payment_id,)
+            ).fetchone()
+        if row is None:
+            # Rendered before the index existed
+            return (path, None) if os.path.exists(path) else None
+
+        details, etag, present = row
+        if not (present and os.path.exists(path)):
+            etag = self._render(payment_id, json.loads(details))
+        else:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("UPDATE receipts SET last_access = ? WHERE payment_id = ?", (time.time(), payment_id))
+        return path, etag
+
+    def read(self, payment_id):
+        """PDF bytes of a receipt, from memory if it was rendered recently. None if unknown."""
+        with self._lock:
+            pdf_bytes = self._recent.get(payment_id)
+        if pdf_bytes is not None:
+            return pdf_bytes
+        found = self.lookup(payment_id)
+        if found is None:
+            return None
+        with open(found[0], "rb") as f:
+            return f.read()
+
+    def _evict(self):
+        """Delete least recently served receipts until the indexed ones fit in the budget"""
+        with self._lock, closing(self._connect()) as conn, conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM receipts WHERE present = 1").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for payment_id, size in conn.execute(
+                "SELECT payment_id, size FROM receipts WHERE present = 1 ORDER BY last_access"
+            ).fetchall():
+                try:
+                    os.remove(self.path(payment_id))
+                except FileNotFoundError:
+                    pass
+                conn.execute("UPDATE receipts SET present = 0 WHERE payment_id = ?", (payment_id,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
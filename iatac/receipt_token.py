@@ -0,0 +1,51 @@
+"""Short-lived signed receipt links.
+
+The serverless handler has no disk that outlives an instance, so instead of
+storing the receipt it hands out a token carrying the payment ID, the
+receipt date and an HMAC over them. Any instance can check the signature,
+fetch the payment again and render the PDF when the link is opened.
+
+The link ends up in browser history and access logs, so it carries nothing
+about the buyer: their name, phone and email come from Razorpay on download.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _signing_key(secret):
+    # Derived so a receipt signature is never valid as any other signature made with the same secret
+    return hmac.new(secret.encode(), b"iatac-receipt-token", hashlib.sha256).digest()
+
+
+def sign_receipt_token(details, secret, ttl=900):
+    """Token for the receipt of ``details`` that stops being accepted after ``ttl`` seconds"""
+    body = {"p": details["payment_id"], "d": details["date"], "exp": int(time.time()) + ttl}
+    payload = _b64encode(json.dumps(body, separators=(",", ":")).encode())
+    signature = _b64encode(hmac.new(_signing_key(secret), payload.encode(), hashlib.sha256).digest())
+    return f"{payload}.{signature}"
+
+
+def load_receipt_token(token, secret):
+    """(payment_id, receipt date) from a valid, unexpired token, or None"""
+    try:
+        payload, signature = token.split(".")
+        expected = hmac.new(_signing_key(secret), payload.encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(_b64decode(signature), expected):
+            return None
+        body = json.loads(_b64decode(payload))
+        if body["exp"] < time.time():
+            return None
+        return body["p"], body["d"]
+    except (ValueError, KeyError, TypeError):
+        return None
@@ -0,0 +1,148 @@
+"""Limits on the upstreams a payment depends on: Razorpay, Gmail and Google Sheets.
+
+Each upstream gets a Guard, which is two things at once:
+
+* a bulkhead: at most ``max_in_flight`` calls to it at a time. Further calls
+  are refused straight away instead of tying up one more worker thread
+  behind an upstream that has stopped answering;
+* a circuit breaker: after ``failures`` failed calls in a row the circuit
+  opens and every call is refused for ``reset_after`` seconds. Then a single
+  probe call is let through (half-open); if it succeeds the circuit closes,
+  if not it stays open for another ``reset_after`` seconds.
+
+A refused call raises Unavailable. The routes answer it with a 503; the
+outbox puts the entry back for at least ``retry_after`` without counting
+an attempt, and the job queue does not retry it.
+
+Timeouts are set on the clients themselves (the Razorpay session, the SMTP
+pool, the Sheets client), because a thread blocked in a socket call cannot
+be interrupted from outside. The guard bounds how many threads can be stuck
+that way.
+"""
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class Unavailable(Exception):
+    """A guarded call was refused without being made"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Guard:
+    """Bulkhead and circuit breaker for one upstream, shared by threads and asyncio tasks.
+
+    ``is_failure(exc)`` decides whether an error counts against the
+    upstream; errors about the request itself (a refused recipient, an
+    invalid payment ID) should not open the circuit.
+    """
+
+    def __init__(self, name, max_in_flight=10, failures=5, reset_after=30.0, is_failure=None):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.failures = failures
+        self.reset_after = reset_after
+        self.is_failure = is_failure or (lambda exc: True)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failed = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._in_flight = 0
+        self.rejected = {'open': 0, 'full': 0}
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_after:
+            self._state = HALF_OPEN
+        return self._state
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _enter(self):
+        """Take a slot or raise Unavailable; returns True when the call is the half-open probe"""
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN or (state == HALF_OPEN and self._probing):
+                self.rejected['open'] += 1
+                wait = max(1, int(self._opened_at + self.reset_after - time.monotonic()))
+                raise Unavailable(f"{self.name} is unavailable, please try again shortly", wait)
+            if self._in_flight >= self.max_in_flight:
+                self.rejected['full'] += 1
+                raise Unavailable(f"{self.name} is busy, please try again shortly")
+            self._in_flight += 1
+            if state == HALF_OPEN:
+                self._probing = True
+                return True
+            return False
+
+    def _exit(self, probe, failed):
+        """Give the slot back; ``failed`` None means the call was cancelled and says nothing"""
+        with self._lock:
+            self._in_flight -= 1
+            if probe:
+                self._probing = False
+            if failed is None:
+                return
+            if not failed:
+                if self._state != CLOSED:
+                    print(f"{self.name} circuit closed")
+                self._state = CLOSED
+                self._failed = 0
+                return
+            self._failed += 1
+            if probe:
+                print(f"{self.name} still failing, circuit stays open")
+            elif self._failed >= self.failures and self._state != OPEN:
+                print(f"{self.name} circuit opened after {self._failed} failure(s)")
+            if probe or self._failed >= self.failures:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def call(self, fn, *args, **kwargs):
+        probe = self._enter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._exit(probe, self.is_failure(e))
+            raise
+        except BaseException:
+            self._exit(probe, None)
+            raise
+        self._exit(probe, False)
+        return result
+
+    async def acall(self, fn, *args, **kwargs):
+        """call() for a coroutine function"""
+        probe = self._enter()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            self._exit(probe, self.is_failure(e))
+            raise
+        except BaseException:  # cancelled
+            self._exit(probe, None)
+            raise
+        self._exit(probe, False)
+        return result
+
+    def gauges(self):
+        """Circuit state, calls in flight and refusals, for Metrics.collect"""
+        with self._lock:
+            state = self._current_state()
+            in_flight = self._in_flight
+            rejected = dict(self.rejected)
+        labels = {'dependency': self.name}
+        for s in (CLOSED, OPEN, HALF_OPEN):
+            yield 'circuit_state', dict(labels, state=s), int(s == state)
+        yield 'dependency_in_flight', labels, in_flight
+        for reason, count in rejected.items():
+            yield 'dependency_rejected_total', dict(labels, reason=reason), count
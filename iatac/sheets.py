@@ -0,0 +1,343 @@
+"""Google Sheets access for the payment ledger.
+
+The service-account login, the spreadsheet lookup and the worksheet handle
+are set up once per process and reused for every payment. Rows are
+buffered and written in bulk so bursts of payments stay inside the
+per-minute write quota.
+
+gspread and google-auth are imported on first use; they are a large part
+of a serverless cold start and most requests never touch the sheet.
+"""
+import contextlib
+import glob
+import json
+import os
+import threading
+import time
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: no cross-process locking
+    fcntl = None
+
+from iatac.resilience import OPEN
+
+SCOPES = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+
+# API errors after which the cached handle can no longer be trusted
+INVALIDATING_STATUS = (401, 403, 404)
+
+QUOTA_EXCEEDED = 429
+
+# "Razorpay Payment ID" column of the ledger (1-based, as in the sheet)
+PAYMENT_ID_COLUMN = 10
+
+
+class SheetsSession:
+    """Process-wide, thread-safe handle on the first worksheet of a spreadsheet.
+
+    The access token is refreshed when it has expired; the client and
+    worksheet are only re-opened after invalidate(), which happens
+    automatically when the API reports the handle as unauthorised or gone.
+
+    Each API call gives up after ``timeout`` seconds. With a ``guard``
+    (iatac.resilience) the calls also go through its bulkhead and circuit
+    breaker.
+    """
+
+    def __init__(self, creds_file, sheet_name, worksheet_index=0, timeout=30, guard=None):
+        self.creds_file = creds_file
+        self.sheet_name = sheet_name
+        self.worksheet_index = worksheet_index
+        self.timeout = timeout
+        self.guard = guard
+        self._lock = threading.RLock()
+        self._creds = None
+        self._client = None
+        self._worksheet = None
+
+    def worksheet(self):
+        import gspread
+        from google.auth.transport.requests import Request
+        from google.oauth2.service_account import Credentials
+
+        with self._lock:
+            if self._creds is None:
+                self._creds = Credentials.from_service_account_file(self.creds_file, scopes=SCOPES)
+            if not self._creds.valid:
+                self._creds.refresh(Request())
+            if self._client is None:
+                self._client = gspread.authorize(self._creds)
+                self._client.set_timeout(self.timeout)
+            if self._worksheet is None:
+                self._worksheet = self._client.open(self.sheet_name).get_worksheet(self.worksheet_index)
+            return self._worksheet
+
+    def invalidate(self):
+        """Forget the client and worksheet so the next call opens them again"""
+        with self._lock:
+            self._client = None
+            self._worksheet = None
+
+    def _call(self, method, *args, **kwargs):
+        if self.guard is not None:
+            return self.guard.call(self._request, method, *args, **kwargs)
+        return self._request(method, *args, **kwargs)
+
+    def _request(self, method, *args, **kwargs):
+        from gspread.exceptions import APIError
+
+        with self._lock:
+            worksheet = self.worksheet()
+            try:
+                return getattr(worksheet, method)(*args, **kwargs)
+            except APIError as e:
+                if e.response.status_code in INVALIDATING_STATUS:
+                    self.invalidate()
+                raise
+
+    def append_row(self, row):
+        return self._call('append_row', row)
+
+    def append_rows(self, rows):
+        return self._call('append_rows', rows)
+
+    def col_values(self, col):
+        return self._call('col_values', col)
+
+
+class LedgerIndex:
+    """Payment IDs already in the ledger, for O(1) duplicate checks.
+
+    Warmed with one read of the Payment ID column the first time it is
+    asked, then kept current by add(). If the warm-up read fails the check
+    answers from what it has and the read is retried on the next call.
+    """
+
+    def __init__(self, session, column=PAYMENT_ID_COLUMN):
+        self.session = session
+        self.column = column
+        self._lock = threading.Lock()
+        self._ids = set()
+        self._warmed = False
+
+    def _warm(self):
+        try:
+            self._ids.update(self.session.col_values(self.column))
+            self._warmed = True
+        except Exception as e:
+            print(f"Google Sheet Error (ledger index warm-up): {e}")
+
+    def __contains__(self, payment_id):
+        with self._lock:
+            if not self._warmed:
+                self._warm()
+            return payment_id in self._ids
+
+    def add(self, payment_id):
+        with self._lock:
+            self._ids.add(payment_id)
+
+
+class SheetBatchWriter:
+    """Buffers ledger rows and writes them with one append_rows call.
+
+    A batch is flushed once ``max_rows`` rows are waiting or ``max_wait``
+    seconds after its first row arrived, by a background thread started on
+    first use. With ``max_wait=None`` there is no thread and the caller
+    flushes explicitly (the serverless handler calls maybe_flush() after
+    draining its outbox).
+
+    Rows that could not be written stay buffered; a 429 from the API makes
+    the flusher back off exponentially before trying again. When
+    ``spool_path`` is set, buffered rows are also kept in a JSON-lines file
+    ``<spool_path>.<pid>`` that this process holds locked. On start, spool
+    files whose owner is gone (a restarted or crashed worker) are taken
+    over, so rows are neither lost nor written twice by sibling workers.
+
+    With an ``index``, rows whose payment ID is already logged or already
+    buffered are skipped. With ``metrics`` (iatac.metrics), each
+    append_rows call is timed as the ``sheets_append`` stage.
+    """
+
+    def __init__(self, session, max_rows=20, max_wait=5.0, spool_path=None,
+                 backoff=2.0, max_backoff=120.0, index=None, metrics=None):
+        self.session = session
+        self.index = index
+        self.metrics = metrics
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.spool_path = spool_path
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._rows = []
+        self._first_added = None
+        self._thread = None
+        self._closed = False
+        self._spool = None
+        self._delay = backoff
+        self._retry_at = None  # maybe_flush() waits until then after a failure
+        if spool_path:
+            self._spool = open(f"{spool_path}.{os.getpid()}", 'a+')
+            if fcntl:
+                fcntl.flock(self._spool, fcntl.LOCK_EX)
+            self._rows = self._adopt_spools()
+            self._rewrite_spool()
+            if index is not None:
+                for row in self._rows:
+                    index.add(row[PAYMENT_ID_COLUMN - 1])
+            if self._rows:
+                self._first_added = time.monotonic()
+                if max_wait is not None:
+                    self._start()
+
+    def _adopt_spools(self):
+        """Collect rows from our own spool and from spools whose process has exited"""
+        rows = []
+        for path in sorted(glob.glob(f"{self.spool_path}.*")):
+            if path == self._spool.name:
+                self._spool.seek(0)
+                rows.extend(json.loads(line) for line in self._spool if line.strip())
+                continue
+            try:
+                f = open(path)
+            except OSError:
+                continue
+            with f:
+                if fcntl:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue  # a live worker owns it
+                    try:
+                        if os.stat(path).st_ino != os.fstat(f.fileno()).st_ino:
+                            continue  # already taken over and removed by someone else
+                    except FileNotFoundError:
+                        continue
+                rows.extend(json.loads(line) for line in f if line.strip())
+                os.remove(path)
+        return rows
+
+    def add(self, row):
+        """Buffer a row. Returns False if its payment ID is already logged."""
+        if self.index is not None:
+            payment_id = row[PAYMENT_ID_COLUMN - 1]
+            if payment_id in self.index:
+                return False
+            self.index.add(payment_id)
+        with self._cond:
+            self._rows.append(row)
+            if self._first_added is None:
+                self._first_added = time.monotonic()
+            if self._spool:
+                self._spool.write(json.dumps(row) + "\n")
+                self._spool.flush()
+            self._cond.notify()
+        if self.max_wait is not None and self._thread is None:
+            self._start()
+        return True
+
+    def pending(self):
+        with self._cond:
+            return len(self._rows)
+
+    def _start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+                self._thread.start()
+
+    def _rewrite_spool(self):
+        if not self._spool:
+            return
+        self._spool.seek(0)
+        self._spool.truncate()
+        for row in self._rows:
+            self._spool.write(json.dumps(row) + "\n")
+        self._spool.flush()
+
+    def flush(self):
+        """Write everything buffered so far in one call. Raises if the API call fails."""
+        with self._flush_lock:
+            with self._cond:
+                batch = list(self._rows)
+            if not batch:
+                return 0
+            with self.metrics.stage('sheets_append') if self.metrics else contextlib.nullcontext():
+                self.session.append_rows(batch)
+            with self._cond:
+                del self._rows[:len(batch)]
+                self._first_added = time.monotonic() if self._rows else None
+                self._rewrite_spool()
+            print(f"Logged {len(batch)} payment(s) to Google Sheet.")
+            return len(batch)
+
+    def maybe_flush(self):
+        """flush() unless the Sheets circuit is open or the last failed maybe_flush()
+        is still backing off. Errors are logged and the rows kept; returns rows written."""
+        guard = self.session.guard
+        if not self.pending() or (guard is not None and guard.state == OPEN):
+            return 0
+        if self._retry_at is not None and time.monotonic() < self._retry_at:
+            return 0
+        try:
+            written = self.flush()
+        except Exception as e:
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            reason = "quota exceeded" if status == QUOTA_EXCEEDED else e
+            print(f"Google Sheet Error ({reason}), keeping {self.pending()} row(s), retrying in {self._delay:.0f}s")
+            self._retry_at = time.monotonic() + self._delay
+            self._delay = min(self._delay * 2, self.max_backoff)
+            return 0
+        self._retry_at = None
+        self._delay = self.backoff
+        return written
+
+    def _due(self):
+        if not self._rows:
+            return None
+        if self._closed or len(self._rows) >= self.max_rows:
+            return 0
+        return max(0, self._first_added + self.max_wait - time.monotonic())
+
+    def _run(self):
+        delay = self.backoff
+        while True:
+            with self._cond:
+                wait = self._due()
+                while wait is None or wait > 0:
+                    if self._closed and wait is None:
+                        return
+                    self._cond.wait(wait)
+                    wait = self._due()
+            try:
+                self.flush()
+                delay = self.backoff
+            except Exception as e:
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                reason = "quota exceeded" if status == QUOTA_EXCEEDED else e
+                print(f"Google Sheet Error ({reason}), keeping {self.pending()} row(s), retrying in {delay:.0f}s")
+                with self._cond:
+                    if self._closed:
+                        return
+                    self._cond.wait(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    def close(self, timeout=10):
+        """Flush what is buffered and stop the background thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        else:
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Google Sheet Error: {e}")
+        with self._cond:
+            if self._spool and not self._rows:
+                os.remove(self._spool.name)  # nothing left for a successor to adopt
+                self._spool.close()
+                self._spool = None
@@ -0,0 +1,203 @@
+"""Precompressed, fingerprinted static assets.
+
+Every page and asset is hashed once at startup. Text assets get gzip (and
+brotli, when installed) variants, cached on disk by content hash so only
+the first worker, or `python -m iatac.static` at build time, pays for the
+compression. References in HTML and CSS are rewritten to fingerprinted
+names (css/style.css -> css/style.1a2b3c4d.css), which never change and
+are served as immutable. Pages themselves are served with an ETag and
+revalidated.
+
+Only files in the index are served at all. Small files are answered from
+memory; large ones are streamed from an already-known path through the
+server's file wrapper, which gunicorn sends with sendfile(2).
+"""
+import glob
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import sys
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from flask import Response, request
+from werkzeug.wsgi import wrap_file
+
+# Directories served as static assets, plus the top-level HTML pages
+ASSET_DIRS = ("css", "fonts", "images", "js")
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/javascript", "image/svg+xml", "application/vnd.ms-fontobject",
+    "font/ttf", "font/otf", "application/x-font-ttf", "application/font-sfnt",
+)
+
+FINGERPRINTED_CACHE = "public, max-age=31536000, immutable"
+
+# Files above this size are not held in memory
+MEMORY_LIMIT = 256 * 1024
+
+HTML_REF_RE = re.compile(r'((?:href|src)=")([^"#?:]+)(")')
+CSS_REF_RE = re.compile(r"""(url\(['"]?)([^'")?#:]+)([^'")]*['"]?\))""")
+
+mimetypes.add_type("font/woff2", ".woff2")
+mimetypes.add_type("font/woff", ".woff")
+mimetypes.add_type("font/ttf", ".ttf")
+mimetypes.add_type("font/otf", ".otf")
+
+
+class Asset:
+    def __init__(self, url, path, body, mimetype):
+        self.url = url
+        self.path = path
+        self.body = body
+        self.size = len(body)
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.etag = self.digest[:32]
+        self.mtime = os.path.getmtime(path)
+        self.variants = {}  # content-encoding -> bytes
+        base, ext = posixpath.splitext(url)
+        self.fingerprinted_url = f"{base}.{self.digest[:8]}{ext}"
+
+    @property
+    def compressible(self):
+        return self.mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+class StaticAssets:
+    """In-memory index of the site's static files and their encoded variants"""
+
+    def __init__(self, root, cache_dir=None, max_age=3600, memory_limit=MEMORY_LIMIT):
+        self.root = os.path.abspath(root)
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.memory_limit = memory_limit
+        self.assets = {}  # url -> Asset, under both the plain and fingerprinted url
+        self._build()
+
+    def _files(self):
+        for name in sorted(os.listdir(self.root)):
+            if name.endswith(".html"):
+                yield name
+        for d in ASSET_DIRS:
+            for path in sorted(glob.glob(os.path.join(self.root, d, "**", "*"), recursive=True)):
+                if os.path.isfile(path):
+                    yield os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def _load(self, url, rewrite=None):
+        path = os.path.join(self.root, url)
+        with open(path, "rb") as f:
+            body = f.read()
+        if rewrite:
+            body = rewrite(url, body)
+        mimetype = mimetypes.guess_type(url)[0] or "application/octet-stream"
+        asset = Asset(url, path, body, mimetype)
+        if asset.compressible:
+            self._compress(asset)
+        if not rewrite and asset.size > self.memory_limit:
+            asset.body = None  # unchanged on disk, streamed from there
+        self.assets[url] = asset
+        self.assets[asset.fingerprinted_url] = asset
+
+    def _build(self):
+        urls = list(self._files())
+        # Leaf assets first so CSS can point at their fingerprints, then CSS, then pages
+        for url in urls:
+            if not url.endswith((".css", ".html")):
+                self._load(url)
+        for url in urls:
+            if url.endswith(".css"):
+                self._load(url, self._rewrite_css)
+        for url in urls:
+            if url.endswith(".html"):
+                self._load(url, self._rewrite_html)
+
+    def _fingerprint(self, from_url, ref):
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(from_url), ref))
+        asset = self.assets.get(target)
+        if asset is None or asset.url.endswith(".html"):
+            return ref
+        return posixpath.relpath(asset.fingerprinted_url, posixpath.dirname(from_url) or ".")
+
+    def _rewrite_html(self, url, body):
+        text = body.decode("utf-8")
+        text = HTML_REF_RE.sub(lambda m: m.group(1) + self._fingerprint(url, m.group(2)) + m.group(3), text)
+        return text.encode("utf-8")
+
+    def _rewrite_css(self, url, body):
+        text = body.decode("utf-8")
+        text = CSS_REF_RE.sub(lambda m: m.group(1) + self._fingerprint(url, m.group(2)) + m.group(3), text)
+        return text.encode("utf-8")
+
+    def _compress(self, asset):
+        encoders = [("gzip", lambda b: gzip.compress(b, 9, mtime=0))]
+        if brotli:
+            encoders.insert(0, ("br", lambda b: brotli.compress(b, quality=11)))
+        for encoding, encode in encoders:
+            cached = os.path.join(self.cache_dir, f"{asset.digest}.{encoding}") if self.cache_dir else None
+            if cached and os.path.exists(cached):
+                with open(cached, "rb") as f:
+                    data = f.read()
+            else:
+                data = encode(asset.body)
+                if cached:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    tmp = f"{cached}.{os.getpid()}.tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp, cached)
+            # Only worth sending if it actually saves bytes (woff/woff2 are already compressed)
+            if len(data) < len(asset.body) * 0.9:
+                asset.variants[encoding] = data
+
+    def get(self, url):
+        return self.assets.get(url)
+
+    def serve(self, url):
+        """Response for an indexed asset, or None if ``url`` is not one"""
+        asset = self.assets.get(url)
+        if asset is None:
+            return None
+
+        accepted = request.accept_encodings
+        encoding = next((e for e in ("br", "gzip") if e in asset.variants and accepted[e]), None)
+
+        if encoding:
+            response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+            response.content_encoding = encoding
+            response.set_etag(f"{asset.etag}-{encoding}")
+        elif asset.body is not None:
+            response = Response(asset.body, mimetype=asset.mimetype)
+            response.set_etag(asset.etag)
+        else:
+            response = Response(wrap_file(request.environ, open(asset.path, "rb")),
+                                mimetype=asset.mimetype, direct_passthrough=True)
+            response.content_length = asset.size
+            response.set_etag(asset.etag)
+        response.last_modified = asset.mtime
+        if asset.variants:
+            response.vary.add("Accept-Encoding")
+        response.make_conditional(request, accept_ranges=True,
+                                  complete_length=response.content_length)
+
+        if url == asset.fingerprinted_url:
+            response.headers["Cache-Control"] = FINGERPRINTED_CACHE
+        elif asset.mimetype == "text/html":
+            response.headers["Cache-Control"] = "no-cache"
+        else:
+            response.headers["Cache-Control"] = f"public, max-age={self.max_age}"
+        return response
+
+
+if __name__ == "__main__":
+    # Build step: warm the compressed-variant cache so workers start instantly
+    root = sys.argv[1] if len(sys.argv) > 1 else "."
+    cache_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.join(root, ".static_cache")
+    assets = StaticAssets(root, cache_dir=cache_dir)
+    unique = {id(a): a for a in assets.assets.values()}.values()
+    print(f"Indexed {len(unique)} files, {sum(1 for a in unique if a.variants)} with compressed variants")
@@ -46,6 +46,14 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
+    // Same key for every attempt until a payment succeeds, so a double-click or
+    // retry gets back the order already created instead of a new one
+    let idempotencyKey = null;
+    function newIdempotencyKey() {
+        return (window.crypto && crypto.randomUUID) ? crypto.randomUUID()
+            : Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+
     // Handle Form Submission
     paymentForm.onsubmit = async function (e) {
         e.preventDefault();
@@ -59,9 +67,10 @@ document.addEventListener('DOMContentLoaded', function () {
 
         try {
             // 1. Create Order
+            idempotencyKey = idempotencyKey || newIdempotencyKey();
             const response = await fetch(`${API_BASE_URL}/create_order`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey },
                 body: JSON.stringify(userData)
             });
 
@@ -99,15 +108,21 @@ document.addEventListener('DOMContentLoaded', function () {
                     const result = await verifyResponse.json();
                     if (result.status === "Success") {
                         const details = result.details;
+                        idempotencyKey = null;
 
                         // Show success state
                         document.getElementById('paymentForm').style.display = "none";
                         document.getElementById('paymentSuccess').style.display = "block";
 
-                        // Handle Download Button (Base64)
+                        // Handle Download Button (signed link, or Base64 fallback)
                         document.getElementById('downloadReceiptBtn').onclick = function (e) {
                             e.preventDefault();
-                            if (details.pdf_base64) {
+                            if (details.pdf_url) {
+                                const link = document.createElement('a');
+                                link.href = details.pdf_url;
+                                link.download = `Receipt_${details.payment_id}.pdf`;
+                                link.click();
+                            } else if (details.pdf_base64) {
                                 const link = document.createElement('a');
                                 link.href = `data:application/pdf;base64,${details.pdf_base64}`;
                                 link.download = `Receipt_${details.payment_id}.pdf`;
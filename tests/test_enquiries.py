@@ -0,0 +1,84 @@
+import pytest
+
+from iatac import enquiries as enquiries_module
+from iatac.enquiries import EnquiryBuffer
+
+
+@pytest.fixture
+def buffer(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(enquiries_module, 'time', clock)
+    return EnquiryBuffer(str(tmp_path / "enquiries.sqlite3"), max_items=3, max_wait=900, lease=120)
+
+
+def enquiry(n, message="Hello", urgent=False):
+    return {"name": f"n{n}", "mobile": "9820000000", "email": f"u{n}@x.in", "message": message, "urgent": urgent}
+
+
+def test_a_digest_is_due_after_max_items(buffer):
+    assert buffer.add(enquiry(1)) == (1, False)
+    assert buffer.add(enquiry(2)) == (2, False)
+    assert buffer.add(enquiry(3)) == (3, True)
+    assert buffer.due()
+
+
+def test_a_digest_is_due_after_max_wait(buffer, clock):
+    buffer.add(enquiry(1))
+    clock.advance(899)
+    assert not buffer.due()
+    clock.advance(1)
+    assert buffer.due()
+
+
+def test_urgent_enquiries(buffer):
+    assert buffer.is_urgent(enquiry(1, urgent=True))
+    assert buffer.is_urgent(enquiry(1, "This is URGENT, please call"))
+    assert not buffer.is_urgent(enquiry(1, "Not urgently needed"))
+    assert not EnquiryBuffer(buffer.path, urgent_words=()).is_urgent(enquiry(1, "urgent"))
+
+
+def test_claimed_enquiries_are_not_claimed_again_until_their_lease_expires(buffer, clock):
+    for n in range(4):
+        buffer.add(enquiry(n))
+
+    ids, batch = buffer.claim()
+    assert ids == [1, 2, 3]
+    assert [e['name'] for e in batch] == ["n0", "n1", "n2"] and batch[0]['id'] == 1
+    assert buffer.claim() == ([4], [dict(enquiry(3), id=4)])
+    assert buffer.claim() == ([], [])
+    assert not buffer.due()
+
+    clock.advance(121)  # the worker holding them died
+    assert buffer.claim()[0] == [1, 2, 3]
+
+
+def test_claim_by_id_skips_enquiries_already_claimed(buffer):
+    buffer.add(enquiry(1))
+    buffer.add(enquiry(2, "urgent"))
+    buffer.claim()
+
+    assert buffer.claim(ids=[2]) == ([], [])
+
+
+def test_flush_deletes_what_was_sent(buffer):
+    for n in range(4):
+        buffer.add(enquiry(n))
+    sent = []
+
+    assert buffer.flush(sent.append) == 3
+    assert buffer.flush(sent.append) == 1
+    assert buffer.flush(sent.append) == 0
+    assert [len(batch) for batch in sent] == [3, 1]
+    assert buffer.pending() == 0
+
+
+def test_a_failed_send_releases_the_enquiries(buffer):
+    buffer.add(enquiry(1))
+    buffer.add(enquiry(2))
+
+    def down(batch):
+        raise OSError("SMTP down")
+
+    with pytest.raises(OSError):
+        buffer.flush(down)
+    assert buffer.pending() == 2
+    assert buffer.claim()[0] == [1, 2]  # straight away, not after the lease
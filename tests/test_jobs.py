@@ -0,0 +1,68 @@
+import threading
+import time
+
+from iatac.jobs import JobQueue
+from iatac.resilience import Unavailable
+
+
+def test_shutdown_keeps_to_its_timeout_with_a_full_queue():
+    jobs = JobQueue()
+    jobs.add_lane('email', workers=1, max_queue=2)
+    release = threading.Event()
+    jobs.submit('email', release.wait)
+    time.sleep(0.05)  # the worker has taken the first job
+    jobs.submit('email', release.wait)
+    jobs.submit('email', release.wait)
+
+    started = time.monotonic()
+    jobs.shutdown(0.2)
+    assert time.monotonic() - started < 1
+    release.set()
+
+
+def test_a_failed_job_is_not_retried_once_shutdown_has_begun():
+    jobs = JobQueue()
+    jobs.add_lane('email', workers=1, retries=3, backoff=10)
+    calls = []
+
+    def down():
+        calls.append(1)
+        raise OSError("SMTP down")
+
+    jobs.submit('email', down)
+    time.sleep(0.05)  # first attempt failed, now backing off
+    jobs.shutdown(1)
+
+    assert calls == [1]
+    assert jobs.stats()['email']['failed'] == 1
+
+
+def test_jobs_submitted_during_shutdown_run_inline_once():
+    jobs = JobQueue()
+    jobs.add_lane('email', retries=3)
+    jobs.shutdown(0)
+    calls = []
+
+    def down():
+        calls.append(1)
+        raise OSError("SMTP down")
+
+    assert jobs.submit('email', down)
+    assert calls == [1]
+
+
+def test_a_refused_job_is_not_retried():
+    jobs = JobQueue()
+    jobs.add_lane('email', retries=3, backoff=10)
+    calls = []
+
+    def refused():
+        calls.append(1)
+        raise Unavailable("gmail is unavailable", retry_after=30)
+
+    jobs.submit('email', refused)
+    time.sleep(0.05)
+    jobs.shutdown(1)
+
+    assert calls == [1]
+    assert jobs.stats()['email']['retried'] == 0
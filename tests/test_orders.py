@@ -0,0 +1,34 @@
+from iatac import orders as orders_module
+from iatac.orders import OrderCache, OrderStore
+
+
+def test_paid_orders_are_seen_by_every_store_on_the_file(tmp_path):
+    path = str(tmp_path / "orders.sqlite3")
+    first, second = OrderStore(path), OrderStore(path)
+    first.put({'id': "order_1"})
+
+    assert not second.is_paid("order_1")
+    first.mark_paid("order_1")
+    first.mark_paid("order_1")
+    assert second.is_paid("order_1")
+
+
+def test_paid_markers_expire_with_the_orders(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(orders_module, 'time', clock)
+    store = OrderStore(str(tmp_path / "orders.sqlite3"), ttl=3600)
+    store.mark_paid("order_1")
+    clock.advance(3601)
+    store.mark_paid("order_2")
+
+    assert not store.is_paid("order_1")
+    assert store.is_paid("order_2")
+
+
+def test_a_forgotten_order_is_created_again():
+    cache = OrderCache()
+    created = iter([{'id': "order_1"}, {'id': "order_2"}])
+
+    assert cache.get_or_create("key", lambda: next(created)) == ({'id': "order_1"}, True)
+    assert cache.get_or_create("key", lambda: next(created)) == ({'id': "order_1"}, False)
+    cache.forget_order("order_1")
+    assert cache.get_or_create("key", lambda: next(created)) == ({'id': "order_2"}, True)
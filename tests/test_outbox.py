@@ -0,0 +1,154 @@
+import pytest
+
+from iatac import outbox as outbox_module
+from iatac.outbox import Outbox
+from iatac.resilience import Unavailable
+
+
+@pytest.fixture
+def outbox(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(outbox_module, 'time', clock)
+    return Outbox(str(tmp_path / "outbox.sqlite3"), lease=120, retry_delay=30, max_retry_delay=100,
+                  give_up_after=3600)
+
+
+def test_put_keeps_the_first_payload_of_a_kind(outbox):
+    outbox.put("pay_1", {'manager_email': {"to": "first"}})
+    outbox.put("pay_1", {'manager_email': {"to": "second"}, 'sheet_row': {"row": 1}})
+
+    assert outbox.has("pay_1", 'manager_email')
+    assert outbox.has("pay_1", 'sheet_row')
+    assert not outbox.has("pay_2", 'manager_email')
+    assert outbox.claim("pay_1", 'manager_email') == {"to": "first"}
+
+
+def test_a_claimed_entry_is_not_claimed_again_until_its_lease_expires(outbox, clock):
+    outbox.put("pay_1", {'sheet_row': {}})
+
+    assert outbox.claim("pay_1", 'sheet_row') == {}
+    assert outbox.claim("pay_1", 'sheet_row') is None
+    assert outbox.pending() == []
+
+    clock.advance(121)  # the worker holding it died
+    assert outbox.pending() == [("pay_1", 'sheet_row')]
+    assert outbox.claim("pay_1", 'sheet_row') == {}
+
+
+def test_a_released_entry_waits_for_its_retry_delay(outbox, clock):
+    outbox.put("pay_1", {'sheet_row': {}})
+    outbox.claim("pay_1", 'sheet_row')
+    outbox.release("pay_1", 'sheet_row', RuntimeError("quota"), delay=30)
+
+    assert outbox.pending() == []
+    assert outbox.backlog() == {('waiting', 'sheet_row'): 1}
+    clock.advance(30)
+    assert outbox.pending() == [("pay_1", 'sheet_row')]
+
+
+def fail_once(outbox, error=RuntimeError("down"), kind='sheet_row'):
+    outbox.claim("pay_1", kind)
+    outbox.release("pay_1", kind, error)
+
+
+def test_retries_back_off_per_entry(outbox, clock):
+    outbox.put("pay_1", {'sheet_row': {}})
+    waits = []
+    for _ in range(4):
+        fail_once(outbox)
+        waited = 0
+        while not outbox.pending():
+            clock.advance(1)
+            waited += 1
+        waits.append(waited)
+
+    assert waits == [30, 60, 100, 100]
+
+
+def test_a_refused_call_costs_no_attempt_and_waits_out_the_guard(outbox, clock):
+    outbox.put("pay_1", {'manager_email': {}})
+
+    def refused(payload):
+        raise Unavailable("gmail is unavailable", retry_after=45)
+
+    with pytest.raises(Unavailable):
+        outbox.run("pay_1", 'manager_email', refused)
+    clock.advance(44)
+    assert outbox.pending() == []
+    clock.advance(1)
+    assert outbox.pending() == [("pay_1", 'manager_email')]
+
+    # A real failure after it backs off as the first one
+    fail_once(outbox, kind='manager_email')
+    clock.advance(30)
+    assert outbox.pending() == [("pay_1", 'manager_email')]
+
+
+def test_an_entry_is_given_up_after_give_up_after_and_reported(outbox, clock, capsys):
+    outbox.put("pay_1", {'sheet_row': {}})
+    fail_once(outbox)
+    clock.advance(3600)
+    fail_once(outbox, RuntimeError("still down"))
+
+    assert "OUTBOX GAVE UP on sheet_row for pay_1" in capsys.readouterr().err
+    assert outbox.claim("pay_1", 'sheet_row') is None
+    assert outbox.pending() == []
+    assert outbox.backlog() == {('failed', 'sheet_row'): 1}
+    assert outbox.failed() == [("pay_1", 'sheet_row', 2, "still down")]
+
+
+def test_a_failed_entry_can_be_queued_again(outbox, clock):
+    outbox.put("pay_1", {'sheet_row': {}})
+    fail_once(outbox)
+    clock.advance(3600)
+    fail_once(outbox)
+
+    assert outbox.retry("pay_1", 'sheet_row')
+    assert not outbox.retry("pay_1", 'sheet_row')
+    assert outbox.claim("pay_1", 'sheet_row') == {}
+
+
+def test_a_completed_entry_does_not_run_again(outbox):
+    outbox.put("pay_1", {'manager_email': {"to": "a"}})
+    sent = []
+
+    assert outbox.run("pay_1", 'manager_email', sent.append)
+    assert not outbox.run("pay_1", 'manager_email', sent.append)
+    assert sent == [{"to": "a"}]
+    assert outbox.has("pay_1", 'manager_email')
+    assert outbox.backlog() == {}
+
+
+def test_drain_runs_ready_entries_and_holds_back_failures(outbox, clock):
+    outbox.put("pay_1", {'manager_email': {}, 'sheet_row': {}})
+    calls = []
+
+    def failing(payload):
+        calls.append('sheet_row')
+        raise RuntimeError("quota")
+
+    handlers = {'manager_email': lambda payload: calls.append('manager_email'), 'sheet_row': failing}
+    assert outbox.drain(handlers) == 1
+    assert outbox.drain(handlers) == 0  # the sheet row is waiting out its retry delay
+    assert calls == ['manager_email', 'sheet_row']
+
+    clock.advance(30)
+    handlers['sheet_row'] = lambda payload: calls.append('sheet_row')
+    assert outbox.drain(handlers) == 1
+    assert outbox.pending() == []
+
+
+def test_a_drain_with_a_deadline_runs_the_newest_entries_until_it_passes(outbox, clock):
+    outbox.put("pay_old", {'manager_email': {}})
+    clock.advance(1)
+    outbox.put("pay_new", {'manager_email': {}})
+    ran = []
+
+    def send(payload):
+        ran.append(payload)
+        clock.advance(5)
+
+    handlers = {'manager_email': send}
+    assert outbox.drain(handlers, deadline=clock.monotonic() + 5) == 1
+    assert outbox.pending() == [("pay_old", 'manager_email')]
+    assert outbox.drain(handlers, deadline=clock.monotonic()) == 0
+    assert outbox.drain(handlers, deadline=clock.monotonic() + 5) == 1
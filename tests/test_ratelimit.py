@@ -0,0 +1,83 @@
+import pytest
+
+from iatac import ratelimit
+from iatac.ratelimit import RateLimited, RateLimiter, parse_limit
+
+LIMITS = {'contact_submit': {'ip': (3, 60.0), 'contact': (2, 600.0)}}
+
+
+@pytest.fixture(params=['memory', 'file'])
+def limiter(request, tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    path = str(tmp_path / "ratelimit.sqlite3") if request.param == 'file' else None
+    return RateLimiter(LIMITS, path=path)
+
+
+def test_parse_limit():
+    assert parse_limit("20/60") == (20, 60.0)
+    assert parse_limit("5") == (5, 60.0)
+    for off in ("", None, "0", "off"):
+        assert parse_limit(off) is None
+
+
+def test_a_bucket_allows_its_capacity_then_refuses(limiter):
+    for i in range(3):
+        limiter.check('contact_submit', ip="10.0.0.1", email=f"u{i}@x.in")
+
+    with pytest.raises(RateLimited) as refused:
+        limiter.check('contact_submit', ip="10.0.0.1", email="u3@x.in")
+    assert refused.value.scope == 'ip'
+    assert refused.value.retry_after == 20  # one token per 60 / 3 seconds
+    limiter.check('contact_submit', ip="10.0.0.2", email="u4@x.in")  # other clients are unaffected
+
+
+def test_tokens_refill_over_time(limiter, clock):
+    for i in range(3):
+        limiter.check('contact_submit', ip="10.0.0.1", email=f"u{i}@x.in")
+
+    clock.advance(19)
+    with pytest.raises(RateLimited):
+        limiter.check('contact_submit', ip="10.0.0.1", email="u3@x.in")
+    clock.advance(1)
+    limiter.check('contact_submit', ip="10.0.0.1", email="u3@x.in")
+
+
+def test_email_and_phone_are_limited_however_they_are_written(limiter):
+    limiter.check('contact_submit', ip="10.0.0.1", email="Same@X.in ")
+    limiter.check('contact_submit', ip="10.0.0.2", email="same@x.in")
+    with pytest.raises(RateLimited) as refused:
+        limiter.check('contact_submit', ip="10.0.0.3", email=" SAME@x.in")
+    assert refused.value.scope == 'contact'
+
+    limiter.check('contact_submit', ip="10.0.0.4", phone="+91 98200 00000")
+    limiter.check('contact_submit', ip="10.0.0.5", phone="09820000000")
+    with pytest.raises(RateLimited):
+        limiter.check('contact_submit', ip="10.0.0.6", phone="9820000000")
+
+
+def test_a_refused_request_takes_no_tokens(limiter):
+    limiter.check('contact_submit', ip="10.0.0.1", email="a@x.in")
+    limiter.check('contact_submit', ip="10.0.0.1", email="a@x.in")
+    for _ in range(3):
+        with pytest.raises(RateLimited):
+            limiter.check('contact_submit', ip="10.0.0.1", email="a@x.in")
+
+    # The IP bucket still has its third token
+    limiter.check('contact_submit', ip="10.0.0.1", email="b@x.in")
+
+
+def test_routes_without_limits_are_not_checked(limiter):
+    for _ in range(10):
+        limiter.check('create_order', ip="10.0.0.1", email="a@x.in")
+
+
+def test_limiters_on_one_file_share_their_buckets(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    path = str(tmp_path / "ratelimit.sqlite3")
+    first, second = RateLimiter(LIMITS, path=path), RateLimiter(LIMITS, path=path)
+
+    first.check('contact_submit', ip="10.0.0.1")
+    first.check('contact_submit', ip="10.0.0.1")
+    second.check('contact_submit', ip="10.0.0.1")
+    with pytest.raises(RateLimited):
+        second.check('contact_submit', ip="10.0.0.1")
@@ -0,0 +1,53 @@
+import base64
+import json
+
+import pytest
+
+from iatac import receipt_token
+from iatac.receipt_token import load_receipt_token, sign_receipt_token
+
+SECRET = "receipt_secret"
+DETAILS = {"name": "Asha Rao", "phone": "9820000000", "email": "asha@x.in", "service": "Demo Service",
+           "amount": 5000.0, "payment_id": "pay_1", "receipt_no": "IATAC_1", "date": "01-Jan-2026 10:00:00 AM IST",
+           "method": "upi"}
+
+
+@pytest.fixture(autouse=True)
+def fixed_time(clock, monkeypatch):
+    monkeypatch.setattr(receipt_token, 'time', clock)
+
+
+def test_a_token_gives_back_the_payment_and_date():
+    token = sign_receipt_token(DETAILS, SECRET)
+    assert load_receipt_token(token, SECRET) == ("pay_1", "01-Jan-2026 10:00:00 AM IST")
+
+
+def test_a_token_carries_nothing_about_the_buyer():
+    payload = sign_receipt_token(DETAILS, SECRET).split(".")[0]
+    decoded = base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)).decode()
+    for field in ("name", "phone", "email"):
+        assert DETAILS[field] not in decoded
+
+
+def test_a_token_signed_with_another_secret_is_refused():
+    assert load_receipt_token(sign_receipt_token(DETAILS, "someone_else"), SECRET) is None
+
+
+def test_a_tampered_token_is_refused():
+    payload, signature = sign_receipt_token(DETAILS, SECRET).split(".")
+    body = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    body["p"] = "pay_2"
+    forged = base64.urlsafe_b64encode(json.dumps(body).encode()).rstrip(b"=").decode()
+
+    assert load_receipt_token(f"{forged}.{signature}", SECRET) is None
+    assert load_receipt_token(f"{payload}.{signature[:-2]}", SECRET) is None
+    for garbage in ("", "abc", "a.b.c", f"{payload}.", f".{signature}"):
+        assert load_receipt_token(garbage, SECRET) is None
+
+
+def test_a_token_expires_after_its_ttl(clock):
+    token = sign_receipt_token(DETAILS, SECRET, ttl=900)
+    clock.advance(900)
+    assert load_receipt_token(token, SECRET) is not None
+    clock.advance(1)
+    assert load_receipt_token(token, SECRET) is None
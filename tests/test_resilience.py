@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from iatac import resilience
+from iatac.resilience import CLOSED, HALF_OPEN, OPEN, Guard, Unavailable
+
+
+class Refused(Exception):
+    """An error about the request, not the upstream"""
+
+
+@pytest.fixture
+def guard(clock, monkeypatch):
+    monkeypatch.setattr(resilience, 'time', clock)
+    return Guard('upstream', max_in_flight=1, failures=2, reset_after=30,
+                 is_failure=lambda exc: not isinstance(exc, Refused))
+
+
+def fail(exc=RuntimeError("down")):
+    raise exc
+
+
+def trip(guard):
+    for _ in range(guard.failures):
+        with pytest.raises(RuntimeError):
+            guard.call(fail)
+
+
+def test_the_circuit_opens_after_consecutive_failures(guard):
+    with pytest.raises(RuntimeError):
+        guard.call(fail)
+    assert guard.call(lambda: "ok") == "ok"  # a success resets the count
+    trip(guard)
+    assert guard.state == OPEN
+
+    with pytest.raises(Unavailable) as refused:
+        guard.call(lambda: "not called")
+    assert refused.value.retry_after == 30
+    assert guard.rejected['open'] == 1
+
+
+def test_request_errors_do_not_open_the_circuit(guard):
+    for _ in range(5):
+        with pytest.raises(Refused):
+            guard.call(fail, Refused())
+    assert guard.state == CLOSED
+
+
+def test_a_successful_probe_closes_the_circuit(guard, clock):
+    trip(guard)
+    clock.advance(30)
+    assert guard.state == HALF_OPEN
+
+    assert guard.call(lambda: "ok") == "ok"
+    assert guard.state == CLOSED
+
+
+def test_a_failed_probe_opens_the_circuit_again(guard, clock):
+    trip(guard)
+    clock.advance(30)
+    with pytest.raises(RuntimeError):
+        guard.call(fail)
+    assert guard.state == OPEN
+    clock.advance(29)
+    with pytest.raises(Unavailable):
+        guard.call(lambda: "not called")
+
+
+def test_only_one_probe_at_a_time(guard, clock):
+    guard.max_in_flight = 2
+    trip(guard)
+    clock.advance(30)
+
+    def probe():
+        with pytest.raises(Unavailable):
+            guard.call(lambda: "second probe")
+        return "ok"
+
+    assert guard.call(probe) == "ok"
+    assert guard.state == CLOSED
+
+
+def test_calls_beyond_max_in_flight_are_refused(guard):
+    def nested():
+        with pytest.raises(Unavailable):
+            guard.call(lambda: "not called")
+        return "ok"
+
+    assert guard.call(nested) == "ok"
+    assert guard.rejected['full'] == 1
+    assert guard.call(lambda: "ok") == "ok"  # the slot was given back
+
+
+def test_a_cancelled_call_gives_its_slot_back_and_counts_for_nothing(guard):
+    async def main():
+        task = asyncio.ensure_future(guard.acall(asyncio.sleep, 10))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert guard._in_flight == 0 and guard._failed == 0
+    assert guard.call(lambda: "ok") == "ok"
+
+
+def test_gauges(guard):
+    trip(guard)
+    with pytest.raises(Unavailable):
+        guard.call(lambda: "not called")
+
+    gauges = {(name, tuple(sorted(labels.items()))): value for name, labels, value in guard.gauges()}
+    assert gauges[('circuit_state', (('dependency', 'upstream'), ('state', OPEN)))] == 1
+    assert gauges[('circuit_state', (('dependency', 'upstream'), ('state', CLOSED)))] == 0
+    assert gauges[('dependency_rejected_total', (('dependency', 'upstream'), ('reason', 'open')))] == 1
@@ -0,0 +1,135 @@
+import json
+import os
+
+import pytest
+
+from iatac import sheets as sheets_module
+from iatac.resilience import Guard
+from iatac.sheets import PAYMENT_ID_COLUMN, SheetBatchWriter, fcntl
+
+
+class FakeSession:
+    def __init__(self, guard=None):
+        self.batches = []
+        self.error = None
+        self.guard = guard
+
+    def append_rows(self, rows):
+        if self.error:
+            raise self.error
+        self.batches.append(list(rows))
+
+
+def ledger_row(payment_id):
+    row = [""] * 17
+    row[PAYMENT_ID_COLUMN - 1] = payment_id
+    return row
+
+
+def write_spool(path, *payment_ids):
+    with open(path, 'w') as f:
+        for payment_id in payment_ids:
+            f.write(json.dumps(ledger_row(payment_id)) + "\n")
+
+
+@pytest.fixture
+def spool_path(tmp_path):
+    return str(tmp_path / "sheets_spool.jsonl")
+
+
+def test_rows_are_written_in_one_call_and_the_spool_is_emptied(spool_path):
+    session = FakeSession()
+    writer = SheetBatchWriter(session, max_wait=None, spool_path=spool_path)
+    writer.add(ledger_row("pay_1"))
+    writer.add(ledger_row("pay_2"))
+
+    assert writer.flush() == 2
+    assert [[row[PAYMENT_ID_COLUMN - 1] for row in batch] for batch in session.batches] == [["pay_1", "pay_2"]]
+    assert os.path.getsize(f"{spool_path}.{os.getpid()}") == 0
+    writer.close()
+    assert not os.path.exists(f"{spool_path}.{os.getpid()}")
+
+
+def test_rows_that_failed_to_write_stay_spooled(spool_path):
+    session = FakeSession()
+    session.error = RuntimeError("quota")
+    writer = SheetBatchWriter(session, max_wait=None, spool_path=spool_path)
+    writer.add(ledger_row("pay_1"))
+
+    with pytest.raises(RuntimeError):
+        writer.flush()
+    assert writer.pending() == 1
+    with open(f"{spool_path}.{os.getpid()}") as f:
+        assert [json.loads(line)[PAYMENT_ID_COLUMN - 1] for line in f] == ["pay_1"]
+    writer._spool.close()
+
+
+def test_maybe_flush_waits_out_its_backoff_after_a_failure(spool_path, clock, monkeypatch):
+    monkeypatch.setattr(sheets_module, 'time', clock)
+    session = FakeSession()
+    session.error = RuntimeError("quota")
+    writer = SheetBatchWriter(session, max_wait=None, spool_path=spool_path, backoff=2, max_backoff=3)
+    writer.add(ledger_row("pay_1"))
+
+    assert writer.maybe_flush() == 0
+    session.error = None
+    assert writer.maybe_flush() == 0  # still backing off
+    assert session.batches == []
+
+    clock.advance(2)
+    session.error = RuntimeError("quota")
+    assert writer.maybe_flush() == 0
+    clock.advance(2)
+    session.error = None
+    assert writer.maybe_flush() == 0  # the backoff doubled, up to max_backoff
+    clock.advance(1)
+    assert writer.maybe_flush() == 1
+
+
+def test_maybe_flush_leaves_the_rows_while_the_circuit_is_open(spool_path):
+    guard = Guard('sheets', failures=1)
+    writer = SheetBatchWriter(FakeSession(guard), max_wait=None, spool_path=spool_path)
+    writer.add(ledger_row("pay_1"))
+    with pytest.raises(RuntimeError):
+        guard.call(lambda: (_ for _ in ()).throw(RuntimeError("down")))
+
+    assert writer.maybe_flush() == 0
+    assert writer.pending() == 1
+
+
+def test_the_spool_of_an_exited_worker_is_adopted_once(spool_path):
+    write_spool(f"{spool_path}.999999", "pay_1", "pay_2")
+    session = FakeSession()
+    writer = SheetBatchWriter(session, max_wait=None, spool_path=spool_path)
+
+    assert writer.pending() == 2
+    assert not os.path.exists(f"{spool_path}.999999")
+    writer.close()
+    assert len(session.batches) == 1 and len(session.batches[0]) == 2
+
+    # Nothing is left for the next worker to write again
+    later = FakeSession()
+    SheetBatchWriter(later, max_wait=None, spool_path=spool_path).close()
+    assert later.batches == []
+
+
+@pytest.mark.skipif(fcntl is None, reason="no file locking on this platform")
+def test_the_spool_of_a_live_worker_is_left_alone(spool_path):
+    write_spool(f"{spool_path}.999999", "pay_1")
+    with open(f"{spool_path}.999999") as held:
+        fcntl.flock(held, fcntl.LOCK_EX)
+        writer = SheetBatchWriter(FakeSession(), max_wait=None, spool_path=spool_path)
+        assert writer.pending() == 0
+        writer.close()
+    assert os.path.exists(f"{spool_path}.999999")
+
+
+def test_adopted_rows_count_as_logged(spool_path):
+    write_spool(f"{spool_path}.999999", "pay_1")
+    index = set()
+    writer = SheetBatchWriter(FakeSession(), max_wait=None, spool_path=spool_path, index=index)
+
+    assert "pay_1" in index
+    assert not writer.add(ledger_row("pay_1"))
+    assert writer.pending() == 1
+    writer.close()
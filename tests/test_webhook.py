@@ -0,0 +1,113 @@
+import hashlib
+import hmac
+import json
+import types
+
+import pytest
+import razorpay
+
+from iatac.orders import OrderCache, OrderStore
+from iatac.outbox import Outbox
+from iatac.payments import InvalidSignature, PaymentService, is_site_order
+
+SECRET = "webhook_secret"
+
+SITE_ORDER = {"id": "order_1", "receipt": "IATAC_0001", "amount": 500000,
+              "notes": {"User Name": "Asha", "Mobile": "9820000000", "Email": "asha@x.in", "Service": "Demo Service"}}
+LINK_ORDER = {"id": "order_2", "receipt": "link_42", "amount": 100, "notes": []}
+
+
+class RecordingDispatch:
+    """Keeps what would have run instead of running it"""
+
+    def __init__(self):
+        self.started = []
+
+    def start(self, outbox, handlers, entries):
+        self.started.extend(entries)
+
+    def gauges(self):
+        return ()
+
+
+class FakeOrders:
+    def __init__(self, *orders):
+        self.orders = {order['id']: order for order in orders}
+        self.fetched = []
+
+    def fetch(self, order_id, timeout=None):
+        self.fetched.append(order_id)
+        return self.orders[order_id]
+
+
+@pytest.fixture
+def orders():
+    return FakeOrders(SITE_ORDER, LINK_ORDER)
+
+
+@pytest.fixture
+def payments(tmp_path, orders):
+    client = types.SimpleNamespace(utility=razorpay.Utility(), order=orders)
+    return PaymentService(
+        lambda: client, Outbox(str(tmp_path / "outbox.sqlite3")), RecordingDispatch(),
+        receipts=types.SimpleNamespace(attachable=dict),
+        mailer=types.SimpleNamespace(password="", is_outage=lambda exc: True),
+        sender_email="office@x.in", sheet_writer=None, sheets_creds_file=None,
+        order_cache=OrderCache(), order_store=OrderStore(str(tmp_path / "orders.sqlite3")))
+
+
+def payment(order_id="order_1", payment_id="pay_1"):
+    return {"id": payment_id, "order_id": order_id, "amount": 500000, "method": "upi", "status": "captured"}
+
+
+def event(entity, name="payment.captured"):
+    body = json.dumps({"event": name, "payload": {"payment": {"entity": entity}}})
+    return body, hmac.new(SECRET.encode(), body.encode(), hashlib.sha256).hexdigest()
+
+
+def test_is_site_order():
+    assert is_site_order(SITE_ORDER)
+    assert not is_site_order(LINK_ORDER)
+    assert not is_site_order(dict(SITE_ORDER, receipt="rcpt_1"))
+    assert not is_site_order(dict(SITE_ORDER, notes=dict(SITE_ORDER['notes'], Email="")))
+
+
+def test_a_bad_signature_is_refused(payments):
+    body, _ = event(payment())
+    with pytest.raises(InvalidSignature):
+        payments.accept_webhook(body, "0" * 64, SECRET)
+    assert not payments.outbox.has("pay_1", 'captured_payment')
+
+
+def test_other_events_are_ignored(payments):
+    assert payments.accept_webhook(*event(payment(), "payment.failed"), SECRET) == "Ignored"
+    assert payments.dispatch.started == []
+
+
+def test_orderless_and_foreign_payments_are_ignored(payments):
+    assert payments.accept_webhook(*event(payment(order_id=None)), SECRET) == "Ignored"
+    assert payments.accept_webhook(*event(payment("order_2", "pay_2")), SECRET) == "Ignored"
+    assert not payments.outbox.has("pay_1", 'captured_payment')
+    assert not payments.outbox.has("pay_2", 'captured_payment')
+    assert payments.dispatch.started == []
+
+
+def test_a_captured_payment_is_recorded_then_processed(payments, orders):
+    assert payments.accept_webhook(*event(payment()), SECRET) == "Accepted"
+    assert payments.dispatch.started == [("pay_1", 'captured_payment')]
+    assert payments.order_store.is_paid("order_1")
+
+    payments.process_captured_payment(payment())
+    for kind in ('manager_email', 'customer_email', 'sheet_row'):
+        assert payments.outbox.has("pay_1", kind)
+    assert payments.outbox.claim("pay_1", 'customer_email')['to'] == "asha@x.in"
+    assert orders.fetched == ["order_1"]  # once, then from the order store
+
+
+def test_a_payment_verify_payment_already_recorded_is_not_recorded_again(payments, orders):
+    payments.outbox.put("pay_1", {'sheet_row': {"order_id": "order_1"}})
+
+    payments.process_captured_payment(payment())
+    assert not payments.outbox.has("pay_1", 'manager_email')
+    assert payments.dispatch.started == []
+    assert orders.fetched == []